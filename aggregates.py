@@ -0,0 +1,244 @@
+"""
+Running aggregates for the stats pages.
+
+Every numeric column of the stats tables keeps a running count, mean and
+variance (Welford's method, which also supports removing a value) and a
+sorted list of its values for min, max, median and percentiles. Like the
+leaderboards, the aggregates catch up with the change log before answering
+and re-read only the players/teams written since their last sync: each
+changed row's old values are removed and its new values added. A stat is then
+O(1) (mean, std_dev, min, max) or a couple of list lookups (median,
+percentiles) instead of a table scan.
+
+Floating-point error from long runs of removals is bounded but not zero, so
+the state can be checked against a fresh scan and rebuilt (from the
+repository root, with the app's configuration):
+    flask --app app check-aggregates [--replay]
+    flask --app app rebuild-aggregates
+"""
+
+import math
+from bisect import bisect_left, insort
+
+import click
+
+import changes
+import db
+import derived
+import paging
+
+# Stat names and the percentile each order statistic reads
+PERCENTILES = {'median': 50, 'p25': 25, 'p75': 75, 'p90': 90}
+
+# Numeric columns of the stats tables: table -> (kind, columns, count non-numeric values as 0)
+STAT_TABLES = {
+    'possession_percentage_team': ('teams', ['Possession_Percentage', 'Matches'], False),
+    'team_goals_per_match': ('teams', ['Goals_Per_Match', 'Total_Goals_Scored', 'Matches'], False),
+    'team_ratings': ('teams', ['FotMob_Team_Rating', 'Matches'], False),
+    'total_red_card_team': ('teams', ['Red_Cards', 'Yellow_Cards', 'Matches'], False),
+    'player_expected_goals': ('players', ['Expected_Goals', 'Goals', 'Minutes', 'Matches'], True),
+    'player_ratings': ('players', ['FotMob_Rating', 'Player_Match_Awards', 'Minutes', 'Matches'], True),
+    'player_tackles_won': ('players', ['Tackles_per_90', 'Tackle_Success_Rate', 'Minutes', 'Matches'], True),
+    'player_top_scorers': ('players', ['Goals', 'Penalties', 'Minutes', 'Matches'], True),
+    # Ratios with a zero denominator are NULL and left out, not counted as 0
+    derived.TEAM_VIEW: ('teams', [column for column, _ in derived.TEAM_METRICS], False),
+    derived.PLAYER_VIEW: ('players', [column for column, _ in derived.PLAYER_METRICS] + ['Minutes', 'Matches'], False),
+}
+
+
+def number(value, null_as_zero=False):
+    """ A cell as a float; None for missing, non-numeric or non-finite values such as 'nan' (or 0.0 with null_as_zero). """
+    try:
+        result = float(value)
+    except (TypeError, ValueError, OverflowError):
+        result = math.nan
+    if math.isfinite(result):
+        return result
+    return 0.0 if null_as_zero else None
+
+
+def _display(value):
+    # Whole-number min/max show as integers, the way they are stored
+    return int(value) if value.is_integer() else value
+
+
+class RunningColumn:
+    """ Count, mean and variance (Welford) plus a sorted list of the values of one column. """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.sorted = []
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        insort(self.sorted, x)
+
+    def remove(self, x):
+        self.sorted.pop(bisect_left(self.sorted, x))
+        self.count -= 1
+        if self.count == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+
+    def percentile(self, q):
+        """ Linearly interpolated percentile, the same as NumPy's default. """
+        position = (self.count - 1) * q / 100
+        low = math.floor(position)
+        high = min(low + 1, self.count - 1)
+        return self.sorted[low] + (position - low) * (self.sorted[high] - self.sorted[low])
+
+    def stat(self, name):
+        """ Value of one statistic, NaN for an empty column and None for unknown stats. """
+        if name not in ('mean', 'min', 'max', 'std_dev') and name not in PERCENTILES:
+            return None
+        if not self.count:
+            return math.nan
+        if name == 'mean':
+            return self.mean
+        if name == 'min':
+            return _display(self.sorted[0])
+        if name == 'max':
+            return _display(self.sorted[-1])
+        if name == 'std_dev':
+            return math.sqrt(self.m2 / self.count)
+        return self.percentile(PERCENTILES[name])
+
+
+class TableAggregates(changes.ChangeFollower):
+    """ RunningColumn of every numeric column of one table, kept in sync with the change log. """
+
+    def __init__(self, table, kind, columns, null_as_zero):
+        super().__init__([table])
+        self.table = table
+        self.kind = kind  # 'players' or 'teams', the stats page the table belongs to
+        self.columns = columns
+        self.null_as_zero = null_as_zero
+        self.key = paging.KEY_COLUMNS[table]
+        self.query = f"SELECT {self.key}, {', '.join(columns)} FROM {table}"
+
+        self._rows = {}  # key -> tuple of converted values
+        self._columns = {}
+
+    def count(self, conn):
+        """ Number of rows in the table. """
+        with self._lock:
+            self._sync(conn)
+            return len(self._rows)
+
+    def stat(self, conn, name):
+        """ {column: value} of one statistic, or None for unknown stats. """
+        with self._lock:
+            self._sync(conn)
+            values = {column: self._columns[column].stat(name) for column in self.columns}
+        return None if None in values.values() else values
+
+    def stats(self, conn, names, columns=None):
+        """
+        {stat: {column: value}} of several statistics over some columns (all by default) after one sync.
+        'count' is the number of values of a column; other stats are NaN for an empty column.
+        """
+        with self._lock:
+            self._sync(conn)
+            return {name: {column: self._columns[column].count if name == 'count' else self._columns[column].stat(name)
+                           for column in columns or self.columns}
+                    for name in names}
+
+    def values(self, conn, *names):
+        """ Current values of the given columns, one list per column with one value per row. """
+        with self._lock:
+            self._sync(conn)
+            indexes = [self.columns.index(name) for name in names]
+            return [[row[i] for row in self._rows.values()] for i in indexes]
+
+    def _add(self, key, row):
+        values = tuple(number(value, self.null_as_zero) for value in row[1:])
+        self._rows[key] = values
+        for column, value in zip(self.columns, values):
+            if value is not None:
+                self._columns[column].add(value)
+
+    def _rebuild(self, conn):
+        self._rows = {}
+        self._columns = {column: RunningColumn() for column in self.columns}
+        for row in conn.execute(self.query):
+            self._add(row[0], row)
+
+    def _refresh(self, conn, key):
+        """ Take the row's old values out and put its current values (if it still exists) in. """
+        old = self._rows.pop(key, None)
+        if old is not None:
+            for column, value in zip(self.columns, old):
+                if value is not None:
+                    self._columns[column].remove(value)
+
+        row = conn.execute(f"{self.query} WHERE {self.key} = ?", (key,)).fetchone()
+        if row is not None:
+            self._add(key, row)
+
+    def replay(self, conn):
+        """ Remove and re-add every row through the incremental path, as if each had just been written. """
+        with self._lock:
+            self._sync(conn)
+            for key in list(self._rows):
+                self._refresh(conn, key)
+
+    def check(self, conn, rel_tol=1e-9, abs_tol=1e-9):
+        """ Compare every statistic with a fresh scan of the table. Returns a list of mismatch messages. """
+        import stats  # NumPy, only needed for the check
+
+        summary = stats.load_table(conn, self.table, self.columns, null_as_zero=self.null_as_zero)
+        if summary is None:
+            count = self.count(conn)
+            return [f"{self.table}: running count {count}, scan 0"] if count else []
+
+        mismatches = []
+        if self.count(conn) != summary.count:
+            mismatches.append(f"{self.table}: running count {self.count(conn)}, scan {summary.count}")
+        for name in stats.STATS:
+            expected = summary.stat(name)
+            actual = self.stat(conn, name)
+            for column in expected:
+                a, e = float(actual[column]), float(expected[column])
+                if not (math.isclose(a, e, rel_tol=rel_tol, abs_tol=abs_tol) or (math.isnan(a) and math.isnan(e))):
+                    mismatches.append(f"{self.table}.{column} {name}: running {a!r}, scan {e!r}")
+        return mismatches
+
+
+def create_store():
+    """ Aggregates of every stats table, by table name. """
+    return {table: TableAggregates(table, kind, columns, null_as_zero)
+            for table, (kind, columns, null_as_zero) in STAT_TABLES.items()}
+
+
+def init_app(app):
+    app.extensions['aggregates'] = create_store()
+
+    @app.cli.command('rebuild-aggregates')
+    def rebuild_aggregates():
+        """ Rebuild the running aggregates from the tables. """
+        for aggregates in app.extensions['aggregates'].values():
+            aggregates.rebuild(db.get_db())
+        print(f"Rebuilt aggregates of {len(app.extensions['aggregates'])} tables")
+
+    @app.cli.command('check-aggregates')
+    @click.option('--replay', is_flag=True, help='Remove and re-add every row incrementally before checking')
+    def check_aggregates(replay):
+        """ Compare the running aggregates with a fresh scan of every table. """
+        mismatches = []
+        for aggregates in app.extensions['aggregates'].values():
+            if replay:
+                aggregates.replay(db.get_db())
+            mismatches.extend(aggregates.check(db.get_db()))
+        for message in mismatches:
+            print(message)
+        print(f"{len(mismatches)} mismatches")
+        if mismatches:
+            raise SystemExit(1)
@@ -5,122 +5,242 @@ Fall 2024
 Ian Cox & Owen Donohoe
 """
 
-from flask import Flask, render_template, request, redirect, url_for
-import sqlite3
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
+from flask import Flask, render_template, request, redirect, url_for, abort, make_response, Response, stream_with_context, jsonify, g
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import lru_cache
 import io
-import base64
-import numpy as np
+import json
+import sqlite3
+
+from werkzeug.http import is_resource_modified
+
+import aggregates
+import assets
+import charts
+import db
+import derived
+import filters
+import ingest
+import leaderboards
+import metrics
+import migrations
+import mutations
+import page_cache
+import paging
+import plot_cache
+import render_pool
+import profiles
+import replica
+import search
+import seasons
+import stats_api
+import writer
+from db import get_db, get_read_db
 
 app = Flask(__name__)
 
 app.config.from_object('config.Config')
 
-# Function to connect to the database
-def get_db():
-    conn = sqlite3.connect('Bundesliga.db', timeout=20)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Request, SQL, template and plot timings, served on /metrics
+if app.config.get('METRICS_ENABLED', True):
+    metrics.init_app(app)
 
-# Helper function to calculate median
-def calculate_median(data):
-    return np.median(data)
+# Pooled connections, returned to the pool when each request's app context ends
+db.init_app(app)
 
-def generate_plot(stats_dict, selected_stat):
-    """
-    Generate a plot for the selected statistic (mean, min, max, etc.) for either player stats or team stats.
-    """
-    fig, ax = plt.subplots(figsize=(8, 6))
-    
-    # Create the plot for the selected statistic
-    for stat, values in stats_dict.items():
-        if selected_stat == 'mean':
-            stat_value = np.mean(values)
-        elif selected_stat == 'min':
-            stat_value = np.min(values)
-        elif selected_stat == 'max':
-            stat_value = np.max(values)
-        elif selected_stat == 'median':
-            stat_value = np.median(values)
-        elif selected_stat == 'std_dev':
-            stat_value = np.std(values)
-        
-        ax.bar(stat, stat_value, label=f"{stat} ({selected_stat})")
+# Archived seasons, each read from its own immutable database file
+seasons.init_app(app)
 
-    ax.set_title(f'Visualization - {selected_stat.capitalize()} Values')
-    ax.set_ylabel(f'{selected_stat.capitalize()} Value')
-    ax.legend()
+# Bring the schema (keys, indexes) up to date before serving requests
+if app.config.get('AUTO_MIGRATE', True):
+    with app.app_context():
+        migrations.migrate(get_db())
 
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode('utf8')
-    
-    return f"data:image/png;base64,{plot_url}"
+# Mutations are applied by one writer thread in group commits
+writer.init_app(app)
 
-def generate_scatter_plot(minutes, goals):
-    """
-    Generate a scatter plot for Minutes Played vs Goals Scored.
-    """
-    fig, ax = plt.subplots(figsize=(8, 6))
+# Optional in-memory copy of the database for the read-only routes
+replica.init_app(app)
+
+# Rendered plots, served from /plots/<digest>.<format> and drawn by a pool of worker processes
+plot_cache.init_app(app)
+render_pool.init_app(app)
+charts.init_app(app)
+
+# Fingerprinted static files with long-lived caching, and compressed responses
+assets.init_app(app)
 
-    ax.scatter(minutes, goals, color='blue', label='Minutes vs Goals', alpha=0.7)
-    ax.set_title('Minutes Played vs Goals Scored')
-    ax.set_xlabel('Minutes Played')
-    ax.set_ylabel('Goals Scored')
-    ax.legend()
+# Rendered data pages, reused until one of their tables is written
+page_cache.init_app(app)
 
-    img = io.BytesIO()
-    plt.savefig(img, format='png')
-    img.seek(0)
-    plot_url = base64.b64encode(img.getvalue()).decode('utf8')
+# Top-N rankings kept in memory and refreshed from the change log
+leaderboards.init_app(app)
+aggregates.init_app(app)
+derived.init_app(app)
 
-    return f"data:image/png;base64,{plot_url}"
+# Endpoints that write, refused for archived seasons
+WRITE_ENDPOINTS = {'add_team', 'remove_team', 'add_player', 'remove_player', 'modify_teams', 'edit_team', 'import_data'}
+
+@app.before_request
+def select_season():
+    """ Pick the season a request reads from ?season= or a season form field, the current season by default. """
+    registry = app.extensions['seasons']
+    season = request.values.get('season') or registry.current
+    try:
+        # get_read_db() reads an archived season through its pool
+        g.archive = registry.pool(season) if registry.is_archived(season) else None
+    except seasons.SeasonError as e:
+        return str(e), 404
+    g.season = season
+    if g.archive is not None and request.endpoint in WRITE_ENDPOINTS:
+        return f"Season {season} is archived and read-only.", 403
+
+@app.context_processor
+def season_context():
+    registry = app.extensions['seasons']
+    season = g.get('season', registry.current)
+    # season_arg is None for the current season, so url_for() leaves it out of links
+    return {'seasons': registry.names(), 'season': season, 'season_arg': None if season == registry.current else season}
+
+def season_state(name, factory):
+    """ app.extensions[name] (e.g. the aggregates) for the current season, or the selected archive's own (see seasons.py). """
+    return app.extensions['seasons'].extension(app, g.season, name, factory)
+
+def cached_plot_url(kind, table, stat, *args):
+    """
+    URL of a cached plot ('stat' or 'scatter'). If this table version has not been plotted yet, the chart
+    backend's render_<kind>_plot(*args) is queued on the render pool (or run inline, for backends that are
+    cheap enough) and the image is fetched from the URL once it is done. Returns None when the render queue is full.
+    """
+    chart = charts.backend(app.config['CHART_BACKEND'])
+    render = getattr(chart, f"render_{kind}_plot")
+    version = db.table_version(get_read_db(), table)
+    pool = app.extensions['render_pool']
+    # Every season has its own table versions
+    cached_table = table if g.archive is None else f"{g.season}/{table}"
+    try:
+        digest = app.extensions['plot_cache'].get_or_submit(
+            f"{kind}.{chart.FORMAT}", cached_table, stat, version, lambda: pool.submit(render, *args, inline=chart.INLINE))
+    except render_pool.RenderQueueFull as e:
+        app.logger.warning(f"Skipping plot: {e}")
+        return None
+    return url_for('plot_image', digest=digest, fmt=chart.FORMAT)
+
+@lru_cache(maxsize=None)
+def template_digest(template):
+    """ Digest of a template's source, so ETags change when the template does. """
+    source = app.jinja_loader.get_source(app.jinja_env, template)[0]
+    return page_cache.PageCache.etag(source)
+
+def cached_page(template, tables, page, render, salt=None, mimetype='text/html'):
+    """
+    Response for a data page that depends only on tables and page (e.g. a keyset cursor), reusing
+    the rendered HTML until one of the tables is written. A GET whose ETag or Last-Modified still
+    matches gets a 304 without any query or rendering. render(conn) must return the page's HTML.
+    Bodies that are not rendered from a template (e.g. JSON) pass their own salt and mimetype.
+    """
+    cache = app.extensions['page_cache']
+    if salt is None:
+        salt = template_digest(template)
+    if g.archive is None:
+        versions, modified = app.extensions['table_versions'].get(tables)
+    else:
+        versions, modified = (), g.archive.modified  # Archives never change
+    key = (template, tuple(tables), page, g.season, versions)
+    etag = cache.etag(key, salt)
+
+    if request.method == 'GET' and not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        metrics.REGISTRY.inc('page_cache_requests_total', (('outcome', 'not_modified'),))
+        response = Response(status=304)
+    else:
+        html = cache.get(key)
+        metrics.REGISTRY.inc('page_cache_requests_total', (('outcome', 'miss' if html is None else 'hit'),))
+        if html is None:
+            conn = get_read_db()
+            if g.archive is None:
+                # Store under the versions this connection reads, which may lag behind (e.g. a replica)
+                key = (template, tuple(tables), page, g.season, db.table_versions(conn, tables))
+                etag = cache.etag(key, salt)
+            html = render(conn)
+            cache.put(key, html)
+        response = make_response(html)
+        response.mimetype = mimetype
+
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    # Browsers may keep the page but must revalidate it, so writes show up immediately
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/plots/<digest>.<fmt>')
+def plot_image(digest, fmt):
+    """ Serve a cached plot, waiting for it if it is still rendering. Digests change with the data, so the image never goes stale. """
+    mimetype = charts.MIMETYPES.get(fmt)
+    if mimetype is None:
+        abort(404)
+    try:
+        image = app.extensions['plot_cache'].wait(digest, timeout=app.extensions['render_pool'].timeout)
+    except FutureTimeoutError:
+        response = make_response("Plot is still rendering.", 503)
+        response.headers['Retry-After'] = '1'
+        return response
+
+    # The extension must match the format the plot was rendered in, e.g. after CHART_BACKEND changed
+    if image is None or charts.image_format(image) != fmt:
+        abort(404)
+
+    response = make_response(image)
+    response.mimetype = mimetype
+    response.set_etag(digest)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config.get('PLOT_MAX_AGE', 31536000)
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def page_size():
+    """ Rows per page for the data tables, from ?page_size= within the configured limit. """
+    size = request.args.get('page_size', type=int) or app.config.get('PAGE_SIZE', 50)
+    return max(1, min(size, app.config.get('MAX_PAGE_SIZE', 500)))
+
 @app.route('/players_data', methods=['GET', 'POST'])
 def players_data():
-    """ Display all data from the selected player table. """
+    """ Display one page of data from the selected player table. """
     selected_table = None
     result = None
     rows = None
     columns = None
+    next_after = None
+    prev_before = None
 
     # List of player-related tables
-    player_tables = ['player_expected_goals', 'player_ratings', 'player_tackles_won', 'player_top_scorers']
+    player_tables = ['player_expected_goals', 'player_ratings', 'player_tackles_won', 'player_top_scorers', derived.PLAYER_VIEW]
 
-    if request.method == 'POST':
-        selected_table = request.form['table']
+    # The form posts the table, the pager links pass it with the keyset cursor in the query string
+    selected_table = request.values.get('table')
 
+    if selected_table:
         if selected_table not in player_tables:
             result = {"error": "Invalid table selected."}
             return render_template('players_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, player_tables=player_tables)
 
-        # SQL query to fetch all data from the selected table
-        query = f"SELECT * FROM {selected_table}"
-
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()  # Fetch all rows
+            after, before, size = request.args.get('after'), request.args.get('before'), page_size()
 
-            # Fetch column names
-            columns = [description[0] for description in cursor.description]
+            def render(conn):
+                columns, rows, next_after, prev_before = paging.keyset_page(conn, selected_table, size, after=after, before=before)
 
-            conn.close()
+                if not rows:
+                    result = {"error": "No data found in the selected table."}
+                    return render_template('players_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, player_tables=player_tables)
 
-            if not rows:
-                result = {"error": "No data found in the selected table."}
-                return render_template('players_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, player_tables=player_tables)
+                return render_template('players_data.html', rows=rows, columns=columns, selected_table=selected_table, player_tables=player_tables, next_after=next_after, prev_before=prev_before)
 
-            return render_template('players_data.html', rows=rows, columns=columns, selected_table=selected_table, player_tables=player_tables)
+            return cached_page('players_data.html', [selected_table], (after, before, size), render)
 
         except sqlite3.Error as e:
             result = {"error": f"An error occurred: {e}"}
@@ -131,39 +251,37 @@ def players_data():
 
 @app.route('/teams_data', methods=['GET', 'POST'])
 def teams_data():
-    """ Display all data from the selected team table. """
+    """ Display one page of data from the selected team table. """
     selected_table = None
     result = None
     rows = None
     columns = None
+    next_after = None
+    prev_before = None
 
     # List of team-related tables
-    team_tables = ['possession_percentage_team', 'team_goals_per_match', 'team_ratings', 'total_red_card_team']
+    team_tables = ['possession_percentage_team', 'team_goals_per_match', 'team_ratings', 'total_red_card_team', derived.TEAM_VIEW]
 
-    if request.method == 'POST':
-        selected_table = request.form['table']
+    selected_table = request.values.get('table')
 
+    if selected_table:
         if selected_table not in team_tables:
             result = {"error": "Invalid table selected."}
             return render_template('teams_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, team_tables=team_tables)
 
-        query = f"SELECT * FROM {selected_table}"
-
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            after, before, size = request.args.get('after'), request.args.get('before'), page_size()
 
-            columns = [description[0] for description in cursor.description]
+            def render(conn):
+                columns, rows, next_after, prev_before = paging.keyset_page(conn, selected_table, size, after=after, before=before)
 
-            conn.close()
+                if not rows:
+                    result = {"error": "No data found in the selected table."}
+                    return render_template('teams_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, team_tables=team_tables)
 
-            if not rows:
-                result = {"error": "No data found in the selected table."}
-                return render_template('teams_data.html', result=result, rows=rows, columns=columns, selected_table=selected_table, team_tables=team_tables)
+                return render_template('teams_data.html', rows=rows, columns=columns, selected_table=selected_table, team_tables=team_tables, next_after=next_after, prev_before=prev_before)
 
-            return render_template('teams_data.html', rows=rows, columns=columns, selected_table=selected_table, team_tables=team_tables)
+            return cached_page('teams_data.html', [selected_table], (after, before, size), render)
 
         except sqlite3.Error as e:
             result = {"error": f"An error occurred: {e}"}
@@ -171,6 +289,29 @@ def teams_data():
 
     return render_template('teams_data.html', team_tables=team_tables, rows=rows, columns=columns, selected_table=selected_table)
 
+@app.route('/export/<table>.<fmt>')
+def export_table(table, fmt):
+    """ Stream a whole table as CSV or NDJSON without loading it into memory. """
+    if table not in paging.KEY_COLUMNS or fmt not in paging.EXPORT_FORMATS:
+        abort(404)
+
+    rows = paging.stream_table(get_read_db(), table, fmt)
+    filename = table if g.archive is None else f"{table}-{g.season}"
+    return Response(
+        stream_with_context(rows),
+        mimetype=paging.EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'},
+    )
+
+def table_stat(conn, stores, table, stat):
+    """ {column: value} of one statistic over a stats table, through the /api/stats batch path, or None for unknown stats. """
+    try:
+        requests = stats_api.parse({'requests': [{'table': table, 'stats': [stat]}]})
+    except stats_api.StatsError:
+        return None
+    result = stats_api.run(conn, stores, requests)['results'][0]
+    return dict(zip(result['columns'], result['stats'][stat]))
+
 @app.route('/team_stats', methods=['GET', 'POST'])
 def team_stats():
     selected_table = None
@@ -178,56 +319,30 @@ def team_stats():
     result = None
     plot_url = None
 
-    table_columns = {
-        'possession_percentage_team': ['Team', 'Possession_Percentage', 'Matches'],
-        'team_goals_per_match': ['Team', 'Goals_Per_Match', 'Total_Goals_Scored', 'Matches'],
-        'team_ratings': ['Team', 'FotMob_Team_Rating', 'Matches'],
-        'total_red_card_team': ['Team', 'Red_Cards', 'Yellow_Cards', 'Matches']
-    }
-
     if request.method == 'POST':
         selected_table = request.form['table']
         selected_stat = request.form['stat']
 
-        if selected_table not in table_columns:
+        stores = season_state('aggregates', aggregates.create_store)
+        store = stores.get(selected_table)
+        if store is None or store.kind != 'teams':
             result = {"error": "Invalid table selected."}
             return render_template('team_stats.html', result=result, selected_stat=selected_stat, selected_table=selected_table)
 
-        columns = table_columns[selected_table]
-        table_name = selected_table
-
-        query = f"SELECT {', '.join(columns)} FROM {table_name}"
-
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(query)
-            teams = cursor.fetchall()
-            conn.close()
-
-            if not teams:
+            conn = get_read_db()
+            # Running aggregates, brought up to date with any writes since the last request
+            if not store.count(conn):
                 result = {"error": "No data found for the selected table."}
                 return render_template('team_stats.html', result=result, selected_stat=selected_stat, selected_table=selected_table)
 
-            stats_dict = {col: [team[col] for team in teams] for col in columns[1:]}
+            result = table_stat(conn, stores, selected_table, selected_stat)
 
-            # Calculate required stat based on the selected option
-            if selected_stat == 'mean':
-                result = {key: np.mean(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'min':
-                result = {key: np.min(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'max':
-                result = {key: np.max(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'median':
-                result = {key: np.median(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'std_dev':
-                result = {key: np.std(values) for key, values in stats_dict.items()}
-
-            plot_url = generate_plot(stats_dict, selected_stat)
+            if result is not None:
+                plot_url = cached_plot_url('stat', selected_table, selected_stat, result, selected_stat)
 
         except sqlite3.OperationalError as e:
-            print(f"SQL Error: {e}")
-            print(f"Query attempted: {query}")
+            app.logger.error(f"SQL error in team_stats: {e}")
             result = {"error": f"An error occurred while querying the database: {e}"}
 
     return render_template('team_stats.html', result=result, selected_stat=selected_stat, selected_table=selected_table, plot_url=plot_url)
@@ -241,71 +356,32 @@ def player_stats():
     plot_urls = {'stat_plot': None, 'scatter_plot': None}
     scatter_plot_url = None
 
-    table_columns = {
-        'player_expected_goals': ['Player', 'Team', 'Expected_Goals', 'Goals', 'Minutes', 'Matches', 'Country'],
-        'player_ratings': ['Player', 'Team', 'FotMob_Rating', 'Player_Match_Awards', 'Minutes', 'Matches', 'Country'],
-        'player_tackles_won': ['Player', 'Team', 'Tackles_per_90', 'Tackle_Success_Rate', 'Minutes', 'Matches', 'Country'],
-        'player_top_scorers': ['Player', 'Team', 'Goals', 'Penalties', 'Minutes', 'Matches', 'Country']
-    }
-
     if request.method == 'POST':
         selected_table = request.form['table']
         selected_stat = request.form['stat']
 
-        if selected_table not in table_columns:
+        stores = season_state('aggregates', aggregates.create_store)
+        store = stores.get(selected_table)
+        if store is None or store.kind != 'players':
             result = {"error": "Invalid table selected."}
             return render_template('player_stats.html', result=result, selected_stat=selected_stat, selected_table=selected_table)
 
-        columns = table_columns[selected_table]
-        table_name = selected_table
-
-        query = f"SELECT {', '.join(columns)} FROM {table_name}"
-        
         try:
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(query)
-            players = cursor.fetchall()
-            conn.close()
-
-            if not players:
+            conn = get_read_db()
+            if not store.count(conn):
                 result = {"error": "No data found for the selected table."}
                 return render_template('player_stats.html', result=result, selected_stat=selected_stat, selected_table=selected_table)
 
-            stats_dict = {}
-
-            numeric_columns = columns[2:-1]  # Exclude first ('Player', 'Team') and last ('Country') columns
-
-            for col in numeric_columns:
-                values = []
-                for player in players:
-                    value = player[columns.index(col)]  # Get the value for this column
-                    if isinstance(value, (int, float)):  # Check if the value is already numeric
-                        values.append(value)
-                    else:
-                        try:
-                            # Convert to float
-                            values.append(float(value))
-                        except (ValueError, TypeError):
-                            values.append(0)
-                stats_dict[col] = values
-
-            if selected_stat == 'mean':
-                result = {key: np.mean(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'min':
-                result = {key: np.min(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'max':
-                result = {key: np.max(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'median':
-                result = {key: np.median(values) for key, values in stats_dict.items()}
-            elif selected_stat == 'std_dev':
-                result = {key: np.std(values) for key, values in stats_dict.items()}
-
-            plot_urls['stat_plot'] = generate_plot(stats_dict, selected_stat)
+            # Non-numeric values count as 0, as the player forms have always treated them
+            result = table_stat(conn, stores, selected_table, selected_stat)
+
+            if result is not None:
+                plot_urls['stat_plot'] = cached_plot_url('stat', selected_table, selected_stat, result, selected_stat)
 
             # Generate the scatter plot
-            if 'Minutes' in stats_dict and 'Goals' in stats_dict:
-                scatter_plot_url = generate_scatter_plot(stats_dict['Minutes'], stats_dict['Goals'])
+            if 'Minutes' in store.columns and 'Goals' in store.columns:
+                minutes, goals = store.values(conn, 'Minutes', 'Goals')
+                scatter_plot_url = cached_plot_url('scatter', selected_table, None, minutes, goals)
                 plot_urls['scatter_plot'] = scatter_plot_url
 
         except sqlite3.OperationalError as e:
@@ -326,34 +402,18 @@ def add_team():
         red_cards = request.form['red_cards']
         yellow_cards = request.form['yellow_cards']
 
-        with get_db() as conn:
-            cursor = conn.cursor()
-
-            # Insert into team_ratings table
-            cursor.execute('''
-                INSERT INTO team_ratings (Team, "FotMob_Team_Rating", Matches) 
-                VALUES (?, ?, ?)
-            ''', (team_name, fotmob_rating, matches))
-
-            # Insert into team_goals_per_match table
-            cursor.execute('''
-                INSERT INTO team_goals_per_match (Team, "Goals_per_Match", "Total_Goals_Scored", Matches) 
-                VALUES (?, ?, ?, ?)
-            ''', (team_name, goals_per_match, total_goals_scored, matches))
-
-            # Insert into possession_percentage_team table
-            cursor.execute('''
-                INSERT INTO possession_percentage_team (Team, Possession_Percentage, Matches) 
-                VALUES (?, ?, ?)
-            ''', (team_name, possession, matches))
-
-            # Insert into total_red_card_team table
-            cursor.execute('''
-                INSERT INTO total_red_card_team (Team, Red_Cards, Yellow_Cards, Matches) 
-                VALUES (?, ?, ?, ?)
-            ''', (team_name, red_cards, yellow_cards, matches))
-
-            conn.commit()
+        try:
+            # The four inserts are applied together by the writer thread
+            app.extensions['writer'].submit_and_wait(
+                mutations.add_team, team_name, fotmob_rating, matches, goals_per_match,
+                total_goals_scored, possession, red_cards, yellow_cards)
+        except sqlite3.IntegrityError:
+            return "A team with that name already exists.", 400
+        except ValueError as e:
+            return f"Invalid team: {e}", 400
+        except (sqlite3.Error, FutureTimeoutError) as e:
+            app.logger.error(f"Database error occurred: {e!r}")
+            return "An error occurred while adding the team.", 500
 
         return redirect(url_for('index'))
 
@@ -362,71 +422,63 @@ def add_team():
 @app.route('/remove_team', methods=['GET', 'POST'])
 def remove_team():
     """ Route to remove a team. """
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT Team, FotMob_Team_Rating, Matches FROM team_ratings")
-    teams = cursor.fetchall()
-
-    teams = [{'Team': team['Team'], 'FotMob_Team_Rating': team['FotMob_Team_Rating'], 'Matches': team['Matches']} for team in teams]
-
-    print(f"Teams fetched: {teams}")
+    if request.method == 'POST':
+        team_name = request.form['team_name']
 
-    if not teams:
-        return "No teams available to remove."
+        try:
+            app.extensions['writer'].submit_and_wait(mutations.remove_team, team_name)
+        except Exception as e:
+            # Nothing was written: the job failed, or the writer did not get to it in time
+            app.logger.error(f"Error occurred while removing team: {e}")
 
-    cursor.execute("SELECT Team, Possession_Percentage FROM possession_percentage_team")
-    possession_data = cursor.fetchall()
+        return redirect(url_for('remove_team'))
 
-    cursor.execute("SELECT Team, Goals_per_Match, Total_Goals_Scored FROM team_goals_per_match")
-    goals_data = cursor.fetchall()
+    def render(conn):
+        # One joined query returns each team with its data from the other tables
+        team_info = profiles.team_profiles(conn)
 
-    cursor.execute("SELECT Team, Red_Cards, Yellow_Cards FROM total_red_card_team")
-    red_cards_data = cursor.fetchall()
+        if not team_info:
+            return "No teams available to remove."
 
-    conn.close()
+        return render_template('remove_team.html', team_info=team_info)
 
-    team_info = []
-    for team in teams:
-        team_name = team['Team']
-        fotmob_rating = team['FotMob_Team_Rating']
-        matches = team['Matches']
+    return cached_page('remove_team.html', migrations.TEAM_TABLES, None, render)
 
-        # Get data from other tables for the same team
-        possession = next((x[1] for x in possession_data if x[0] == team_name), None)
-        goals_per_match, total_goals = next((x[1], x[2]) for x in goals_data if x[0] == team_name)
-        
-        # Handle the case where red cards and yellow cards data might be missing
-        red_card_data = next((x[1:] for x in red_cards_data if x[0] == team_name), (None, None))
-        red_cards, yellow_cards = red_card_data
-
-        team_info.append({
-            'Team': team_name,
-            'FotMob_Team_Rating': fotmob_rating,
-            'Matches': matches,
-            'Possession_Percentage': possession,
-            'Goals_per_Match': goals_per_match,
-            'Total_Goals_Scored': total_goals,
-            'Red_Cards': red_cards,
-            'Yellow_Cards': yellow_cards
-        })
+@app.route('/import/<kind>', methods=['POST'])
+def import_data(kind):
+    """ Bulk import players or teams from an uploaded CSV/NDJSON file (or the raw request body). Returns a JSON report. """
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format')
+    if fmt is None:
+        is_ndjson = filename.endswith(('.ndjson', '.jsonl')) or request.mimetype == 'application/x-ndjson'
+        fmt = 'ndjson' if is_ndjson else 'csv'
 
-    if request.method == 'POST':
-        team_name = request.form['team_name']
-        conn = get_db()
-        cursor = conn.cursor()
-
-        cursor.execute("DELETE FROM team_ratings WHERE Team = ?", (team_name,))
-        cursor.execute("DELETE FROM possession_percentage_team WHERE Team = ?", (team_name,))
-        cursor.execute("DELETE FROM team_goals_per_match WHERE Team = ?", (team_name,))
-        cursor.execute("DELETE FROM total_red_card_team WHERE Team = ?", (team_name,))
-
-        conn.commit()
-        conn.close()
-
-        return redirect(url_for('remove_team'))
+    # Read here, so the writer thread does not depend on the request still being open
+    try:
+        text = (upload.read() if upload else request.get_data()).decode('utf-8')
+    except UnicodeDecodeError as e:
+        return jsonify(error=f"Input is not UTF-8: {e}"), 400
 
-    return render_template('remove_team.html', team_info=team_info)
+    try:
+        # Applied by the writer thread like every other mutation, in one savepoint
+        future = app.extensions['writer'].submit(
+            ingest.load, io.StringIO(text, newline=''), kind, fmt, request.args.get('mode', 'upsert'),
+            app.config.get('INGEST_BATCH_SIZE', 1000))
+        report = future.result(timeout=app.config.get('IMPORT_TIMEOUT', 300))
+    except ingest.IngestError as e:
+        return jsonify(error=str(e)), 400
+    except sqlite3.IntegrityError as e:
+        return jsonify(error=f"Import failed, nothing was written: {e}"), 409
+    except (sqlite3.OperationalError, FutureTimeoutError) as e:
+        # Busy or locked database, or the writer did not finish in time
+        app.logger.error(f"Import failed: {e!r}")
+        response = jsonify(error="The database is busy, try the import again later")
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    return jsonify(report)
 
 @app.route('/add_player', methods=['GET', 'POST'])
 def add_player():
@@ -445,29 +497,15 @@ def add_player():
         tackles_per_90 = request.form['tackles_per_90']
         tackle_success_rate = request.form['tackle_success_rate']
         
-        conn = get_db()
-        cursor = conn.cursor()
-
         try:
-            cursor.execute('BEGIN TRANSACTION;')
-
-            cursor.execute('INSERT INTO player_top_scorers (Player, Team, Goals, Penalties, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (player, team, goals, penalties, minutes, matches, country))
-            cursor.execute('INSERT INTO player_ratings (Player, Team, FotMob_Rating, Player_Match_Awards, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (player, team, fotmob_rating, player_match_awards, minutes, matches, country))
-            cursor.execute('INSERT INTO player_expected_goals (Player, Team, Expected_Goals, Goals, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (player, team, expected_goals, goals, minutes, matches, country))
-            cursor.execute('INSERT INTO player_tackles_won (Player, Team, Tackles_per_90, Tackle_Success_Rate, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)', 
-                           (player, team, tackles_per_90, tackle_success_rate, minutes, matches, country))
-
-            conn.commit()
-
+            app.extensions['writer'].submit_and_wait(
+                mutations.add_player, player, team, goals, penalties, minutes, matches, country,
+                fotmob_rating, player_match_awards, expected_goals, tackles_per_90, tackle_success_rate)
+        except ValueError as e:
+            return f"Invalid player: {e}", 400
         except Exception as e:
-            conn.rollback()  # Rollback if there's an error
-            print(f"Error occurred while adding player: {e}")
-
-        finally:
-            conn.close()
+            # Nothing was written: the job's savepoint was rolled back
+            app.logger.error(f"Error occurred while adding player: {e}")
 
         return redirect(url_for('index'))
     
@@ -477,91 +515,37 @@ def add_player():
 @app.route('/remove_player', methods=['GET', 'POST'])
 def remove_player():
     """ Route to remove a player. """
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT Player, Team, Goals, Matches FROM player_top_scorers")
-    players = cursor.fetchall()
-
-    # Convert sqlite3.Row objects into dictionaries
-    players = [{'Player': player['Player'], 'Team': player['Team'], 'Goals': player['Goals'], 'Matches': player['Matches']} for player in players]
-
-    if not players:
-        return "No players available to remove."
-
-    cursor.execute("SELECT Player, Team, FotMob_Rating, Player_Match_Awards, Minutes, Matches, Country FROM player_ratings")
-    ratings_data = cursor.fetchall()
-
-    cursor.execute("SELECT Player, Expected_Goals, Goals FROM player_expected_goals")
-    expected_goals_data = cursor.fetchall()
-
-    cursor.execute("SELECT Player, Tackles_per_90, Tackle_Success_Rate FROM player_tackles_won")
-    tackles_data = cursor.fetchall()
-
-    cursor.execute("SELECT Player, Penalties FROM player_top_scorers")
-    top_scorers_data = cursor.fetchall()
-
-    conn.close()
-
-    player_info = []
-    for player in players:
-        player_name = player['Player']
-        team = player['Team']
-        goals = player['Goals']
-        matches = player['Matches']
-
-        fotmob_rating = next((x[2] for x in ratings_data if x[0] == player_name), None)
-        player_match_awards = next((x[3] for x in ratings_data if x[0] == player_name), None)
-        minutes = next((x[4] for x in ratings_data if x[0] == player_name), None)
-        country = next((x[6] for x in ratings_data if x[0] == player_name), None)
-
-        expected_goals = next((x[1] for x in expected_goals_data if x[0] == player_name), None)
-        actual_goals = next((x[2] for x in expected_goals_data if x[0] == player_name), None)
-
-        tackles_per_90, tackle_success_rate = next(
-            ((x[1], x[2]) for x in tackles_data if x[0] == player_name), 
-            (None, None)
-        )
-
-        penalties = next((x[1] for x in top_scorers_data if x[0] == player_name), None)
-
-        player_info.append({
-            'Player': player_name,
-            'Team': team,
-            'Goals': goals,
-            'Matches': matches,
-            'FotMob_Rating': fotmob_rating,
-            'Player_Match_Awards': player_match_awards,
-            'Minutes': minutes,
-            'Country': country,
-            'Expected_Goals': expected_goals,
-            'Actual_Goals': actual_goals,
-            'Tackles_per_90': tackles_per_90,
-            'Tackle_Success_Rate': tackle_success_rate,
-            'Penalties': penalties
-        })
-
     if request.method == 'POST':
         player_name = request.form['player_name']
-        conn = get_db()
-        cursor = conn.cursor()
 
-        cursor.execute("DELETE FROM player_top_scorers WHERE Player = ?", (player_name,))
-        cursor.execute("DELETE FROM player_ratings WHERE Player = ?", (player_name,))
-        cursor.execute("DELETE FROM player_expected_goals WHERE Player = ?", (player_name,))
-        cursor.execute("DELETE FROM player_tackles_won WHERE Player = ?", (player_name,))
-
-        conn.commit()
-        conn.close()
+        try:
+            app.extensions['writer'].submit_and_wait(mutations.remove_player, player_name)
+        except Exception as e:
+            # Nothing was written: the job failed, or the writer did not get to it in time
+            app.logger.error(f"Error occurred while removing player: {e}")
 
         return redirect(url_for('remove_player'))
 
-    return render_template('remove_player.html', player_info=player_info)
+    def render(conn):
+        # One joined query returns each player with their data from the other tables
+        player_info = profiles.player_profiles(conn)
+
+        if not player_info:
+            return "No players available to remove."
+
+        return render_template('remove_player.html', player_info=player_info)
+
+    return cached_page('remove_player.html', migrations.PLAYER_TABLES, None, render)
 
 @app.route('/query', methods=['GET', 'POST'])
 def query_database():
     """ Route to query the database. """
     results = None
+    search_pager = None
+    filter_result = None
+    filter_error = None
+    season_result = None
+    season_error = None
 
     if request.method == 'POST':
         query_type = request.form.get('category')
@@ -574,55 +558,171 @@ def query_database():
             if column not in allowed_columns:
                 return "Invalid column selected."
 
-            query = f"SELECT * FROM player_top_scorers WHERE {column} LIKE ?"
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute(query, (f'%{value}%',))
-            results = cursor.fetchall()
-            conn.close()
+            conn = get_read_db()
+            page = max(request.form.get('page', 1, type=int), 1)
+
+            if search.can_search(column, value):
+                # Name/team/country searches use the trigram full-text index across all player tables
+                results, has_next = search.search_players(conn, column, value, page, app.config.get('SEARCH_PAGE_SIZE', 25))
+                search_pager = {'column': column, 'value': value, 'page': page, 'has_next': has_next}
+            else:
+                results = None
+                if filters.is_numeric(column):
+                    # Numbers are compared as numbers, which can use the column's index
+                    spec = {'table': 'player_top_scorers', 'where': [{'column': column, 'op': '=', 'value': value}],
+                            'limit': app.config.get('MAX_PAGE_SIZE', 500)}
+                    try:
+                        results = filters.run_filter(conn, spec, max_limit=app.config.get('MAX_PAGE_SIZE', 500))['rows']
+                    except filters.FilterError:
+                        pass  # Not a number: match the text as before
+                if results is None:
+                    query = f"SELECT * FROM player_top_scorers WHERE {column} LIKE ? ORDER BY Player"
+                    cursor = conn.cursor()
+                    cursor.execute(query, (f'%{value}%',))
+                    results = cursor.fetchall()
+
+        elif query_type == 'filter':
+            spec = filters.spec_from_form(request.form)
+            try:
+                filter_result = filters.run_filter(get_read_db(), spec, max_limit=app.config.get('MAX_PAGE_SIZE', 500))
+            except filters.FilterError as e:
+                filter_error = str(e)
+
+        elif query_type == 'seasons':
+            registry = app.extensions['seasons']
+            try:
+                # Cross-season rankings attach the archives to a connection to the current season
+                season_result = seasons.rankings(
+                    registry, get_db(), registry.select(request.form.getlist('seasons')),
+                    request.form.get('table'), request.form.get('stat'),
+                    n=max(1, min(request.form.get('n', 10, type=int), 1000)), combine=request.form.get('combine') or None)
+            except seasons.SeasonError as e:
+                season_error = str(e)
 
         elif query_type in ['players', 'teams']:
-            top_n = request.form['top_n']
+            top_n = request.form.get('top_n', type=int) or 0
             category = request.form['category']
-            if category == 'players':
-                query = f"""
-                SELECT pt.Player AS Name, pt.Team, pr.FotMob_Rating AS Rating
-                FROM player_top_scorers pt
-                JOIN player_ratings pr ON pt.Player = pr.Player
-                ORDER BY pr.FotMob_Rating DESC
-                LIMIT ?
-                """
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute(query, (top_n,))
-                results = cursor.fetchall()
-                conn.close()
-
-            elif category == 'teams':
-                query = f"""
-                SELECT ts.Team AS Name, ts.Matches, tr.FotMob_Team_Rating AS Rating
-                FROM team_goals_per_match ts
-                JOIN team_ratings tr ON ts.Team = tr.Team
-                ORDER BY tr.FotMob_Team_Rating DESC
-                LIMIT ?
-                """
-                conn = get_db()
-                cursor = conn.cursor()
-                cursor.execute(query, (top_n,))
-                results = cursor.fetchall()
-                conn.close()
-
-    return render_template('query_form.html', results=results)
+
+            # Rankings come from the precomputed leaderboards instead of a sorted join
+            board = season_state('leaderboards', leaderboards.create_boards)[category]
+            results = board.top(get_read_db(), top_n)
+
+    return render_template('query_form.html', results=results, search_pager=search_pager,
+                           filter_result=filter_result, filter_error=filter_error,
+                           season_result=season_result, season_error=season_error,
+                           filter_tables=migrations.PLAYER_TABLES + migrations.TEAM_TABLES + [derived.PLAYER_VIEW, derived.TEAM_VIEW],
+                           filter_columns=filters.all_columns())
+
+@app.route('/api/filter', methods=['GET', 'POST'])
+def filter_api():
+    """
+    Multi-predicate filter over one of the eight tables (see filters.py), as JSON.
+    Takes a JSON body, or the same fields as the filter form on /query.
+    """
+    spec = request.get_json(silent=True) if request.is_json else filters.spec_from_form(request.values)
+    try:
+        body = filters.run_filter(get_read_db(), spec, max_limit=app.config.get('MAX_PAGE_SIZE', 500))
+    except filters.FilterError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(body)
+
+@app.route('/api/stats', methods=['GET', 'POST'])
+def stats_batch():
+    """
+    Summary statistics of many table/column/stat combinations in one round trip (see stats_api.py), as JSON.
+    Takes a JSON body ({"requests": [...]}) or repeated ?r=table:columns:stats[:group_by]. GETs carry an
+    ETag and Last-Modified that change only when one of the batch's tables is written.
+    """
+    try:
+        spec = request.get_json(silent=True) if request.is_json else stats_api.spec_from_args(request.args)
+        requests = stats_api.parse(spec)
+    except stats_api.StatsError as e:
+        return jsonify({'error': str(e)}), 400
+
+    stores = season_state('aggregates', aggregates.create_store)
+    tables = sorted({table for table, *_ in requests})
+
+    def render(conn):
+        return json.dumps(stats_api.json_safe(stats_api.run(conn, stores, requests)), separators=(',', ':'))
+
+    return cached_page('stats_api', tables, tuple(requests), render, salt='stats_api', mimetype='application/json')
+
+@app.route('/leaderboards/<board_name>')
+def leaderboard(board_name):
+    """ JSON top-N of a leaderboard (?n=10), plus the rank of one player/team with ?name=. """
+    board = season_state('leaderboards', leaderboards.create_boards).get(board_name)
+    if board is None:
+        abort(404)
+
+    conn = get_read_db()
+    n = max(0, min(request.args.get('n', 10, type=int), 1000))
+    top = board.top(conn, n)
+    body = {'board': board_name, 'size': len(board), 'top': top}
+
+    name = request.args.get('name')
+    if name is not None:
+        body['name'] = name
+        body['rank'] = board.rank(conn, name)
+
+    return jsonify(body)
+
+@app.route('/seasons')
+def season_list():
+    """ JSON list of the seasons, newest first, and which one is current (the only one that can be written). """
+    registry = app.extensions['seasons']
+    return jsonify({'current': registry.current, 'seasons': registry.names()})
+
+@app.route('/seasons/rankings')
+def season_rankings():
+    """
+    JSON top-N of one numeric column across seasons (see seasons.rankings):
+    ?table=player_top_scorers&stat=Goals&n=10&seasons=2022-23,2023-24 (every season by default),
+    and &combine=sum|avg|max|min to rank per player/team over the seasons instead of per season.
+    """
+    registry = app.extensions['seasons']
+    n = max(1, min(request.args.get('n', 10, type=int), 1000))
+    try:
+        body = seasons.rankings(registry, get_db(), registry.select(request.args.get('seasons')),
+                                request.args.get('table'), request.args.get('stat'), n=n,
+                                combine=request.args.get('combine') or None)
+    except seasons.SeasonError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(body)
+
+@app.route('/seasons/summary')
+def season_summary():
+    """ JSON count, total, mean, min and max of one numeric column per season and over all of them (?table=&stat=&seasons=). """
+    registry = app.extensions['seasons']
+    try:
+        body = seasons.summary(registry, get_db(), registry.select(request.args.get('seasons')),
+                               request.args.get('table'), request.args.get('stat'))
+    except seasons.SeasonError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(body)
+
+@app.route('/players/<path:name>/similar')
+def similar_players(name):
+    """ JSON of the players whose stats are closest to one player's (?k=10, optionally ?team= and ?country=). """
+    k = max(1, min(request.args.get('k', 10, type=int), 100))
+    team, country = request.args.get('team') or None, request.args.get('country') or None
+    import similarity  # NumPy, loaded on the first request that needs it
+    similar = similarity.get_index(app, g.season).similar(get_read_db(), name, k, team=team, country=country)
+    if similar is None:
+        abort(404)
+    return jsonify({'player': name, 'k': k, 'team': team, 'country': country, 'similar': similar})
 
 @app.route('/modify_teams', methods=['GET'])
 def modify_teams():
     """ Route to modify teams. """
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM team_ratings')
-    teams = cursor.fetchall()
-    conn.close()
-    return render_template('modify_teams.html', teams=teams)
+    def render(conn):
+        cursor = conn.cursor()
+        # The team_ratings view in id order, which is the order teams were added in
+        cursor.execute('SELECT t.Team, tr.FotMob_Team_Rating, t.Matches FROM team_rating_stats tr '
+                       'JOIN teams t ON t.id = tr.team_id ORDER BY tr.team_id')
+        teams = cursor.fetchall()
+        return render_template('modify_teams.html', teams=teams)
+
+    return cached_page('modify_teams.html', ['team_ratings'], None, render)
 
 @app.route('/edit_team/<string:team_name>', methods=['GET', 'POST'])
 def edit_team(team_name):
@@ -642,25 +742,17 @@ def edit_team(team_name):
             fotmob_rating = request.form['fotmob_team_rating']
             matches = request.form['matches']
 
-            cursor.execute('BEGIN TRANSACTION;')
-
-            cursor.execute("""
-                UPDATE team_ratings
-                SET Team = ?, FotMob_Team_Rating = ?, Matches = ?
-                WHERE Team = ?
-            """, (updated_team_name, fotmob_rating, matches, team_name))
-
-            conn.commit()
+            app.extensions['writer'].submit_and_wait(mutations.edit_team, team_name, updated_team_name, fotmob_rating, matches)
             return redirect(url_for('modify_teams'))
 
-    except sqlite3.Error as e:
-        conn.rollback()
-        print(f"Database error occurred: {e}")
+    except ValueError as e:
+        return f"Invalid team: {e}", 400
+    except (sqlite3.Error, FutureTimeoutError) as e:
+        app.logger.error(f"Database error occurred: {e!r}")
         return "An error occurred while updating the team.", 500
 
     finally:
         cursor.close()
-        conn.close()
 
     return render_template('edit_team.html', team=team)
 
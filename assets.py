@@ -0,0 +1,302 @@
+"""
+Static assets with fingerprinted URLs, and compressed responses.
+
+build() copies every file of the static folder to a name that carries a
+digest of its content (css/style.css -> css/style.3b5d0c1e9a2f.css), writes
+gzip and brotli variants of the text files next to the copy when they are
+smaller, and records the names in static/manifest.json. Every output is
+written through a temporary file and renamed into place, so workers starting
+together can build at once; the outputs are ignored by git. With the
+manifest loaded, url_for('static', filename='css/style.css') returns the
+fingerprinted URL, so templates need no change. A fingerprinted file never changes, so it
+is served with a one-year immutable Cache-Control, in the precompressed
+variant the browser accepts. Files without a fingerprint are served by Flask
+as before. The app builds changed files at startup (ASSETS_AUTO_BUILD), or
+run (from the repository root, with the app's configuration):
+    flask --app app build-assets
+
+Responses other than files (HTML pages, JSON, CSV/NDJSON exports, SVG plots)
+are compressed on the fly when the client accepts it: with brotli if it is
+installed and accepted, gzip otherwise. Whole responses of at least
+COMPRESS_MIN_BYTES are compressed in one go, streamed exports chunk by chunk.
+Compressed responses get a weak ETag, which still matches the page's
+If-None-Match for a 304. Bytes before and after compression are counted per
+endpoint on /metrics (http_response_bytes_total, http_compressed_bytes_total).
+
+brotli is optional: without it only gzip is used.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import zlib
+
+from flask import current_app, request, send_from_directory
+
+import metrics
+
+MANIFEST = 'manifest.json'
+DIGEST_LENGTH = 12
+
+# Content types worth compressing; images such as JPEG and PNG are compressed already
+COMPRESSIBLE = {'text/html', 'text/css', 'text/csv', 'text/plain', 'text/javascript', 'application/javascript',
+                'application/json', 'application/x-ndjson', 'image/svg+xml'}
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}  # Precompressed variants of a fingerprinted file
+
+# Generated files in the static folder (and temporary files of a build in progress), never fingerprinted themselves
+_GENERATED = re.compile(rf'\.[0-9a-f]{{{DIGEST_LENGTH}}}\.[^/]+$|\.(gz|br|tmp)$')
+
+metrics.REGISTRY.counter('http_response_bytes_total', 'Response body bytes before compression, by endpoint.')
+metrics.REGISTRY.counter('http_compressed_bytes_total', 'Response body bytes sent, by endpoint and content encoding.')
+
+
+def _brotli():
+    try:
+        import brotli  # Optional
+    except ImportError:
+        return None
+    return brotli
+
+
+def _compressible(mimetype):
+    return mimetype in COMPRESSIBLE
+
+
+def fingerprinted(path, data):
+    """ path with a digest of data before its extension. """
+    digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _write(path, data):
+    """ Write data to path through a temporary file, so concurrent builds and readers never see a partial file. """
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def load_manifest(folder):
+    """ The manifest in folder, {} if there is none. """
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def sources(folder):
+    """ Paths (relative, with /) of the files in folder that are not generated by build(). """
+    found = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), folder).replace(os.sep, '/')
+            if path != MANIFEST and not _GENERATED.search(path):
+                found.append(path)
+    return sorted(found)
+
+
+def build(folder, brotli_quality=11):
+    """
+    Fingerprint and precompress every file of the static folder whose content changed since the
+    last build, remove the outputs of files that changed or are gone, and write the manifest.
+    Returns (manifest, paths of the files built).
+    """
+    old = load_manifest(folder)
+    manifest, built = {}, []
+    brotli = _brotli()
+    for path in sources(folder):
+        with open(os.path.join(folder, path), 'rb') as f:
+            data = f.read()
+        name = fingerprinted(path, data)
+        entry = old.get(path)
+        if entry and entry['file'] == name and os.path.exists(os.path.join(folder, name)):
+            manifest[path] = entry
+            continue
+
+        _write(os.path.join(folder, name), data)
+        sizes = {}
+        if _compressible(mimetypes.guess_type(path)[0]):
+            variants = {'gzip': gzip.compress(data, 9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=brotli_quality)
+            for encoding, compressed in variants.items():
+                if len(compressed) < len(data):
+                    _write(os.path.join(folder, name + SUFFIXES[encoding]), compressed)
+                    sizes[encoding] = len(compressed)
+        manifest[path] = {'file': name, 'size': len(data), 'encodings': sizes}
+        built.append(path)
+
+    for path, entry in old.items():
+        if manifest.get(path, {}).get('file') != entry['file']:
+            for output in [entry['file']] + [entry['file'] + SUFFIXES[e] for e in entry['encodings']]:
+                try:
+                    os.remove(os.path.join(folder, output))
+                except FileNotFoundError:
+                    pass
+
+    if manifest != old:
+        _write(os.path.join(folder, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf8'))
+    return manifest, built
+
+
+class Assets:
+    """ The loaded manifest, by source path and by fingerprinted file. """
+
+    def __init__(self, folder, max_age):
+        self.folder = folder
+        self.max_age = max_age
+        self.urls = {}
+        self.files = {}
+
+    def load(self, manifest):
+        self.urls = {path: entry['file'] for path, entry in manifest.items()}
+        self.files = {entry['file']: entry for entry in manifest.values()}
+
+    def url_defaults(self, endpoint, values):
+        # url_for('static', filename=...) of a fingerprinted file
+        if endpoint == 'static':
+            name = self.urls.get(values.get('filename'))
+            if name is not None:
+                values['filename'] = name
+
+    def send(self, filename):
+        """ The static view: fingerprinted files in the best accepted encoding with immutable caching, others as Flask does. """
+        entry = self.files.get(filename)
+        if entry is None:
+            return current_app.send_static_file(filename)
+
+        encoding = negotiate(entry['encodings'])
+        path = filename + SUFFIXES[encoding] if encoding else filename
+        response = send_from_directory(self.folder, path, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                                       max_age=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def negotiate(available):
+    """ The content encoding of this request's response among available (br, gzip), or None for identity. """
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def _record(endpoint, encoding, before, after):
+    metrics.REGISTRY.inc('http_response_bytes_total', (('endpoint', endpoint),), before)
+    metrics.REGISTRY.inc('http_compressed_bytes_total', (('endpoint', endpoint), ('encoding', encoding)), after)
+
+
+def _stream(chunks, compressor, endpoint, encoding):
+    """ chunks compressed one by one, each flushed so the client keeps receiving rows as they are read. """
+    before = after = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf8')
+            before += len(chunk)
+            if encoding == 'gzip':
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                data = compressor.process(chunk) + compressor.flush()
+            after += len(data)
+            if data:
+                yield data
+        data = compressor.flush() if encoding == 'gzip' else compressor.finish()
+        after += len(data)
+        yield data
+    finally:
+        _record(endpoint, encoding, before, after)
+
+
+def compress_response(response):
+    """ after_request hook: compress text responses for clients that accept it. """
+    mimetype = response.mimetype
+    if (response.status_code != 200 or response.direct_passthrough or not _compressible(mimetype)
+            or 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+
+    config = current_app.config
+    endpoint = request.endpoint or 'unmatched'
+    brotli = _brotli()
+    available = {'gzip'} | ({'br'} if brotli is not None else set())
+
+    if response.is_streamed:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(available)
+        if encoding is None:
+            return response
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=config.get('BROTLI_QUALITY', 5))
+        else:
+            compressor = zlib.compressobj(config.get('COMPRESS_LEVEL', 6), zlib.DEFLATED, 31)  # 31: gzip framing
+        response.response = _stream(response.response, compressor, endpoint, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_BYTES', 1024):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(available)
+        if encoding is None:
+            _record(endpoint, 'identity', len(data), len(data))
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=config.get('BROTLI_QUALITY', 5))
+        else:
+            compressed = gzip.compress(data, config.get('COMPRESS_LEVEL', 6), mtime=0)
+        _record(endpoint, encoding, len(data), len(compressed))
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # The same page in another encoding is not byte-identical
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """ Build and load the static manifest, serve fingerprinted files, compress responses and register build-assets. """
+    folder = app.static_folder
+    manifest = {}
+    if folder and os.path.isdir(folder):
+        if app.config.get('ASSETS_AUTO_BUILD', True):
+            try:
+                manifest, _ = build(folder)
+            except OSError as e:
+                app.logger.warning(f"Could not build static assets in {folder}, serving them unversioned: {e}")
+        else:
+            manifest = load_manifest(folder)
+
+    assets = Assets(folder, app.config.get('ASSET_MAX_AGE', 31536000))
+    assets.load(manifest)
+    app.extensions['assets'] = assets
+    app.url_defaults(assets.url_defaults)
+    app.view_functions['static'] = assets.send
+    app.after_request(compress_response)
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """ Fingerprint and precompress the static files, and report the bytes saved. """
+        if not folder or not os.path.isdir(folder):
+            print(f"No static folder at {folder}")
+            return
+        manifest, built = build(folder)
+        assets.load(manifest)
+        for path, entry in manifest.items():
+            saved = ', '.join(f"{encoding} {size} bytes ({100 - 100 * size / entry['size']:.0f}% smaller)"
+                              for encoding, size in sorted(entry['encodings'].items()))
+            print(f"{path} -> {entry['file']}: {entry['size']} bytes{', ' + saved if saved else ''}")
+        print(f"{len(built)} of {len(manifest)} files built")
@@ -0,0 +1,109 @@
+"""
+Render latency, payload size and memory of the chart backends (see charts.py).
+
+Each backend runs in its own process, so import time and resident memory are
+its own: the bar chart of the stats pages and the Minutes vs Goals scatter,
+for the real number of players and for a 100x synthetic league, are rendered
+--renders times each. Reported per backend: import time, p50/p95 render time,
+payload bytes (and gzipped, as a browser would receive the SVG), and RSS
+after importing and after rendering.
+
+Usage (from the repository root):
+    python benchmarks/bench_charts.py [--renders 50] [--backends svg,matplotlib]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Means of player_top_scorers, like the stat plot on /player_stats
+STAT_VALUES = {'Goals': 3.95, 'Penalties': 0.4, 'Minutes': 1630.2, 'Matches': 24.8}
+SCATTER_SIZES = {'scatter 1x': 260, 'scatter 100x': 26000}
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def scatter_data(n, seed=42):
+    """ Minutes and goals shaped like the real data: goals grow with minutes and are mostly small. """
+    rng = random.Random(seed)
+    minutes = [rng.randint(0, 3060) for _ in range(n)]
+    goals = [max(0, int(rng.expovariate(1 / (1 + m / 700)))) for m in minutes]
+    return minutes, goals
+
+
+def child(name, renders):
+    """ Runs in the child process: time one backend and print the results as JSON. """
+    start = time.perf_counter()
+    import charts
+    chart = charts.backend(name)
+    import_ms = (time.perf_counter() - start) * 1000
+    rss_import = rss_mb()
+
+    jobs = {'stat': (chart.render_stat_plot, (STAT_VALUES, 'mean'))}
+    for label, n in SCATTER_SIZES.items():
+        jobs[label] = (chart.render_scatter_plot, scatter_data(n))
+
+    results = {}
+    for label, (render, args) in jobs.items():
+        render(*args)  # Warm-up
+        samples = []
+        for _ in range(renders):
+            start = time.perf_counter()
+            image = render(*args)
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        results[label] = {
+            'p50_ms': statistics.median(samples),
+            'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'bytes': len(image),
+            'gzip_bytes': len(gzip.compress(image)),
+        }
+    print(json.dumps({'import_ms': import_ms, 'rss_import_mb': rss_import, 'rss_mb': rss_mb(), 'jobs': results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=50)
+    parser.add_argument('--backends', default='svg,matplotlib')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.renders)
+        return 0
+
+    # Resident memory of a bare interpreter, so each backend's share can be told apart
+    baseline = float(subprocess.run(
+        [sys.executable, '-c', "import os; print(int(open('/proc/self/statm').read().split()[1]) "
+                               "* os.sysconf('SC_PAGE_SIZE') / (1024 * 1024))"],
+        capture_output=True, text=True, check=True).stdout)
+
+    print(f"{'backend':<11} {'chart':<13} {'p50 ms':>8} {'p95 ms':>8} {'bytes':>9} {'gzip':>8}")
+    for name in args.backends.split(','):
+        run = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, '--renders', str(args.renders)],
+                             capture_output=True, text=True, cwd=ROOT)
+        if run.returncode != 0:
+            print(f"{name:<11} failed: {run.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(run.stdout)
+        for label, job in result['jobs'].items():
+            print(f"{name:<11} {label:<13} {job['p50_ms']:>8.2f} {job['p95_ms']:>8.2f} {job['bytes']:>9} {job['gzip_bytes']:>8}")
+        print(f"{name:<11} import {result['import_ms']:.0f} ms, RSS +{result['rss_import_mb'] - baseline:.1f} MB after import, "
+              f"+{result['rss_mb'] - baseline:.1f} MB after rendering")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
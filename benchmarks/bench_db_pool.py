@@ -0,0 +1,97 @@
+"""
+Requests/second on /players_data and /query with and without connection pooling.
+
+"before" opens and closes a plain connection per request, exactly as the
+original get_db() did: sqlite3.connect(database, timeout=20) with sqlite3.Row
+rows and none of the PRAGMAs or statement cache of db.py. (The database file
+itself stays in WAL mode once migrated, since journal_mode is stored in the
+file.) "after" uses the pooled, pre-tuned connections from db.py.
+
+Usage (from the repository root):
+    python benchmarks/bench_db_pool.py [--seconds 5] [--threads 4]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as bundesliga  # noqa: E402
+import db  # noqa: E402
+
+# Representative requests for the two routes under test
+REQUESTS = {
+    '/players_data': {'table': 'player_top_scorers'},
+    '/query (search)': {'column': 'Player', 'value': 'Kane'},
+    '/query (top players)': {'category': 'players', 'top_n': '10'},
+}
+
+
+def run(path, form, seconds, threads):
+    """ Hammer one route from several threads and return requests/second. """
+    url = path.split(' ')[0]
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def worker(i):
+        client = bundesliga.app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.post(url, data=form)
+            assert response.status_code == 200, response.status_code
+            counts[i] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+class ConnectPerRequest(db.ConnectionPool):
+    """ The original get_db(): a new untuned connection for every request, closed at teardown. """
+
+    def __init__(self, database):
+        super().__init__(database, size=0)
+
+    def connect(self):
+        conn = sqlite3.connect(self.database, timeout=20, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def use_pool(pool):
+    """ Swap in a fresh pool. """
+    bundesliga.app.extensions['db_pool'].close()
+    bundesliga.app.extensions['db_pool'] = pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    database = bundesliga.app.config.get('DATABASE', 'Bundesliga.db')
+    bundesliga.app.config['DB_POOL_SIZE'] = args.pool_size
+    results = {}
+    for label, pool in (('before', ConnectPerRequest(database)), ('after', db.create_pool(bundesliga.app.config))):
+        use_pool(pool)
+        for path, form in REQUESTS.items():
+            results[(label, path)] = run(path, form, args.seconds, args.threads)
+
+    print(f"{'route':<24}{'before req/s':>14}{'after req/s':>14}{'speedup':>10}")
+    for path in REQUESTS:
+        before = results[('before', path)]
+        after = results[('after', path)]
+        print(f"{path:<24}{before:>14.1f}{after:>14.1f}{after / before:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Stored derived metrics (see derived.py) against computing them per request.
+
+Builds a synthetic database with synth.py (at the latest schema, so with every
+metric stored) and times:
+  - refresh: derived.refresh(), the statement a bulk import runs once after
+    the load
+  - write: one player rating update through its view, with the triggers that
+    recompute the player's team and without them (the overhead of keeping
+    the metrics current)
+  - top: the --n best Goals_per_90 from the indexed player_derived_metrics
+    view against reading player_top_scorers and computing the rate in Python,
+    which is what a page would do without the stored column
+
+Usage (from the repository root):
+    python benchmarks/bench_derived.py [--scale 10] [--runs 50] [--n 10]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+
+import derived  # noqa: E402
+import migrations  # noqa: E402
+
+
+def timed(runs, function, *args):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='10', help='synth.py scale')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--n', type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-derived-')
+    path = os.path.join(directory, 'synth.db')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'synth.py'), '--scale', args.scale, '--output', path],
+                   check=True, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    players = conn.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+    size = conn.execute('SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM players GROUP BY team_id)').fetchone()[0]
+    print(f"{players} players, at most {size} per team")
+
+    names = [row[0] for row in conn.execute('SELECT Player FROM player_ratings ORDER BY Player')]
+
+    def write():
+        conn.execute('UPDATE player_ratings SET FotMob_Rating = FotMob_Rating + 0.1 WHERE Player = ?',
+                     (names[len(names) // 2],))
+        conn.commit()
+
+    def refresh():
+        derived.refresh(conn)
+        conn.commit()
+
+    def stored_top():
+        conn.execute(f'SELECT Player, Goals_per_90 FROM {derived.PLAYER_VIEW} WHERE Goals_per_90 IS NOT NULL '
+                     'ORDER BY Goals_per_90 DESC LIMIT ?', (args.n,)).fetchall()
+
+    def computed_top():
+        rates = [(goals * 90.0 / minutes, player)
+                 for player, goals, minutes in conn.execute('SELECT Player, Goals, Minutes FROM player_top_scorers')
+                 if goals is not None and minutes]
+        sorted(rates, reverse=True)[:args.n]
+
+    rows = [('refresh', timed(max(1, args.runs // 10), refresh))]
+    rows.append(('write with triggers', timed(args.runs, write)))
+    derived.drop_triggers(conn)
+    rows.append(('write without triggers', timed(args.runs, write)))
+    derived.create_triggers(conn)
+    derived.refresh(conn)
+    conn.commit()
+    rows.append((f'top {args.n}, stored', timed(args.runs, stored_top)))
+    rows.append((f'top {args.n}, computed', timed(max(1, args.runs // 10), computed_top)))
+
+    print(f"{'':<26} {'p50 ms':>10} {'p95 ms':>10}")
+    for name, (p50, p95) in rows:
+        print(f"{name:<26} {p50:>10.2f} {p95:>10.2f}")
+
+    conn.close()
+    shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Read-route latency with and without the in-memory replica.
+
+Runs benchmarks/bench_routes.py on the read-only routes twice, in separate
+processes: "before" with READ_REPLICA=0 (reads go to the database file) and
+"after" with READ_REPLICA=1 (reads go to the in-memory copy, see replica.py).
+Extra arguments are passed on, e.g. --database for a synthetic database from
+benchmarks/synth.py or --mode http.
+
+Usage (from the repository root):
+    python benchmarks/bench_replica.py [--requests 300] [--database /tmp/bundesliga-100x.db]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+READ_SCENARIOS = ['players_data', 'players_data_deep', 'teams_data', 'export_csv', 'team_stats', 'player_stats',
+                  'query_search', 'query_top_players', 'query_top_teams', 'leaderboard', 'modify_teams']
+
+
+def run(replica, args, extra):
+    """ Results of one bench_routes.py run. """
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    try:
+        command = [sys.executable, os.path.join(HERE, 'bench_routes.py'), '--only', ','.join(READ_SCENARIOS),
+                   '--requests', str(args.requests), '--output', output] + extra
+        env = dict(os.environ, READ_REPLICA='1' if replica else '0')
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)['scenarios']
+    finally:
+        os.remove(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    args, extra = parser.parse_known_args()
+
+    before = run(False, args, extra)
+    after = run(True, args, extra)
+
+    print(f"{'scenario':<20} {'p50 file':>9} {'p50 mem':>9} {'req/s file':>11} {'req/s mem':>10} {'speedup':>8}")
+    for name in READ_SCENARIOS:
+        if name not in before or name not in after:
+            continue
+        b, a = before[name], after[name]
+        print(f"{name:<20} {b['p50_ms']:>9.2f} {a['p50_ms']:>9.2f} {b['throughput_rps']:>11.1f} "
+              f"{a['throughput_rps']:>10.1f} {a['throughput_rps'] / b['throughput_rps']:>7.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Latency and throughput of every route in app.py.
+
+Runs a fixed list of requests against a copy of a database (Bundesliga.db, or
+one built by benchmarks/synth.py), so the source file is never modified. It
+covers the read pages, the stats and query forms, the stats API, exports,
+leaderboards, plots and imports, and the write paths: teams and players are
+added, edited and removed again, so every run starts from the same data.
+
+Two modes:
+  client  each request goes through the Flask test client on one thread
+  http    the app runs in a threaded WSGI server and --threads clients send real HTTP requests
+
+For each scenario it reports p50/p95/p99 latency and throughput, and at the
+end the peak RSS of the process. --output writes the results as JSON, and
+--compare diffs a run against such a file, exiting 1 when a scenario's p95
+got worse than --threshold.
+
+Usage (from the repository root):
+    python benchmarks/synth.py --scale 100x --output /tmp/bundesliga-100x.db
+    python benchmarks/bench_routes.py --database /tmp/bundesliga-100x.db --output 100x.json
+    python benchmarks/bench_routes.py --compare benchmarks/baselines/1x-client.json
+    python benchmarks/bench_routes.py --mode http --threads 8 --only players_data,query_search
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The eight tables, as the stats forms list them
+TABLES = ['possession_percentage_team', 'team_goals_per_match', 'team_ratings', 'total_red_card_team',
+          'player_expected_goals', 'player_ratings', 'player_tackles_won', 'player_top_scorers']
+
+PLOT_URL = re.compile(rb'/plots/[0-9a-f]+\.(?:png|svg)')
+
+
+def rss_mb():
+    """ Current resident set size in MB. """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def sample_keys(conn):
+    """ A real team, player and search term from the database under test. """
+    team = conn.execute('SELECT Team FROM team_ratings ORDER BY Team LIMIT 1').fetchone()[0]
+    player = conn.execute('SELECT Player FROM player_top_scorers ORDER BY Player LIMIT 1').fetchone()[0]
+    count = conn.execute('SELECT COUNT(*) FROM player_top_scorers').fetchone()[0]
+    middle = conn.execute('SELECT Player FROM player_top_scorers ORDER BY Player LIMIT 1 OFFSET ?',
+                          (count // 2,)).fetchone()[0]
+    return team, player, middle
+
+
+def build_scenarios(team, player, middle, plot_url):
+    """
+    (name, method, expected status, request factory) in run order. A factory takes the request
+    number and returns (path, form data or None). Write scenarios come in pairs that undo each other.
+    """
+    stats = ['mean', 'min', 'max', 'median', 'std_dev']
+    new_team = lambda i: f"Bench Team {i}"  # noqa: E731
+    new_player = lambda i: f"Bench Player {i}"  # noqa: E731
+    quoted = urllib.parse.quote(team)
+
+    def edit_team(i):
+        # Rename the team and back again, alternating
+        current, updated = (team, f"{team} (bench)") if i % 2 == 0 else (f"{team} (bench)", team)
+        return f"/edit_team/{urllib.parse.quote(current)}", {
+            'team_name': updated, 'fotmob_team_rating': '7.1', 'matches': '34'}
+
+    def import_players(i):
+        rows = [{'Player': f"Bench Import {j}", 'Team': 'Bench FC', 'Goals': i % 10, 'Minutes': 900,
+                 'Matches': 10, 'Country': 'GER'} for j in range(20)]
+        return '/import/players?format=ndjson', '\n'.join(json.dumps(row) for row in rows)
+
+    scenarios = [
+        ('index', 'GET', 200, lambda i: ('/', None)),
+        ('players_data', 'GET', 200, lambda i: ('/players_data?table=player_top_scorers', None)),
+        ('players_data_deep', 'GET', 200,
+         lambda i: (f"/players_data?table=player_top_scorers&after={urllib.parse.quote(middle)}", None)),
+        ('teams_data', 'GET', 200, lambda i: ('/teams_data?table=team_ratings', None)),
+        ('export_csv', 'GET', 200, lambda i: ('/export/player_top_scorers.csv', None)),
+        ('team_stats', 'POST', 200,
+         lambda i: ('/team_stats', {'table': 'team_goals_per_match', 'stat': stats[i % len(stats)]})),
+        ('player_stats', 'POST', 200,
+         lambda i: ('/player_stats', {'table': 'player_top_scorers', 'stat': stats[i % len(stats)]})),
+        # The stats of all eight tables in one batch, what eight team_stats/player_stats posts would return
+        ('stats_batch', 'GET', 200, lambda i: ('/api/stats?' + urllib.parse.urlencode(
+            [('r', f"{table}::{','.join(stats)}") for table in TABLES]), None)),
+        ('stats_batch_by_team', 'GET', 200,
+         lambda i: ('/api/stats?r=player_top_scorers:Goals,Minutes:sum,mean,max:team', None)),
+        ('query_search', 'POST', 200, lambda i: ('/query', {'column': 'Player', 'value': player[:4]})),
+        ('query_top_players', 'POST', 200, lambda i: ('/query', {'category': 'players', 'top_n': '10'})),
+        ('query_top_teams', 'POST', 200, lambda i: ('/query', {'category': 'teams', 'top_n': '10'})),
+        ('leaderboard', 'GET', 200,
+         lambda i: (f"/leaderboards/goals?n=10&name={urllib.parse.quote(player)}", None)),
+        ('modify_teams', 'GET', 200, lambda i: ('/modify_teams', None)),
+        ('edit_team_form', 'GET', 200, lambda i: (f"/edit_team/{quoted}", None)),
+        ('edit_team', 'POST', 302, edit_team),
+        ('remove_team_list', 'GET', 200, lambda i: ('/remove_team', None)),
+        ('remove_player_list', 'GET', 200, lambda i: ('/remove_player', None)),
+        ('add_team', 'POST', 302, lambda i: ('/add_team', {
+            'team_name': new_team(i), 'fotmob_rating': '6.9', 'matches': '34', 'goals_per_match': '1.5',
+            'total_goals_scored': '51', 'possession': '50', 'red_cards': '2', 'yellow_cards': '60'})),
+        ('remove_team', 'POST', 302, lambda i: ('/remove_team', {'team_name': new_team(i)})),
+        ('add_player', 'POST', 302, lambda i: ('/add_player', {
+            'player': new_player(i), 'team': 'Bench FC', 'goals': str(i % 20), 'penalties': '1',
+            'minutes': '1800', 'matches': '20', 'country': 'GER', 'fotmob_rating': '7.0',
+            'player_match_awards': '1', 'expected_goals': '5.5', 'tackles_per_90': '1.2',
+            'tackle_success_rate': '55'})),
+        ('remove_player', 'POST', 302, lambda i: ('/remove_player', {'player_name': new_player(i)})),
+        ('import_players', 'POST', 200, import_players),
+        ('metrics', 'GET', 200, lambda i: ('/metrics', None)),
+    ]
+    if plot_url:
+        scenarios.append(('plot_image', 'GET', 200, lambda i: (plot_url, None)))
+    return scenarios
+
+
+class ClientTransport:
+    """ Requests through the Flask test client. """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def __call__(self, method, path, data):
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()  # Drain streamed responses such as exports
+        return response.status_code
+
+
+class HTTPTransport:
+    """ Real HTTP requests to a threaded WSGI server running the app. """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def __call__(self, method, path, data):
+        body = None
+        if isinstance(data, str):
+            body = data.encode()
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        opener = urllib.request.build_opener(NoRedirect)
+        try:
+            with opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_scenario(transports, method, expected, factory, requests):
+    """ Send requests spread over the transports (one thread each). Returns the result dict. """
+    numbers = itertools.count()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(transport):
+        local = []
+        failed = 0
+        while True:
+            i = next(numbers)
+            if i >= requests:
+                break
+            path, data = factory(i)
+            start = time.perf_counter()
+            status = transport(method, path, data)
+            local.append(time.perf_counter() - start)
+            if status != expected:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    if len(transports) == 1:
+        worker(transports[0])
+    else:
+        threads = [threading.Thread(target=worker, args=(t,)) for t in transports]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda q: round(percentile(latencies, q) * 1000, 3)  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': ms(50),
+        'p95_ms': ms(95),
+        'p99_ms': ms(99),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'rss_mb': round(rss_mb(), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_ms):
+    """ Print p95/throughput changes against a baseline. Returns the names of regressed scenarios. """
+    regressions = []
+    for key in ('mode', 'threads', 'requests', 'database'):
+        if baseline.get('meta', {}).get(key) != results['meta'][key]:
+            print(f"Warning: baseline {key} is {baseline.get('meta', {}).get(key)!r}, this run {results['meta'][key]!r}")
+    print(f"\n{'scenario':<22} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'rps base':>10} {'rps now':>10}")
+    for name, now in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        change = (now['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        regressed = change > threshold and now['p95_ms'] - base['p95_ms'] > min_ms
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<22} {base['p95_ms']:>10.2f} {now['p95_ms']:>10.2f} {change:>+7.0%} "
+              f"{base['throughput_rps']:>10.1f} {now['throughput_rps']:>10.1f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'Bundesliga.db'), help='Copied before the run')
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent clients in http mode')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--only', help='Comma-separated scenarios to run')
+    parser.add_argument('--skip', help='Comma-separated scenarios to leave out')
+    parser.add_argument('--plot-workers', default='0', help='PLOT_WORKERS for the run (0 renders inline)')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--compare', help='Baseline JSON to diff against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed p95 slowdown as a fraction')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore p95 changes smaller than this')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-routes-')
+    database = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(args.database, database)
+
+    # Configure the app before it is imported
+    os.environ['DATABASE'] = database
+    os.environ['PLOT_WORKERS'] = args.plot_workers
+    os.environ.pop('PLOT_CACHE_DIR', None)
+    import app as bundesliga
+    import db
+    app = bundesliga.app
+
+    try:
+        with app.app_context():
+            team, player, middle = sample_keys(db.get_db())
+        client = app.test_client()
+        page = client.post('/player_stats', data={'table': 'player_top_scorers', 'stat': 'mean'}).get_data()
+        match = PLOT_URL.search(page)
+        scenarios = build_scenarios(team, player, middle, match.group().decode() if match else None)
+
+        only = set(args.only.split(',')) if args.only else None
+        skip = set(args.skip.split(',')) if args.skip else set()
+        scenarios = [s for s in scenarios if (only is None or s[0] in only) and s[0] not in skip]
+
+        server = None
+        if args.mode == 'http':
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            transports = [HTTPTransport(f"http://127.0.0.1:{server.server_port}") for _ in range(args.threads)]
+        else:
+            transports = [ClientTransport(app)]
+
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'database': os.path.basename(args.database),
+                'mode': args.mode,
+                'threads': len(transports),
+                'requests': args.requests,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'scenarios': {},
+        }
+
+        print(f"{'scenario':<22} {'reqs':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'RSS MB':>8}")
+        for name, method, expected, factory in scenarios:
+            result = run_scenario(transports, method, expected, factory, args.requests)
+            results['scenarios'][name] = result
+            print(f"{name:<22} {result['requests']:>6} {result['errors']:>4} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['throughput_rps']:>9.1f} {result['rss_mb']:>8.1f}")
+
+        results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+        print(f"Peak RSS {results['peak_rss_mb']} MB")
+
+        if server is not None:
+            server.shutdown()
+    finally:
+        app.extensions['render_pool'].shutdown()
+        app.extensions['db_pool'].close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"Results written to {args.output}")
+
+    failed = any(result['errors'] for result in results['scenarios'].values())
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_ms)
+        if regressions:
+            print(f"p95 regressions: {', '.join(regressions)}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
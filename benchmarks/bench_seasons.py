@@ -0,0 +1,129 @@
+"""
+Season-partitioned storage (see seasons.py) against one database holding every season.
+
+Builds --seasons synthetic seasons with synth.py (one seed each), archives all
+but the newest with seasons.archive() and loads the same rows into a single
+"history" table with a Season column and an index on (Season, Goals), the way
+the eight tables would look if every season were appended to them. Times:
+  - scan: the player_stats query over the current season, the part of every
+    stats page that reads a whole table
+  - archived scan: the same query on an archived season through its
+    ArchivePool (immutable, memory-mapped)
+  - rankings: the top --n goal scorers across every season, seasons.rankings()
+    (UNION ALL of each season's indexed top n) against ORDER BY over history
+  - career: goals summed per player across every season
+history is a flat table, so its scans skip the joins of the player views and
+are a lower bound for what the current season's queries would cost on it.
+
+Usage (from the repository root):
+    python benchmarks/bench_seasons.py [--seasons 8] [--scale 10] [--runs 50]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+
+import seasons  # noqa: E402
+
+SCAN = 'SELECT Player, Team, Goals, Penalties, Minutes, Matches, Country FROM player_top_scorers'
+
+
+def timed(runs, function, *args):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seasons', type=int, default=8, help='Seasons to generate, at most 10 (SQLite attaches 10 databases)')
+    parser.add_argument('--scale', default='10', help='synth.py scale of each season')
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--n', type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-seasons-')
+    names = [f"{2023 - i}-{(24 - i) % 100:02d}" for i in range(args.seasons)]
+    current = os.path.join(directory, 'current.db')
+    history = sqlite3.connect(os.path.join(directory, 'history.db'))
+    history.execute('CREATE TABLE history (Season TEXT, Player TEXT, Team TEXT, Goals INTEGER, Penalties INTEGER, '
+                    'Minutes INTEGER, Matches INTEGER, Country TEXT)')
+
+    for i, season in enumerate(names):
+        source = os.path.join(directory, f"synth-{season}.db")
+        subprocess.run([sys.executable, os.path.join(ROOT, 'synth.py'), '--scale', args.scale, '--output', source,
+                        '--seed', str(42 + i)], check=True, stdout=subprocess.DEVNULL)
+        conn = sqlite3.connect(source)
+        history.executemany('INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            ((season, *row) for row in conn.execute(SCAN)))
+        conn.close()
+        if i == 0:
+            os.replace(source, current)
+        else:
+            seasons.archive(source, os.path.join(directory, 'seasons', f"{season}.db"))
+            os.remove(source)
+    history.execute('CREATE INDEX history_season_goals ON history (Season, Goals)')
+    history.execute('CREATE INDEX history_goals ON history (Goals)')
+    history.commit()
+
+    registry = seasons.Seasons(names[0], os.path.join(directory, 'seasons'))
+    conn = sqlite3.connect(current, uri=True)
+    archived = registry.pool(names[-1]).acquire()
+    archived.row_factory = None  # Plain tuples, like conn
+    players = conn.execute('SELECT COUNT(*) FROM player_top_scorers').fetchone()[0]
+    total = history.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+    print(f"{args.seasons} seasons of about {players} players, {total} rows in history")
+
+    start = time.perf_counter()
+    seasons.rankings(registry, conn, names, 'player_top_scorers', 'Goals', args.n)
+    print(f"first cross-season query, attaching {args.seasons - 1} archives: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def history_rankings():
+        history.execute('SELECT Season, Player, Goals FROM history ORDER BY Goals DESC, Season DESC, Player LIMIT ?',
+                        (args.n,)).fetchall()
+
+    def history_career():
+        history.execute('SELECT Player, SUM(Goals) FROM history GROUP BY Player ORDER BY 2 DESC, Player LIMIT ?',
+                        (args.n,)).fetchall()
+
+    rows = [
+        ('scan current season', timed(args.runs, lambda: conn.execute(SCAN).fetchall()),
+         timed(args.runs, lambda: history.execute(SCAN.replace('player_top_scorers', 'history WHERE Season = ?'),
+                                                  (names[0],)).fetchall())),
+        ('scan archived season', timed(args.runs, lambda: archived.execute(SCAN).fetchall()),
+         timed(args.runs, lambda: history.execute(SCAN.replace('player_top_scorers', 'history WHERE Season = ?'),
+                                                  (names[-1],)).fetchall())),
+        (f'top {args.n} over all seasons',
+         timed(args.runs, seasons.rankings, registry, conn, names, 'player_top_scorers', 'Goals', args.n),
+         timed(args.runs, history_rankings)),
+        (f'career top {args.n}',
+         timed(max(1, args.runs // 10), seasons.rankings, registry, conn, names, 'player_top_scorers', 'Goals', args.n, 'sum'),
+         timed(max(1, args.runs // 10), history_career)),
+    ]
+
+    print(f"{'':<26} {'seasons p50':>12} {'p95':>8} {'history p50':>12} {'p95':>8}")
+    for name, (p50, p95), (history_p50, history_p95) in rows:
+        print(f"{name:<26} {p50:>12.2f} {p95:>8.2f} {history_p50:>12.2f} {history_p95:>8.2f}")
+
+    conn.close()
+    history.close()
+    registry.close()
+    shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
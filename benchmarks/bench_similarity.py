@@ -0,0 +1,144 @@
+"""
+Similar-players queries at 100k players.
+
+Builds (or reuses) a synthetic database with benchmarks/synth.py and times
+the similarity index from similarity.py against it:
+  - build: reading every player's features and standardizing the matrix
+  - query: one player's k nearest neighbours, unfiltered and with a team or country filter
+  - batch: the k nearest of --batch players in one similar_many() call, per player
+  - refresh: the next query after --writes players were updated, i.e. the incremental path
+"before" is the same query done the way the app's per-table routes work:
+fetchall() on the four player tables and a Python loop over the merged rows.
+
+Usage (from the repository root):
+    python benchmarks/bench_similarity.py [--database /tmp/bundesliga-100k.db] [--queries 200]
+"""
+
+import argparse
+import math
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROOT))
+
+import migrations  # noqa: E402
+import similarity  # noqa: E402
+
+PLAYERS_PER_SCALE = 260  # About one league season of players, see synth.py
+
+
+def naive_similar(conn, name, k):
+    """ k nearest neighbours with per-table fetchall() and Python loops. """
+    players = {}
+    for table in migrations.PLAYER_TABLES:
+        cursor = conn.execute(f"SELECT * FROM {table}")
+        columns = [d[0] for d in cursor.description]
+        for row in cursor.fetchall():
+            players.setdefault(row[0], {}).update(zip(columns, row))
+
+    features = [column for column, _ in similarity.FEATURES]
+    vectors = {player: [row.get(column) for column in features] for player, row in players.items()}
+    stats = []
+    for i in range(len(features)):
+        values = [v[i] for v in vectors.values() if v[i] is not None]
+        mean = sum(values) / len(values) if values else 0.0
+        std = math.sqrt(sum((x - mean) ** 2 for x in values) / len(values)) if values else 1.0
+        stats.append((mean, std or 1.0))
+
+    def z(vector):
+        return [0.0 if x is None else (x - mean) / std for x, (mean, std) in zip(vector, stats)]
+
+    target = z(vectors[name])
+    distances = []
+    for player, vector in vectors.items():
+        if player != name:
+            distances.append((math.dist(target, z(vector)), player))
+    return sorted(distances)[:k]
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='Synthetic database to use, built with synth.py if it does not exist')
+    parser.add_argument('--players', type=int, default=100000, help='Players to generate when building the database')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--naive', type=int, default=3, help='Queries for the fetchall() baseline')
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.gettempdir(), f"bundesliga-{args.players // 1000}k.db")
+    if not os.path.exists(database):
+        scale = max(1, round(args.players / PLAYERS_PER_SCALE))
+        subprocess.run([sys.executable, os.path.join(ROOT, 'synth.py'), '--scale', str(scale), '--output', database],
+                       check=True, stdout=subprocess.DEVNULL)
+
+    # The refresh step writes, so work on a copy
+    copy = os.path.join(tempfile.mkdtemp(prefix='bench-similarity-'), 'bench.db')
+    shutil.copyfile(database, copy)
+    conn = sqlite3.connect(copy)
+    names = [row[0] for row in conn.execute('SELECT Player FROM players')]
+    index = similarity.SimilarityIndex(os.path.dirname(copy))
+    build_ms, _ = timed(index.rebuild, conn)
+    build_ms += timed(index.similar, conn, names[0], args.k)[0]  # The first query standardizes the matrix
+    teams = [row[0] for row in conn.execute('SELECT Team FROM teams')]
+    countries = [row[0] for row in conn.execute('SELECT DISTINCT Country FROM players WHERE Country IS NOT NULL')]
+    print(f"{len(index)} players, {len(similarity.FEATURES)} features, built in {build_ms:.0f} ms "
+          f"(memory-mapped in {index.directory})")
+
+    rng = random.Random(42)
+    picks = [rng.choice(names) for _ in range(args.queries)]
+    rows = []
+
+    rows.append(('query', summary([timed(index.similar, conn, name, args.k)[0] for name in picks])))
+    rows.append(('query ?team=', summary([timed(index.similar, conn, name, args.k, team=rng.choice(teams))[0]
+                                          for name in picks])))
+    rows.append(('query ?country=', summary([timed(index.similar, conn, name, args.k, country=rng.choice(countries))[0]
+                                             for name in picks])))
+
+    batches = [picks[i:i + args.batch] for i in range(0, len(picks), args.batch)]
+    per_player = [timed(index.similar_many, conn, batch, args.k)[0] / len(batch) for batch in batches]
+    rows.append((f'batch of {args.batch} (per player)', summary(per_player)))
+
+    refresh = []
+    for _ in range(5):
+        for name in rng.sample(names, args.writes):
+            conn.execute('UPDATE player_top_scorers SET Goals = Goals + 1 WHERE Player = ?', (name,))
+        conn.commit()
+        refresh.append(timed(index.similar, conn, picks[0], args.k)[0])
+    rows.append((f'query after {args.writes} writes', summary(refresh)))
+
+    naive = [timed(naive_similar, conn, name, args.k)[0] for name in picks[:args.naive]]
+    rows.append(('before: fetchall + loop', summary(naive)))
+
+    print(f"{'':<28} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, (p50, p95) in rows:
+        print(f"{name:<28} {p50:>9.2f} {p95:>9.2f}")
+    print(f"query speedup over fetchall + loop: {rows[-1][1][0] / rows[0][1][0]:.0f}x")
+
+    conn.close()
+    shutil.rmtree(os.path.dirname(copy))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
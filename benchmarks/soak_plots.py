@@ -0,0 +1,84 @@
+"""
+Soak test for plot rendering: memory must stay flat over many renders.
+
+Renders stat and scatter plots back to back in this process with the same
+functions the render pool runs, sampling resident memory as it goes. It exits
+non-zero if RSS at the end has grown more than --tolerance-mb above the level
+reached after warm-up, which is what happened when figures were never closed.
+
+Usage (from the repository root):
+    python benchmarks/soak_plots.py [--renders 10000] [--tolerance-mb 20]
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import plots  # noqa: E402
+import stats  # noqa: E402
+
+
+def rss_mb():
+    """ Current resident set size in MB (peak RSS where /proc is unavailable). """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=200, help='Renders before the baseline RSS is taken')
+    parser.add_argument('--tolerance-mb', type=float, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    players = 300
+    stats_dict = {
+        'Goals': [rng.randint(0, 30) for _ in range(players)],
+        'Penalties': [rng.randint(0, 6) for _ in range(players)],
+        'Minutes': [rng.randint(90, 3060) for _ in range(players)],
+        'Matches': [rng.randint(1, 34) for _ in range(players)],
+    }
+
+    columns = list(stats_dict)
+    summary = stats.TableSummary(columns, np.column_stack([stats_dict[column] for column in columns]).astype(float))
+
+    baseline = None
+    start = time.perf_counter()
+    for i in range(1, args.renders + 1):
+        if i % 2:
+            selected = stats.STATS[i % len(stats.STATS)]
+            plots.render_stat_plot(summary.stat(selected), selected)
+        else:
+            plots.render_scatter_plot(stats_dict['Minutes'], stats_dict['Goals'])
+
+        if i == args.warmup:
+            baseline = rss_mb()
+        if i % 500 == 0:
+            print(f"{i:>7} renders  {rss_mb():8.1f} MB  {i / (time.perf_counter() - start):6.1f} renders/s")
+
+    final = rss_mb()
+    baseline = baseline if baseline is not None else final
+    growth = final - baseline
+    print(f"RSS after warm-up {baseline:.1f} MB, after {args.renders} renders {final:.1f} MB (+{growth:.1f} MB)")
+    if growth > args.tolerance_mb:
+        print(f"FAIL: memory grew more than {args.tolerance_mb} MB")
+        return 1
+    print("OK: memory stayed flat")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Cold-start import budget for app.py.
+
+Imports the app in a fresh interpreter under `python -X importtime`, prints the
+slowest modules and exits non-zero if the cumulative import time of `app`
+exceeds Config.STARTUP_IMPORT_BUDGET_MS, or if a module that should load
+lazily (the plotting and statistics stack) was imported at startup.
+
+Usage (from the repository root):
+    python benchmarks/startup_budget.py [--budget-ms 600] [--runs 3] [--top 15]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config  # noqa: E402
+
+# Packages that must only be imported on first use, never when the app starts
+LAZY_PACKAGES = ['matplotlib', 'numpy', 'seaborn', 'plots', 'stats']
+
+LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def import_times():
+    """ Import app in a fresh interpreter. Returns {module: (self us, cumulative us)} for top-level imports by name. """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"Importing app failed:\n{proc.stderr}")
+
+    modules = {}
+    for match in LINE.finditer(proc.stderr):
+        self_us, cumulative_us, _, name = match.groups()
+        modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=Config.STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=3, help='Best of N runs is compared to the budget')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    best = min(runs, key=lambda modules: modules['app'][1])
+    total_ms = best['app'][1] / 1000
+
+    print(f"{'module':<40}{'self ms':>10}{'cumulative ms':>16}")
+    slowest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{name:<40}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}")
+
+    failed = False
+    eager = sorted({name.split('.')[0] for name in best} & set(LAZY_PACKAGES))
+    if eager:
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+
+    print(f"\nCold import of app: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    if total_ms > args.budget_ms:
+        print("FAIL: over budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
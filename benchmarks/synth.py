@@ -0,0 +1,209 @@
+"""
+Synthetic Bundesliga data for benchmarks.
+
+Builds a database with the app's eight tables at a multiple of the real data
+(18 teams and about 260 players per league season). Scale N generates N league
+seasons: up to 50 seasons back from 2023-24, with extra divisions per season
+beyond that. The data is internally consistent:
+  - every player belongs to a generated team and has the same Team, Minutes,
+    Matches and Country in every table they appear in
+  - every player is in player_top_scorers and player_expected_goals; subsets
+    are in player_ratings and player_tackles_won, like the real data
+  - a team's Total_Goals_Scored is the sum of its players' goals
+
+The same seed always produces the same database. The rows are written to the
+eight tables as Bundesliga.db originally shipped them and migrations.py is
+applied afterwards (which moves them to the normalized tables), so the result
+is ready to serve. 10000x is about 2.6 million players per table and takes
+several minutes and a few GB of disk.
+
+Usage (from the repository root):
+    python benchmarks/synth.py --scale 100 --output /tmp/bundesliga-100x.db [--seed 42]
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations  # noqa: E402
+
+SCALES = {'1x': 1, '100x': 100, '10000x': 10000}
+
+TEAMS_PER_LEAGUE = 18
+PLAYERS_PER_TEAM = (12, 17)  # Real data averages about 14.4 listed players per team
+MATCHES = 34
+MAX_SEASONS = 50
+BATCH_SIZE = 10000
+
+PREFIXES = ['FC', 'SV', 'VfB', 'VfL', 'TSG', 'SC', 'FSV', '1. FC', 'Borussia', 'Eintracht',
+            'Fortuna', 'Union', 'Rot-Weiss', 'Arminia', 'Kickers', 'Alemannia']
+CITIES = ['Aachen', 'Augsburg', 'Berlin', 'Bielefeld', 'Bochum', 'Bonn', 'Bremen', 'Darmstadt',
+          'Dortmund', 'Dresden', 'Duisburg', 'Düsseldorf', 'Essen', 'Frankfurt', 'Freiburg',
+          'Fürth', 'Gelsenkirchen', 'Hamburg', 'Hannover', 'Heidenheim', 'Hoffenheim', 'Kaiserslautern',
+          'Karlsruhe', 'Kiel', 'Köln', 'Leipzig', 'Leverkusen', 'Magdeburg', 'Mainz', 'Mannheim',
+          'München', 'Münster', 'Nürnberg', 'Offenbach', 'Osnabrück', 'Paderborn', 'Regensburg',
+          'Rostock', 'Saarbrücken', 'Sandhausen', 'Stuttgart', 'Ulm', 'Wiesbaden', 'Wolfsburg', 'Würzburg']
+FIRST_NAMES = ['Florian', 'Jamal', 'Kai', 'Leroy', 'Joshua', 'Thomas', 'Serge', 'Niclas', 'Julian',
+               'Jonas', 'Timo', 'Leon', 'Maximilian', 'Lukas', 'Felix', 'Marco', 'Robin', 'David',
+               'Alejandro', 'Exequiel', 'Victor', 'Harry', 'Granit', 'Jeremie', 'Omar', 'Loïs',
+               'Deniz', 'Ermedin', 'Chris', 'Tim', 'Mats', 'Manuel', 'Kevin', 'Jan', 'Nico', 'Dani']
+LAST_NAMES = ['Wirtz', 'Musiala', 'Havertz', 'Sané', 'Kimmich', 'Müller', 'Gnabry', 'Füllkrug',
+              'Brandt', 'Hofmann', 'Werner', 'Goretzka', 'Schmid', 'Kruse', 'Reus', 'Raum',
+              'Grimaldo', 'Palacios', 'Boniface', 'Kane', 'Xhaka', 'Frimpong', 'Marmoush', 'Openda',
+              'Undav', 'Demirović', 'Führich', 'Guirassy', 'Adeyemi', 'Kleindienst', 'Beier', 'Gruda',
+              'Baumgartl', 'Kramer', 'Neuhaus', 'Stach', 'Tah', 'Andrich', 'Henrichs', 'Baumann']
+COUNTRIES = ['GER'] * 10 + ['AUT', 'SUI', 'FRA', 'ESP', 'NED', 'BEL', 'DEN', 'CRO', 'POL', 'ENG',
+                            'ARG', 'BRA', 'JPN', 'KOR', 'USA', 'CAN', 'NGA', 'SEN', 'CIV', 'EGY']
+
+TABLES = list(migrations.PLAYER_TABLES) + list(migrations.TEAM_TABLES)
+
+# The eight tables as shipped in Bundesliga.db before any migration
+PLAYER_COLUMNS = {
+    'player_expected_goals': ['Expected_Goals', 'Goals'],
+    'player_ratings': ['FotMob_Rating', 'Player_Match_Awards'],
+    'player_tackles_won': ['Tackles_per_90', 'Tackle_Success_Rate'],
+    'player_top_scorers': ['Goals', 'Penalties'],
+}
+TEAM_COLUMNS = {
+    'possession_percentage_team': ['Possession_Percentage'],
+    'team_goals_per_match': ['Goals_per_Match', 'Total_Goals_Scored'],
+    'team_ratings': ['FotMob_Team_Rating'],
+    'total_red_card_team': ['Red_Cards', 'Yellow_Cards'],
+}
+
+
+def create_schema(conn):
+    """ Create the eight data tables with their original definitions. """
+    for table, metrics in PLAYER_COLUMNS.items():
+        columns = [('Player', 'TEXT'), ('Team', 'TEXT')] + [(column, 'INTEGER') for column in metrics] + \
+                  [('Minutes', 'INTEGER'), ('Matches', 'INTEGER'), ('Country', 'TEXT')]
+        conn.execute(f"CREATE TABLE {table} ({', '.join(f'{name} {kind}' for name, kind in columns)})")
+    for table, metrics in TEAM_COLUMNS.items():
+        columns = [('Team', 'TEXT')] + [(column, 'INTEGER') for column in metrics] + [('Matches', 'INTEGER')]
+        conn.execute(f"CREATE TABLE {table} ({', '.join(f'{name} {kind}' for name, kind in columns)})")
+
+
+def club_name(index):
+    """ Unique club name for every index, the real-looking ones first. """
+    prefix = PREFIXES[index % len(PREFIXES)]
+    city = CITIES[(index // len(PREFIXES)) % len(CITIES)]
+    generation = index // (len(PREFIXES) * len(CITIES))
+    return f"{prefix} {city}" if generation == 0 else f"{prefix} {city} {generation + 1}"
+
+
+def leagues(scale):
+    """ (season label, division) of each generated league season. """
+    seasons = min(scale, MAX_SEASONS)
+    for league in range(scale):
+        start = 2023 - league % seasons
+        yield f"{start}-{(start + 1) % 100:02d}", league // seasons
+
+
+def generate(conn, scale, seed):
+    """ Fill the tables and return the number of rows written to each. """
+    rng = random.Random(seed)
+    counts = dict.fromkeys(TABLES, 0)
+    names = set()
+    pending = {table: [] for table in TABLES}
+
+    def add(table, row):
+        pending[table].append(row)
+        if len(pending[table]) >= BATCH_SIZE:
+            flush(table)
+
+    def flush(table):
+        rows = pending[table]
+        if rows:
+            placeholders = ', '.join('?' for _ in rows[0])
+            conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            counts[table] += len(rows)
+            pending[table] = []
+
+    for season, division in leagues(scale):
+        for slot in range(TEAMS_PER_LEAGUE):
+            team = f"{club_name(division * TEAMS_PER_LEAGUE + slot)} {season}"
+            strength = rng.gauss(0, 1)
+            total_goals = 0
+
+            for _ in range(rng.randint(*PLAYERS_PER_TEAM)):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                if name in names:
+                    name = f"{name} {len(names)}"
+                names.add(name)
+
+                matches = rng.randint(5, MATCHES)
+                minutes = matches * rng.randint(25, 90)
+                country = rng.choice(COUNTRIES)
+                attacking = max(rng.gauss(0.25, 0.2) + strength * 0.05, 0.0)
+                goals = int(rng.expovariate(1) * attacking * minutes / 90 + 0.5)
+                penalties = min(goals, rng.randint(0, 3) if goals > 3 else 0)
+                expected_goals = round(max(goals * rng.uniform(0.7, 1.3) + rng.uniform(-0.5, 0.5), 0.0), 1)
+                total_goals += goals
+
+                add('player_top_scorers', (name, team, goals, penalties, minutes, matches, country))
+                add('player_expected_goals', (name, team, expected_goals, goals, minutes, matches, country))
+                if rng.random() < 0.82:
+                    rating = round(min(max(rng.gauss(6.9, 0.35) + strength * 0.1, 5.5), 8.5), 2)
+                    add('player_ratings', (name, team, rating, rng.randint(0, 5), minutes, matches, country))
+                if rng.random() < 0.87:
+                    add('player_tackles_won', (name, team, round(rng.uniform(0.2, 3.5), 1),
+                                               round(rng.uniform(40, 80), 1), minutes, matches, country))
+
+            add('team_ratings', (team, round(min(max(6.8 + strength * 0.2, 6.2), 7.6), 2), MATCHES))
+            add('team_goals_per_match', (team, round(total_goals / MATCHES, 2), total_goals, MATCHES))
+            add('possession_percentage_team', (team, round(min(max(50 + strength * 5, 38), 65)), MATCHES))
+            add('total_red_card_team', (team, rng.randint(0, 8), rng.randint(40, 95), MATCHES))
+
+    for table in TABLES:
+        flush(table)
+    return counts
+
+
+def build(path, scale, seed=42):
+    """ Write a fresh synthetic database to path. Returns rows per table. """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        # Nothing to protect until the file is complete
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        create_schema(conn)
+        with conn:
+            counts = generate(conn, scale, seed)
+        # The normalized tables, views, triggers and the search index, as the app expects
+        conn.execute('PRAGMA journal_mode=WAL')
+        migrations.migrate(conn)
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='1x', help=f"One of {', '.join(SCALES)} or any multiplier, e.g. 10")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    scale = SCALES.get(args.scale) or int(args.scale.rstrip('x'))
+    start = time.perf_counter()
+    counts = build(args.output, scale, args.seed)
+    for table, count in counts.items():
+        print(f"{table:<28} {count:>10}")
+    seasons = min(scale, MAX_SEASONS)
+    print(f"{scale} league seasons ({seasons} seasons x {math.ceil(scale / seasons)} divisions) "
+          f"written to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
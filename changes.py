@@ -0,0 +1,77 @@
+"""
+Reading the change log.
+
+Triggers record the Player/Team key of every row written to the eight data
+tables in change_log (see migrations.py). In-memory structures such as the
+leaderboards remember the last sequence number they have seen and refresh
+only the keys written since then. That works across worker processes too,
+whichever worker did the write. ChangeFollower implements that bookkeeping.
+"""
+
+import threading
+
+# Past this many changed keys a full rebuild is cheaper than refreshing one key at a time
+REBUILD_THRESHOLD = 1000
+
+
+def latest_seq(conn):
+    """ Sequence number of the newest change, 0 if nothing has been written yet. """
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+
+
+def changed_keys(conn, since, upto, tables):
+    """
+    Keys written to any of tables with since < seq <= upto.
+    Returns None if entries after since have already been pruned, in which case the caller must rebuild.
+    """
+    oldest = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+    if oldest is not None and oldest > since + 1:
+        return None
+
+    placeholders = ', '.join('?' for _ in tables)
+    rows = conn.execute(
+        f'SELECT DISTINCT key FROM change_log WHERE seq > ? AND seq <= ? AND tbl IN ({placeholders})',
+        (since, upto, *tables),
+    )
+    return {row[0] for row in rows}
+
+
+class ChangeFollower:
+    """
+    Base class for in-memory structures derived from the data tables.
+    Subclasses set self.tables and implement _rebuild(conn) and _refresh(conn, key);
+    callers hold self._lock and call _sync(conn) before reading.
+    """
+
+    def __init__(self, tables):
+        self.tables = tables  # Tables the structure is derived from; changes to any of them refresh it
+        self._seq = None
+        self._lock = threading.Lock()
+
+    def _sync(self, conn):
+        # Read the sequence number first, so changes made while we read are applied again next time
+        latest = latest_seq(conn)
+        if self._seq is None:
+            self._rebuild(conn)
+        elif latest > self._seq:
+            keys = changed_keys(conn, self._seq, latest, self.tables)
+            if keys is None or len(keys) > REBUILD_THRESHOLD:
+                self._rebuild(conn)
+            else:
+                for key in keys:
+                    self._refresh(conn, key)
+        # A connection to an older snapshot (e.g. a replica being replaced) must not move us back
+        if self._seq is None or latest > self._seq:
+            self._seq = latest
+
+    def rebuild(self, conn):
+        """ Discard the in-memory state and rebuild it from the tables. """
+        with self._lock:
+            self._seq = None
+            self._sync(conn)
+
+    def _rebuild(self, conn):
+        raise NotImplementedError
+
+    def _refresh(self, conn, key):
+        raise NotImplementedError
@@ -0,0 +1,244 @@
+"""
+Chart backends for the stats pages, and the default one: plain SVG.
+
+A backend is a module with render_stat_plot(values, selected_stat) and
+render_scatter_plot(minutes, goals) returning image bytes, plus FORMAT (the
+file extension, a key of MIMETYPES) and INLINE (True if a render is cheap
+enough to run on the request thread instead of the render pool).
+Config.CHART_BACKEND picks one from BACKENDS:
+
+    'svg'         this module: the charts are written out as SVG text with
+                  no dependencies, in well under a millisecond for the bar
+                  chart and a few for a scatter of thousands of points
+    'matplotlib'  plots.py: PNG images drawn by matplotlib's Agg canvas
+
+The SVG charts follow the matplotlib ones: the same 800x600 figure, title,
+axis labels, "nice" ticks, default colour cycle and legend. Scatter points are
+snapped to whole pixels and drawn as one path of round dots, so a point that
+lands on a pixel already drawn costs nothing and the payload stays bounded by
+the plot area rather than the number of players.
+"""
+
+import importlib
+import importlib.util
+import math
+from html import escape
+
+FORMAT = 'svg'
+INLINE = True
+
+BACKENDS = {'svg': 'charts', 'matplotlib': 'plots'}
+MIMETYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}  # By FORMAT
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# matplotlib's default colour cycle ("tab10")
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf']
+
+WIDTH, HEIGHT = 800, 600
+# Plot area, matching matplotlib's default subplot margins for an 8x6 inch figure at 100 dpi
+LEFT, RIGHT, TOP, BOTTOM = 100, 720, 72, 540
+MARGIN = 0.05  # Data margin on each side of an axis, as a fraction of its range
+FONT = 'DejaVu Sans, Bitstream Vera Sans, Arial, sans-serif'
+
+
+def image_format(image):
+    """ FORMAT of rendered image bytes, whichever backend drew them. """
+    return 'png' if image.startswith(PNG_SIGNATURE) else 'svg'
+
+
+def backend(name):
+    """ The backend module called name (see BACKENDS). Raises ValueError for unknown names. """
+    module = BACKENDS.get(name)
+    if module is None:
+        raise ValueError(f"Unknown chart backend {name!r}, use one of {', '.join(BACKENDS)}")
+    return importlib.import_module(module)
+
+
+def render_stat_plot(values, selected_stat):
+    """
+    Bar chart of the selected statistic (mean, min, max, etc.) for each column of player or team stats.
+    values maps each column to its precomputed statistic (see stats.TableSummary.stat).
+    Returns the SVG as bytes.
+    """
+    bars = [(column, _number(value)) for column, value in values.items()]
+    finite = [value for _, value in bars if value is not None]
+    low, high = min(finite + [0.0]), max(finite + [0.0])
+    low, high = _pad(low, high, keep_zero=True)
+    y = _Axis(low, high, BOTTOM, TOP)
+
+    # Bars 0.8 wide at 0, 1, 2..., with the same margins as the y axis
+    margin = MARGIN * (max(len(bars), 1) - 0.2)
+    x = _Axis(-0.4 - margin, len(bars) - 0.6 + margin, LEFT, RIGHT)
+    slot = x.scale(1) - x.scale(0)
+    elements, boxes = [], []
+    for i, (column, value) in enumerate(bars):
+        color = COLORS[i % len(COLORS)]
+        if value is not None:
+            top, base = sorted((y.scale(value), y.scale(0)))
+            left = x.scale(i) - 0.4 * slot
+            elements.append(f'<rect x="{left:.1f}" y="{top:.1f}" width="{0.8 * slot:.1f}" '
+                            f'height="{base - top:.1f}" fill="{color}"/>')
+            boxes.append((left, top, left + 0.8 * slot, base))
+
+    ticks = [(x.scale(i), column) for i, (column, _) in enumerate(bars)]
+    legend = [(COLORS[i % len(COLORS)], f"{column} ({selected_stat})", 'bar') for i, (column, _) in enumerate(bars)]
+    return _figure(
+        elements, boxes, ticks, y,
+        title=f'Visualization - {selected_stat.capitalize()} Values',
+        xlabel=None, ylabel=f'{selected_stat.capitalize()} Value', legend=legend)
+
+
+def render_scatter_plot(minutes, goals):
+    """
+    Scatter plot of Minutes Played vs Goals Scored.
+    Returns the SVG as bytes.
+    """
+    # Many players share a (minutes, goals) pair, so convert each pair once
+    points = [(_number(mx), _number(gy)) for mx, gy in set(zip(minutes, goals))]
+    points = [(mx, gy) for mx, gy in points if mx is not None and gy is not None]
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    x = _Axis(*_pad(min(xs, default=0.0), max(xs, default=1.0)), LEFT, RIGHT)
+    y = _Axis(*_pad(min(ys, default=0.0), max(ys, default=1.0)), BOTTOM, TOP)
+
+    # One dot per pixel: a zero-length segment with round caps draws a circle of the stroke width
+    x0, xs = x.scale(0), x.scale(1) - x.scale(0)
+    y0, ys = y.scale(0), y.scale(1) - y.scale(0)
+    pixels = sorted({(round(x0 + px * xs), round(y0 + py * ys)) for px, py in points})
+    path = ''.join(f'M{px} {py}h0' for px, py in pixels)
+    elements = [f'<path d="{path}" stroke="blue" stroke-opacity="0.7" stroke-width="8" stroke-linecap="round"/>'] if path else []
+    # A sample of the dots is plenty to place the legend
+    boxes = [(px, py, px, py) for px, py in pixels[::max(1, len(pixels) // 2000)]]
+
+    ticks = [(x.scale(value), label) for value, label in x.ticks(target=7)]
+    return _figure(
+        elements, boxes, ticks, y,
+        title='Minutes Played vs Goals Scored',
+        xlabel='Minutes Played', ylabel='Goals Scored', legend=[('blue', 'Minutes vs Goals', 'dot')])
+
+
+class _Axis:
+    """ Linear map from data values in [low, high] to pixels in [start, end], with tick positions. """
+
+    def __init__(self, low, high, start, end):
+        self.low, self.high = low, high
+        self.start, self.end = start, end
+
+    def scale(self, value):
+        return self.start + (value - self.low) * (self.end - self.start) / (self.high - self.low)
+
+    def ticks(self, target=9):
+        """ (value, label) pairs at a 1/2/2.5/5 x 10^n step, at most about target of them, like matplotlib. """
+        raw = (self.high - self.low) / target
+        magnitude = 10 ** math.floor(math.log10(raw))
+        step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+        decimals = next(d for d in range(10) if abs(round(step, d) - step) < 1e-9 * step)
+        first = math.ceil(self.low / step - 1e-9)
+        values = [i * step for i in range(first, math.floor(self.high / step + 1e-9) + 1)]
+        return [(value, f"{value:.{decimals}f}") for value in values]
+
+
+def _number(value):
+    """ A finite float, or None for values that cannot be drawn (None, NaN, text). """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _pad(low, high, keep_zero=False):
+    """ Axis limits with matplotlib's 5% margins; bars keep their zero baseline on the axis. """
+    if high == low:
+        low, high = low - 1, high + 1
+    span = high - low
+    padded_low = low if keep_zero and low == 0 else low - MARGIN * span
+    padded_high = high if keep_zero and high == 0 else high + MARGIN * span
+    return padded_low, padded_high
+
+
+def _text(x, y, text, size=10, anchor='middle', rotate=False):
+    transform = f' transform="rotate(-90 {x:.1f} {y:.1f})"' if rotate else ''
+    return (f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}"{transform}>'
+            f'{escape(str(text))}</text>')
+
+
+def _figure(elements, boxes, xticks, y, title, xlabel, ylabel, legend):
+    """
+    The whole SVG document: plot elements inside the axes, ticks, labels, title and legend.
+    boxes are the (x0, y0, x1, y1) pixel extents of what was drawn, for placing the legend.
+    """
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'font-family="{FONT}">',
+        f'<rect width="{WIDTH}" height="{HEIGHT}" fill="white"/>',
+        f'<svg x="{LEFT}" y="{TOP}" width="{RIGHT - LEFT}" height="{BOTTOM - TOP}" '
+        f'viewBox="{LEFT} {TOP} {RIGHT - LEFT} {BOTTOM - TOP}">',
+        *elements,
+        '</svg>',
+        f'<rect x="{LEFT}" y="{TOP}" width="{RIGHT - LEFT}" height="{BOTTOM - TOP}" fill="none" stroke="black" stroke-width="0.8"/>',
+    ]
+
+    ticks = []
+    for px, label in xticks:
+        if LEFT - 0.5 <= px <= RIGHT + 0.5:
+            ticks.append(f'M{px:.1f} {BOTTOM}v3.5')
+            parts.append(_text(px, BOTTOM + 17, label))
+    for value, label in y.ticks():
+        py = y.scale(value)
+        ticks.append(f'M{LEFT} {py:.1f}h-3.5')
+        parts.append(_text(LEFT - 6, py + 3.5, label, anchor='end'))
+    parts.append(f'<path d="{"".join(ticks)}" stroke="black" stroke-width="0.8"/>')
+
+    parts.append(_text((LEFT + RIGHT) / 2, TOP - 8, title, size=12))
+    if xlabel:
+        parts.append(_text((LEFT + RIGHT) / 2, BOTTOM + 35, xlabel))
+    if ylabel:
+        parts.append(_text(LEFT - 55, (TOP + BOTTOM) / 2, ylabel, rotate=True))
+
+    if legend:
+        width = 40 + 6 * max(len(label) for _, label, _ in legend)
+        height = 8 + 18 * len(legend)
+        left, top = _legend_corner(width, height, boxes)
+        parts.append(f'<rect x="{left}" y="{top}" width="{width}" height="{height}" rx="3" fill="white" '
+                     f'fill-opacity="0.8" stroke="#cccccc"/>')
+        for i, (color, label, marker) in enumerate(legend):
+            cy = top + 13 + 18 * i
+            if marker == 'bar':
+                parts.append(f'<rect x="{left + 8}" y="{cy - 5}" width="20" height="9" fill="{color}"/>')
+            else:
+                parts.append(f'<circle cx="{left + 18}" cy="{cy}" r="3.5" fill="{color}" fill-opacity="0.7"/>')
+            parts.append(_text(left + 34, cy + 3.5, label, anchor='start'))
+
+    parts.append('</svg>')
+    return '\n'.join(parts).encode('utf8')
+
+
+def _legend_corner(width, height, boxes):
+    """ Top-left of a legend box in the corner of the axes that hides the least of boxes, like loc='best'. """
+    corners = [(RIGHT - 8 - width, TOP + 8), (LEFT + 8, TOP + 8),
+               (LEFT + 8, BOTTOM - 8 - height), (RIGHT - 8 - width, BOTTOM - 8 - height)]
+
+    def hidden(corner):
+        left, top = corner
+        total = 0.0
+        for x0, y0, x1, y1 in boxes:
+            w = min(x1, left + width) - max(x0, left)
+            h = min(y1, top + height) - max(y0, top)
+            if w >= 0 and h >= 0:
+                total += max(w, 1) * max(h, 1)
+        return total
+
+    return min(corners, key=hidden)
+
+
+def init_app(app):
+    """
+    Check Config.CHART_BACKEND without importing it (matplotlib loads on the first plot).
+    An unavailable matplotlib falls back to SVG with a warning.
+    """
+    name = app.config.setdefault('CHART_BACKEND', 'svg')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CHART_BACKEND {name!r}, use one of {', '.join(BACKENDS)}")
+    if name == 'matplotlib' and importlib.util.find_spec('matplotlib') is None:
+        app.logger.warning("CHART_BACKEND is 'matplotlib' but matplotlib is not installed, drawing SVG charts instead")
+        app.config['CHART_BACKEND'] = 'svg'
@@ -4,3 +4,44 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'default_secret_key')  # Use an environment variable or default value
     DATABASE_URI = 'sqlite:///bundesliga.db'  # Path to your SQLite database
     SQLALCHEMY_TRACK_MODIFICATIONS = False  # Disable modification tracking in Flask-SQLAlchemy
+
+    # SQLite connection settings (see db.py)
+    DATABASE = os.environ.get('DATABASE', 'Bundesliga.db')  # Database file used by the app
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # Max pooled connections, 0 opens one per request
+    DB_TIMEOUT = 20  # Seconds to wait for a lock or a free pooled connection
+    DB_CACHE_SIZE_KIB = 16384  # Page cache per connection (PRAGMA cache_size)
+    DB_MMAP_SIZE = 64 * 1024 * 1024  # Bytes of the file to memory-map (PRAGMA mmap_size)
+    DB_STATEMENT_CACHE = 256  # Prepared statements kept per connection
+    AUTO_MIGRATE = True  # Apply pending schema migrations (migrations.py) at startup
+    PLOT_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Memory budget for cached plot images (see plot_cache.py)
+    PLOT_CACHE_DIR = os.environ.get('PLOT_CACHE_DIR')  # Optional directory to persist plots across restarts
+    PLOT_CACHE_MAX_DISK_BYTES = 256 * 1024 * 1024  # Size limit for PLOT_CACHE_DIR
+    PLOT_MAX_AGE = 31536000  # Cache-Control max-age for /plots images, safe because digests change with the data
+    PLOT_WORKERS = int(os.environ.get('PLOT_WORKERS', 2))  # Render processes for plots, 0 renders inline (see plots.py)
+    CHART_BACKEND = os.environ.get('CHART_BACKEND', 'svg')  # 'svg' (charts.py, no dependencies) or 'matplotlib' (plots.py)
+    PLOT_QUEUE_SIZE = 16  # Max pending plot renders before new plots are skipped
+    PLOT_RENDER_TIMEOUT = 10  # Seconds /plots waits for a render before answering 503
+    STARTUP_IMPORT_BUDGET_MS = 600  # Cold 'import app' budget checked by benchmarks/startup_budget.py
+    PAGE_SIZE = 50  # Rows per page on /players_data and /teams_data
+    MAX_PAGE_SIZE = 500  # Upper limit for ?page_size=
+    INGEST_BATCH_SIZE = 1000  # Rows validated and written per executemany batch (see ingest.py)
+    IMPORT_TIMEOUT = 300  # Seconds POST /import waits for the writer thread to apply the import
+    SEARCH_PAGE_SIZE = 25  # Results per page for /query name/team/country searches
+    METRICS_ENABLED = True  # Time requests, SQL statements, templates and plots for /metrics (see metrics.py)
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))  # Statements slower than this are logged with their query plan
+    WRITER_MAX_BATCH = 64  # Most mutation jobs applied in one group commit (see writer.py)
+    WRITER_COMMIT_DELAY_MS = 2  # How long the writer waits for more jobs before committing a batch
+    WRITER_TIMEOUT = 30  # Seconds a request waits for its write to be committed
+    READ_REPLICA = os.environ.get('READ_REPLICA', '0') == '1'  # Serve read-only routes from an in-memory copy (see replica.py)
+    REPLICA_CHECK_INTERVAL_MS = 0  # Min time between staleness checks of the replica, 0 checks on every request
+    PAGE_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Memory budget for rendered data pages (see page_cache.py)
+    PAGE_CACHE_CHECK_INTERVAL_MS = 0  # Min time between data_version checks for the page cache, 0 checks on every request
+    SIMILARITY_DIR = os.environ.get('SIMILARITY_DIR')  # Directory for the memory-mapped similar-players matrix, a temporary one if unset
+    CURRENT_SEASON = os.environ.get('CURRENT_SEASON', '2023-24')  # Season stored in DATABASE, the only one that is written
+    SEASONS_DIR = os.environ.get('SEASONS_DIR', 'seasons')  # Archived seasons as <season>.db, opened read-only (see seasons.py)
+    SEASON_POOL_SIZE = 4  # Max pooled connections per archived season
+    ASSETS_AUTO_BUILD = True  # Fingerprint and precompress changed static files at startup (see assets.py)
+    ASSET_MAX_AGE = 31536000  # Cache-Control max-age for fingerprinted static files, safe because their names change with them
+    COMPRESS_MIN_BYTES = 1024  # Smaller responses are sent uncompressed
+    COMPRESS_LEVEL = 6  # gzip level for responses compressed on the fly
+    BROTLI_QUALITY = 5  # brotli quality for responses compressed on the fly (needs the optional brotli package)
@@ -0,0 +1,180 @@
+"""
+Database connection management for the Bundesliga app.
+
+Connections are opened once, tuned with the PRAGMAs below and kept in a
+bounded pool. A request borrows a connection on its first get_db() call and
+hands it back when the Flask app context is torn down, so every route in a
+request shares the same connection.
+"""
+
+import queue
+import sqlite3
+import threading
+
+from flask import current_app, g
+
+import metrics
+
+
+class ConnectionPool:
+    """ Bounded pool of pre-tuned SQLite connections to a single database file. """
+
+    def __init__(self, database, size=8, timeout=20, cache_size_kib=16384,
+                 mmap_size=64 * 1024 * 1024, statement_cache=256, factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.statement_cache = statement_cache
+        self.factory = factory  # Connection class, e.g. metrics.InstrumentedConnection
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def connect(self):
+        """ Open and tune a new connection. Settings are applied once per connection. """
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            cached_statements=self.statement_cache,
+            check_same_thread=False,  # Connections move between request threads
+            factory=self.factory,
+            uri=True,  # Plain file names still work; file: URIs let seasons.py ATTACH archives immutable
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{self.cache_size_kib}')
+        conn.execute(f'PRAGMA mmap_size={self.mmap_size}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self):
+        """ Borrow a connection, opening a new one while the pool is below its size. """
+        if self.size <= 0:
+            return self.connect()
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self.connect()
+            except sqlite3.Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled database connection")
+
+    def release(self, conn):
+        """ Return a connection to the pool, discarding any unfinished transaction. """
+        if self.size <= 0:
+            conn.close()
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped so a fresh one can take its place
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+
+        self._idle.put(conn)
+
+    def close(self):
+        """ Close every idle connection. """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def create_pool(config):
+    """ Build a connection pool from the app's config. """
+    return ConnectionPool(
+        config.get('DATABASE', 'Bundesliga.db'),
+        size=config.get('DB_POOL_SIZE', 8),
+        timeout=config.get('DB_TIMEOUT', 20),
+        cache_size_kib=config.get('DB_CACHE_SIZE_KIB', 16384),
+        mmap_size=config.get('DB_MMAP_SIZE', 64 * 1024 * 1024),
+        statement_cache=config.get('DB_STATEMENT_CACHE', 256),
+        factory=metrics.InstrumentedConnection if config.get('METRICS_ENABLED', True) else sqlite3.Connection,
+    )
+
+
+def init_app(app):
+    """ Create the connection pool for the app and release connections on teardown. """
+    app.extensions['db_pool'] = create_pool(app.config)
+    app.teardown_appcontext(release_db)
+
+
+def get_db():
+    """ Connection bound to the current app context, borrowed from the pool on first use. """
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
+
+
+def get_read_db():
+    """
+    Connection for read-only routes: the archived season's when the request selected one
+    (see seasons.py), the in-memory replica's when READ_REPLICA is on (see replica.py),
+    otherwise the same connection as get_db().
+    """
+    archive = g.get('archive')
+    if archive is not None:
+        if 'archive_db' not in g:
+            g.archive_db = archive.acquire()
+        return g.archive_db
+    replica = current_app.extensions.get('replica')
+    if replica is None:
+        return get_db()
+    if 'read_db' not in g:
+        g.read_db = replica.acquire()
+    return g.read_db[0]
+
+
+def release_db(exception=None):
+    """ Hand the app context's connections back to the pool, the replica and the season archive. """
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        current_app.extensions['replica'].release(*read_db)
+    archive_db = g.pop('archive_db', None)
+    if archive_db is not None:
+        g.archive.release(archive_db)
+
+
+def table_version(conn, table):
+    """ Version counter of a table, bumped by triggers on every row written (see migrations.py). """
+    row = conn.execute('SELECT version FROM table_versions WHERE name = ?', (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def table_versions(conn, tables):
+    """ Version counters of several tables, in the order given. """
+    placeholders = ', '.join('?' for _ in tables)
+    rows = dict(conn.execute(f'SELECT name, version FROM table_versions WHERE name IN ({placeholders})', tables).fetchall())
+    return tuple(rows.get(table, 0) for table in tables)
@@ -0,0 +1,262 @@
+"""
+Derived metrics: per-90 rates, xG over/under-performance, penalty share,
+discipline rates and rating percentile within team.
+
+Each metric is declared once below as a SQL expression over one player's (or
+team's) joined rows, window functions included. They are computed in bulk by
+one INSERT ... SELECT and stored in player_derived_stats/team_derived_stats,
+one row per player/team with an index on every metric. The views
+player_derived_metrics and team_derived_metrics give them the shape of the
+eight tables (name, Team, metrics, Minutes, Matches, Country), so the stats
+pages, /query and the filter API treat them as two more tables, and sorting
+or filtering on a metric is an index search like on any base column.
+
+Triggers keep the stored rows current within the writing transaction. A
+write to a player recomputes the player's team: the percentile within team is
+a window over the team, so a team is the smallest unit that can be recomputed
+exactly, and it is small. Rows whose values did not change are not written,
+so table versions and the change log only move for players whose metrics did.
+Bulk imports drop the triggers and refresh every row once at the end (see
+ingest.py), as they do with the indexes.
+
+To add a metric, append it to PLAYER_METRICS or TEAM_METRICS and add a
+migration that calls recreate(conn).
+"""
+
+import click
+
+import db
+
+PLAYER_VIEW = 'player_derived_metrics'
+TEAM_VIEW = 'team_derived_metrics'
+
+PLAYER_SOURCE = '''
+    FROM players p
+    LEFT JOIN player_goal_stats g ON g.player_id = p.id
+    LEFT JOIN player_xg_stats x ON x.player_id = p.id
+    LEFT JOIN player_rating_stats r ON r.player_id = p.id
+'''
+TEAM_SOURCE = '''
+    FROM teams t
+    LEFT JOIN team_card_stats c ON c.team_id = t.id
+'''
+
+# (column, SQL expression over PLAYER_SOURCE/TEAM_SOURCE). Ratios are NULL where the denominator is 0 or missing.
+PLAYER_METRICS = [
+    ('Goals_per_90', 'g.Goals * 90.0 / NULLIF(p.Minutes, 0)'),
+    ('Expected_Goals_per_90', 'x.Expected_Goals * 90.0 / NULLIF(p.Minutes, 0)'),
+    # Positive for players who scored more than their chances were worth
+    ('Goals_minus_xG', 'x.Goals - x.Expected_Goals'),
+    ('Penalty_Share', 'g.Penalties * 1.0 / NULLIF(g.Goals, 0)'),
+    # 0 for the lowest rated player of a team, 100 for the highest
+    ('Rating_Percentile_in_Team', 'CASE WHEN r.FotMob_Rating IS NOT NULL THEN 100.0 * PERCENT_RANK() OVER ('
+                                  'PARTITION BY p.team_id, r.FotMob_Rating IS NULL ORDER BY r.FotMob_Rating) END'),
+]
+TEAM_METRICS = [
+    ('Cards_per_Match', '(c.Yellow_Cards + c.Red_Cards) * 1.0 / NULLIF(t.Matches, 0)'),
+    ('Yellow_Cards_per_Match', 'c.Yellow_Cards * 1.0 / NULLIF(t.Matches, 0)'),
+    ('Red_Cards_per_Match', 'c.Red_Cards * 1.0 / NULLIF(t.Matches, 0)'),
+]
+DECIMALS = 3  # Stored values are rounded, so recomputing a row from the same inputs never rewrites it
+
+# Fact tables the metrics read, besides players/teams themselves
+PLAYER_INPUTS = ['player_goal_stats', 'player_xg_stats', 'player_rating_stats']
+TEAM_INPUTS = ['team_card_stats']
+
+# kind -> (stored table, view, key column, entity table, alias, foreign key, metrics, source)
+KINDS = {
+    'players': ('player_derived_stats', PLAYER_VIEW, 'Player', 'players', 'p', 'player_id', PLAYER_METRICS, PLAYER_SOURCE),
+    'teams': ('team_derived_stats', TEAM_VIEW, 'Team', 'teams', 't', 'team_id', TEAM_METRICS, TEAM_SOURCE),
+}
+
+COLUMNS = {column for column, _ in PLAYER_METRICS + TEAM_METRICS}
+
+
+def view_columns(view):
+    """ Columns of a derived view in order, or None for any other name. """
+    if view == PLAYER_VIEW:
+        return ['Player', 'Team'] + [column for column, _ in PLAYER_METRICS] + ['Minutes', 'Matches', 'Country']
+    if view == TEAM_VIEW:
+        return ['Team'] + [column for column, _ in TEAM_METRICS] + ['Matches']
+    return None
+
+
+def refresh_sql(kind, scope):
+    """
+    Statement that recomputes the stored metrics of the players (or teams) matching scope, a condition
+    over the source query, and writes the rows that changed. For players, scope must cover whole teams
+    so the windows see every teammate.
+    """
+    table, _, _, _, alias, fk, metrics, source = KINDS[kind]
+    columns = [column for column, _ in metrics]
+    values = ', '.join(f'ROUND({expression}, {DECIMALS})' for _, expression in metrics)
+    return f'''
+        INSERT INTO {table} ({fk}, {', '.join(columns)})
+        SELECT {alias}.id, {values} {source}
+        WHERE {scope}
+        ON CONFLICT ({fk}) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in columns)}
+        WHERE {' OR '.join(f'{column} IS NOT excluded.{column}' for column in columns)}
+    '''
+
+
+def _team_of(player_id):
+    return f'p.team_id IS (SELECT team_id FROM players WHERE id = {player_id})'
+
+
+def _triggers():
+    """ (name, CREATE TRIGGER statement) of every trigger that keeps the stored metrics current. """
+    triggers = []
+
+    def trigger(name, event, body, when=''):
+        triggers.append((name, f'CREATE TRIGGER {name} AFTER {event} {when} BEGIN {body}; END'))
+
+    def touched(view, key_sql):
+        # Version bump and change log entry of a view row, like migrations 3 and 5 do for the eight tables
+        return (f"UPDATE table_versions SET version = version + 1 WHERE name = '{view}'; "
+                f"INSERT INTO change_log (tbl, key) {key_sql}")
+
+    for kind, (table, view, key, entity, _, fk, _, _) in KINDS.items():
+        for event in ('INSERT', 'UPDATE'):
+            trigger(f'trg_{table}_{event.lower()}', f'{event} ON {table}',
+                    touched(view, f"SELECT '{view}', {key} FROM {entity} WHERE id = new.{fk}"))
+
+    # Players: a player's row changes with its own columns, and its team's percentiles with its rating or team
+    trigger('trg_players_derived_insert', 'INSERT ON players', refresh_sql('players', 'p.team_id IS new.team_id'))
+    trigger('trg_players_derived_update', 'UPDATE ON players', '; '.join([
+        # Country or a name shows in the view even when no metric changes
+        touched(PLAYER_VIEW, f"VALUES ('{PLAYER_VIEW}', old.Player)"),
+        f"INSERT INTO change_log (tbl, key) SELECT '{PLAYER_VIEW}', new.Player WHERE new.Player IS NOT old.Player",
+        refresh_sql('players', 'p.team_id IS old.team_id'),
+        refresh_sql('players', 'p.team_id IS new.team_id AND new.team_id IS NOT old.team_id'),
+    ]))
+    trigger('trg_players_derived_delete', 'DELETE ON players', '; '.join([
+        'DELETE FROM player_derived_stats WHERE player_id = old.id',
+        touched(PLAYER_VIEW, f"VALUES ('{PLAYER_VIEW}', old.Player)"),
+        refresh_sql('players', 'p.team_id IS old.team_id'),
+    ]))
+    for fact in PLAYER_INPUTS:
+        trigger(f'trg_{fact}_derived_insert', f'INSERT ON {fact}', refresh_sql('players', _team_of('new.player_id')))
+        trigger(f'trg_{fact}_derived_update', f'UPDATE ON {fact}', refresh_sql('players', _team_of('new.player_id')))
+        trigger(f'trg_{fact}_derived_delete', f'DELETE ON {fact}', refresh_sql('players', _team_of('old.player_id')))
+
+    # Teams: only the team's own row
+    trigger('trg_teams_derived_insert', 'INSERT ON teams', refresh_sql('teams', 't.id = new.id'))
+    trigger('trg_teams_derived_update', 'UPDATE ON teams', '; '.join([
+        touched(TEAM_VIEW, f"VALUES ('{TEAM_VIEW}', old.Team)"),
+        f"INSERT INTO change_log (tbl, key) SELECT '{TEAM_VIEW}', new.Team WHERE new.Team IS NOT old.Team",
+        refresh_sql('teams', 't.id = new.id'),
+    ]))
+    # A renamed team shows in every row of its players
+    trigger('trg_teams_derived_rename', 'UPDATE OF Team ON teams', touched(
+        PLAYER_VIEW, f"SELECT '{PLAYER_VIEW}', Player FROM players WHERE team_id = new.id"),
+        when='WHEN new.Team IS NOT old.Team')
+    trigger('trg_teams_derived_delete', 'DELETE ON teams', '; '.join([
+        'DELETE FROM team_derived_stats WHERE team_id = old.id',
+        touched(TEAM_VIEW, f"VALUES ('{TEAM_VIEW}', old.Team)"),
+    ]))
+    for fact in TEAM_INPUTS:
+        for event, row in (('insert', 'new'), ('update', 'new'), ('delete', 'old')):
+            trigger(f'trg_{fact}_derived_{event}', f'{event.upper()} ON {fact}', refresh_sql('teams', f't.id = {row}.team_id'))
+    return triggers
+
+
+def create(conn):
+    """ Create the stored tables, their indexes, views and triggers, and compute every row. """
+    for kind, (table, view, key, entity, _, fk, metrics, _) in KINDS.items():
+        columns = ''.join(f', {column} REAL' for column, _ in metrics)
+        conn.execute(f'CREATE TABLE {table} ({fk} INTEGER PRIMARY KEY REFERENCES {entity} (id){columns})')
+        for column, _ in metrics:
+            conn.execute(f'CREATE INDEX idx_{table}_{column.lower()} ON {table} ({column})')
+        names = ', '.join(column for column, _ in metrics)
+        values = ', '.join(f'd.{column}' for column, _ in metrics)
+        if kind == 'players':
+            conn.execute(f'''
+                CREATE VIEW {view} (Player, Team, {names}, Minutes, Matches, Country) AS
+                SELECT p.Player, t.Team, {values}, p.Minutes, p.Matches, p.Country
+                FROM {table} d
+                JOIN players p ON p.id = d.player_id
+                LEFT JOIN teams t ON t.id = p.team_id
+            ''')
+        else:
+            conn.execute(f'''
+                CREATE VIEW {view} (Team, {names}, Matches) AS
+                SELECT t.Team, {values}, t.Matches
+                FROM {table} d
+                JOIN teams t ON t.id = d.team_id
+            ''')
+        conn.execute("INSERT OR IGNORE INTO table_versions (name, version, updated_at) "
+                     "VALUES (?, 0, CAST(strftime('%s', 'now') AS INTEGER))", (view,))
+    refresh(conn)
+    create_triggers(conn)
+
+
+def recreate(conn):
+    """ Drop and create everything again, e.g. after PLAYER_METRICS or TEAM_METRICS changed. """
+    drop_triggers(conn)
+    for table, view, *_ in KINDS.values():
+        conn.execute(f'DROP VIEW IF EXISTS {view}')
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    create(conn)
+    conn.execute(f"UPDATE table_versions SET version = version + 1 WHERE name IN ('{PLAYER_VIEW}', '{TEAM_VIEW}')")
+
+
+def create_triggers(conn):
+    for _, sql in _triggers():
+        conn.execute(sql)
+
+
+def drop_triggers(conn):
+    for name, _ in _triggers():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def refresh(conn):
+    """ Recompute every stored row, e.g. after a bulk load without the triggers. Only changed rows are written. """
+    for kind, (table, _, _, entity, _, fk, _, _) in KINDS.items():
+        conn.execute(f'DELETE FROM {table} WHERE {fk} NOT IN (SELECT id FROM {entity})')
+        conn.execute(refresh_sql(kind, 'true'))
+
+
+def log_since(conn, kind, seq, tables):
+    """
+    After a load without the triggers: log the view row of every player (or team) that the change log
+    shows written to tables after seq, and bump the view's version. refresh() logs only the rows whose
+    metrics changed, and a view row also shows unchanged metrics next to columns the load may have changed.
+    """
+    view = KINDS[kind][1]
+    cursor = conn.execute(f"INSERT INTO change_log (tbl, key) SELECT DISTINCT ?, key FROM change_log "
+                          f"WHERE seq > ? AND tbl IN ({', '.join('?' * len(tables))})", (view, seq, *tables))
+    if cursor.rowcount:
+        conn.execute("UPDATE table_versions SET version = version + 1 WHERE name = ?", (view,))
+
+
+def check(conn):
+    """ Rows of the stored tables that differ from a fresh computation, as messages (empty when in sync). """
+    mismatches = []
+    for kind, (table, _, key, entity, alias, fk, metrics, source) in KINDS.items():
+        columns = ', '.join(column for column, _ in metrics)
+        fresh = f"SELECT {alias}.id, {', '.join(f'ROUND({e}, {DECIMALS})' for _, e in metrics)} {source}"
+        stored = f"SELECT {fk}, {columns} FROM {table}"
+        for query, label in ((f"{fresh} EXCEPT {stored}", 'stale or missing'), (f"{stored} EXCEPT {fresh}", 'extra')):
+            for row in conn.execute(query):
+                name = conn.execute(f"SELECT {key} FROM {entity} WHERE id = ?", (row[0],)).fetchone()
+                mismatches.append(f"{table}: {label} row for {name[0] if name else row[0]}")
+    return mismatches
+
+
+def init_app(app):
+    """ Register the check-derived command. """
+    @app.cli.command('check-derived')
+    @click.option('--refresh', 'refresh_first', is_flag=True, help='Recompute every row first')
+    def check_derived(refresh_first):
+        """ Compare the stored derived metrics with a fresh computation. """
+        conn = db.get_db()
+        if refresh_first:
+            refresh(conn)
+            conn.commit()
+        mismatches = check(conn)
+        for message in mismatches:
+            print(message)
+        print(f"{len(mismatches)} mismatches")
+        if mismatches:
+            raise SystemExit(1)
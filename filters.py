@@ -0,0 +1,214 @@
+"""
+Multi-predicate filters over the eight tables and the derived metrics views.
+
+A filter names a table, a list of predicates (column, operator, value), a sort
+column and order, and a limit/offset. It is validated against the table's
+columns and compiled into one parameterized SELECT on the table's view (see
+migration 6 in migrations.py). Numeric columns are compared as numbers, so
+Goals >= 10 is a range on an integer column that can use the fact tables'
+indexes, not a LIKE over text. SQLite flattens the views, so predicates on
+Player or Team reach the unique indexes of players/teams.
+
+The SQL depends only on the shape of a filter (table, columns, operators,
+number of IN values, sort), never on its values. Each shape is compiled once
+and cached, and the pooled connections keep a prepared statement per SQL text
+(DB_STATEMENT_CACHE), so a repeated shape skips parsing and planning.
+
+As JSON (POST /api/filter):
+    {"table": "player_top_scorers",
+     "where": [{"column": "Goals", "op": ">=", "value": 10},
+               {"column": "Minutes", "op": "<", "value": 2000},
+               {"column": "Team", "op": "=", "value": "Bayern München"}],
+     "sort": "Goals", "order": "desc", "limit": 20, "offset": 0, "explain": true}
+
+Operators: = != < <= > >=, between (value is [low, high]) and in (value is a list).
+"""
+
+import math
+from functools import lru_cache
+
+import derived
+import ingest
+import migrations
+import paging
+
+OPERATORS = ['=', '!=', '<', '<=', '>', '>=', 'between', 'in']
+MAX_PREDICATES = 16
+MAX_IN_VALUES = 100
+DEFAULT_LIMIT = 50
+SQLITE_INTEGER_LIMIT = ingest.SQLITE_INTEGER_LIMIT
+
+
+class FilterError(ValueError):
+    """ Raised for filters that cannot be compiled: unknown table, column or operator, or a bad value. """
+
+
+@lru_cache(maxsize=None)
+def table_columns(table):
+    """ Columns of one of the eight tables or derived views in view order, or None for any other name. """
+    if table in (derived.PLAYER_VIEW, derived.TEAM_VIEW):
+        return derived.view_columns(table)
+    if table in migrations.PLAYER_FACTS:
+        return ['Player', 'Team'] + migrations.PLAYER_FACTS[table][1] + ['Minutes', 'Matches', 'Country']
+    if table in migrations.TEAM_FACTS:
+        return ['Team'] + migrations.TEAM_FACTS[table][1] + ['Matches']
+    return None
+
+
+@lru_cache(maxsize=None)
+def all_columns():
+    """ Every column of the eight tables and derived views, once each, for the filter form. """
+    columns = []
+    for table in list(migrations.PLAYER_FACTS) + list(migrations.TEAM_FACTS) + [derived.PLAYER_VIEW, derived.TEAM_VIEW]:
+        columns += [column for column in table_columns(table) if column not in columns]
+    return columns
+
+
+def is_numeric(column):
+    return column in ingest.INT_COLUMNS or column in ingest.FLOAT_COLUMNS or column in derived.COLUMNS
+
+
+def _value(column, value):
+    """ A predicate value with the column's type: int or float for numeric columns, str otherwise. """
+    if isinstance(value, (list, dict)) or value is None or isinstance(value, bool):
+        raise FilterError(f"{column} needs a single value, got {value!r}")
+    if not is_numeric(column):
+        return str(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError, OverflowError):
+        raise FilterError(f"{column} must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise FilterError(f"{column} must be a finite number, got {value!r}")
+    # Whole numbers bind as integers, except those too large for one
+    return int(number) if number.is_integer() and abs(number) < SQLITE_INTEGER_LIMIT else number
+
+
+def parse_filter(spec, max_limit=500):
+    """
+    Validate a filter given as a dict (e.g. decoded JSON).
+    Returns (table, predicates, sort, descending, limit, offset) with predicates as (column, op, values) tuples.
+    """
+    if not isinstance(spec, dict):
+        raise FilterError("filter must be an object")
+
+    table = spec.get('table')
+    columns = table_columns(table) if isinstance(table, str) else None
+    if columns is None:
+        raise FilterError(f"Unknown table: {table!r}")
+
+    where = spec.get('where') or []
+    if not isinstance(where, list) or len(where) > MAX_PREDICATES:
+        raise FilterError(f"where must be a list of at most {MAX_PREDICATES} predicates")
+
+    predicates = []
+    for predicate in where:
+        if not isinstance(predicate, dict):
+            raise FilterError("each predicate must be an object with column, op and value")
+        column, op, value = predicate.get('column'), str(predicate.get('op', '=')).lower(), predicate.get('value')
+        if column not in columns:
+            raise FilterError(f"Unknown column for {table}: {column!r}")
+        if op not in OPERATORS:
+            raise FilterError(f"Unknown operator: {op!r} (use one of {', '.join(OPERATORS)})")
+
+        if op == 'between':
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise FilterError(f"between on {column} needs [low, high]")
+            values = tuple(_value(column, v) for v in value)
+        elif op == 'in':
+            if not isinstance(value, (list, tuple)) or not 0 < len(value) <= MAX_IN_VALUES:
+                raise FilterError(f"in on {column} needs a list of 1 to {MAX_IN_VALUES} values")
+            values = tuple(_value(column, v) for v in value)
+        else:
+            values = (_value(column, value),)
+        predicates.append((column, op, values))
+
+    sort = spec.get('sort') or paging.KEY_COLUMNS[table]
+    if sort not in columns:
+        raise FilterError(f"Unknown sort column for {table}: {sort!r}")
+    order = str(spec.get('order', 'asc')).lower()
+    if order not in ('asc', 'desc'):
+        raise FilterError("order must be 'asc' or 'desc'")
+
+    try:
+        limit = int(spec.get('limit') or DEFAULT_LIMIT)
+        offset = int(spec.get('offset') or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise FilterError("limit and offset must be integers")
+    if not 0 < limit <= max_limit or not 0 <= offset < SQLITE_INTEGER_LIMIT:
+        raise FilterError(f"limit must be between 1 and {max_limit} and offset at least 0 and below 2**63")
+
+    return table, predicates, sort, order == 'desc', limit, offset
+
+
+@lru_cache(maxsize=512)
+def compile_filter(table, shape, sort, descending):
+    """ SQL for a filter shape: shape is a tuple of (column, op, number of values). Columns must be validated. """
+    clauses = []
+    for column, op, count in shape:
+        if op == 'between':
+            clauses.append(f"{column} BETWEEN ? AND ?")
+        elif op == 'in':
+            clauses.append(f"{column} IN ({', '.join('?' for _ in range(count))})")
+        else:
+            clauses.append(f"{column} {op} ?")
+
+    key = paging.KEY_COLUMNS[table]
+    direction = ' DESC' if descending else ''
+    # The key breaks ties, so pages of the same filter never overlap
+    order = f"{sort}{direction}" if sort == key else f"{sort}{direction}, {key}"
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    return f"SELECT * FROM {table}{where} ORDER BY {order} LIMIT ? OFFSET ?"
+
+
+def run_filter(conn, spec, max_limit=500):
+    """
+    Run a filter and return a JSON-ready dict: table, columns, rows (as dicts), has_more, limit and
+    offset, plus sql and plan (EXPLAIN QUERY PLAN lines) when spec has "explain": true.
+    """
+    table, predicates, sort, descending, limit, offset = parse_filter(spec, max_limit)
+    shape = tuple((column, op, len(values)) for column, op, values in predicates)
+    sql = compile_filter(table, shape, sort, descending)
+    params = [value for _, _, values in predicates for value in values] + [limit + 1, offset]
+
+    cursor = conn.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    body = {'table': table, 'columns': columns, 'rows': rows[:limit], 'has_more': len(rows) > limit,
+            'limit': limit, 'offset': offset}
+
+    if spec.get('explain'):
+        body['sql'] = sql
+        body['plan'] = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    return body
+
+
+def spec_from_form(form):
+    """
+    A filter spec from form fields: table, sort, order, limit, offset, and repeated column/op/value
+    fields, one per predicate (value2 is the upper bound for between; values for in are comma-separated).
+    Predicate rows without a column or value are skipped.
+    """
+    columns, ops = form.getlist('column'), form.getlist('op')
+    values, upper = form.getlist('value'), form.getlist('value2')
+    where = []
+    for i, column in enumerate(columns):
+        value = values[i].strip() if i < len(values) else ''
+        if not column or value == '':
+            continue
+        op = ops[i] if i < len(ops) else '='
+        if op == 'between':
+            value = [value, upper[i].strip() if i < len(upper) else '']
+        elif op == 'in':
+            value = [v.strip() for v in value.split(',') if v.strip()]
+        where.append({'column': column, 'op': op, 'value': value})
+
+    return {
+        'table': form.get('table'),
+        'where': where,
+        'sort': form.get('sort') or None,
+        'order': form.get('order', 'asc'),
+        'limit': form.get('limit') or None,
+        'offset': form.get('offset') or None,
+        'explain': form.get('explain') in ('1', 'on', 'true'),
+    }
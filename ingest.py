@@ -0,0 +1,284 @@
+"""
+Bulk import of players and teams from CSV or NDJSON.
+
+Each input row describes one player (or team) with the columns of all four of
+its tables, the same fields as the add_player/add_team forms. Header names
+match the table columns case-insensitively. A row is written to every table
+whose metric columns it fills in, so partial rows (e.g. a player without
+tackling data) are fine; rows that fill in no table are rejected, and integer
+columns only take whole numbers that fit SQLite's 64-bit integers.
+
+Rows are validated in batches and written with executemany inside a single
+transaction, straight to the normalized tables behind the eight table views
+(see migration 6 in migrations.py): each player/team row once, then its
+metrics per table. The ranking and filter indexes are dropped for the load and rebuilt
+once at the end, instead of being updated row by row, and so are the triggers
+that keep the derived metrics current (see derived.py): every stored metric is
+recomputed by one statement after the load instead of a team at a time per row. In 'upsert' mode
+existing players/teams are updated in place, so re-importing a file is
+idempotent. Over HTTP (POST /import) the load runs on the writer thread (see
+writer.py), inside its transaction like any other mutation.
+
+Usage (from the repository root):
+    python ingest.py players season.csv [--format ndjson] [--mode insert|upsert] [--database Bundesliga.db]
+"""
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+
+import derived
+import migrations
+
+INT_COLUMNS = {'Goals', 'Penalties', 'Minutes', 'Matches', 'Player_Match_Awards',
+               'Total_Goals_Scored', 'Red_Cards', 'Yellow_Cards'}
+FLOAT_COLUMNS = {'FotMob_Rating', 'Expected_Goals', 'Tackles_per_90', 'Tackle_Success_Rate',
+                 'FotMob_Team_Rating', 'Goals_per_Match', 'Possession_Percentage'}
+SQLITE_INTEGER_LIMIT = 2 ** 63  # Python ints at or beyond this do not fit a 64-bit SQLite integer
+
+# kind -> (key column, columns every row needs, {table: its columns})
+KINDS = {
+    'players': ('Player', ['Player', 'Team', 'Minutes', 'Matches', 'Country'], {
+        'player_top_scorers': ['Player', 'Team', 'Goals', 'Penalties', 'Minutes', 'Matches', 'Country'],
+        'player_ratings': ['Player', 'Team', 'FotMob_Rating', 'Player_Match_Awards', 'Minutes', 'Matches', 'Country'],
+        'player_expected_goals': ['Player', 'Team', 'Expected_Goals', 'Goals', 'Minutes', 'Matches', 'Country'],
+        'player_tackles_won': ['Player', 'Team', 'Tackles_per_90', 'Tackle_Success_Rate', 'Minutes', 'Matches', 'Country'],
+    }),
+    'teams': ('Team', ['Team', 'Matches'], {
+        'team_ratings': ['Team', 'FotMob_Team_Rating', 'Matches'],
+        'team_goals_per_match': ['Team', 'Goals_per_Match', 'Total_Goals_Scored', 'Matches'],
+        'possession_percentage_team': ['Team', 'Possession_Percentage', 'Matches'],
+        'total_red_card_team': ['Team', 'Red_Cards', 'Yellow_Cards', 'Matches'],
+    }),
+}
+
+MAX_REPORTED_ERRORS = 50
+
+
+class IngestError(Exception):
+    """ Raised for input that cannot be imported at all (unknown kind or format). """
+
+
+def read_rows(stream, fmt):
+    """ Yield (row, error) from a text stream of CSV or NDJSON: the row as a dict, or None and a message for a line that cannot be read. """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row, None
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield None, f"line {line_number}: invalid JSON ({e.msg})"
+    else:
+        raise IngestError(f"Unsupported format: {fmt}")
+
+
+def _convert(column, value):
+    if column in INT_COLUMNS:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{number} is not a whole number")
+        if abs(number) >= SQLITE_INTEGER_LIMIT:
+            raise ValueError(f"{number} is too large for SQLite")
+        return int(number)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    return str(value).strip()
+
+
+def validate(raw, kind):
+    """ Normalize one input row to {column: typed value}. Raises ValueError with a message for bad rows. """
+    if not isinstance(raw, dict):
+        raise ValueError("row is not an object")
+
+    _, required, tables = KINDS[kind]
+    known = {column.lower(): column for columns in tables.values() for column in columns}
+
+    row = {}
+    for name, value in raw.items():
+        column = known.get(str(name).strip().lower())
+        if column is None or value is None or str(value).strip() == '':
+            continue
+        try:
+            row[column] = _convert(column, value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"{column} must be {'a 64-bit whole' if column in INT_COLUMNS else 'a'} number, got {value!r}")
+
+    missing = [column for column in required if column not in row]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    # A row is only written with every column of at least one table; name what the nearest one lacks
+    missing = min(([column for column in columns if column not in row] for columns in tables.values()), key=len)
+    if missing:
+        raise ValueError(f"fills no table, missing {', '.join(missing)}")
+    return row
+
+
+def _statements(kind, mode):
+    """
+    (sql, columns, table) of each statement that writes a row: the player/team itself, then one per
+    table's fact table. table is None for statements every row goes through.
+    """
+    if kind == 'players':
+        entity, key, fk, facts = 'players', 'Player', 'player_id', migrations.PLAYER_FACTS
+        shared = ['team_id', 'Minutes', 'Matches', 'Country']
+        statements = [
+            ("INSERT INTO teams (Team) VALUES (?) ON CONFLICT (Team) DO NOTHING", ['Team'], None),
+            ("INSERT INTO players (Player, team_id, Minutes, Matches, Country) "
+             "VALUES (?, (SELECT id FROM teams WHERE Team = ?), ?, ?, ?) "
+             f"ON CONFLICT (Player) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in shared)} "
+             f"WHERE {' OR '.join(f'{c} IS NOT excluded.{c}' for c in shared)}",
+             ['Player', 'Team', 'Minutes', 'Matches', 'Country'], None),
+        ]
+    else:
+        entity, key, fk, facts = 'teams', 'Team', 'team_id', migrations.TEAM_FACTS
+        statements = [
+            ("INSERT INTO teams (Team, Matches) VALUES (?, ?) "
+             "ON CONFLICT (Team) DO UPDATE SET Matches = excluded.Matches WHERE Matches IS NOT excluded.Matches",
+             ['Team', 'Matches'], None),
+        ]
+
+    for table, (fact, columns) in facts.items():
+        placeholders = ', '.join('?' for _ in columns)
+        sql = (f"INSERT INTO {fact} ({fk}, {', '.join(columns)}) "
+               f"VALUES ((SELECT id FROM {entity} WHERE {key} = ?), {placeholders})")
+        if mode == 'upsert':
+            updates = ', '.join(f"{column} = excluded.{column}" for column in columns)
+            changed = ' OR '.join(f"{column} IS NOT excluded.{column}" for column in columns)
+            sql += f" ON CONFLICT({fk}) DO UPDATE SET {updates} WHERE {changed}"
+        statements.append((sql, [key] + columns, table))
+    return statements
+
+
+def ingest(conn, stream, kind, fmt='csv', mode='upsert', batch_size=1000, defer_indexes=True):
+    """
+    Import rows of the given kind ('players' or 'teams') from a text stream in one transaction.
+    Invalid rows are skipped and reported. Returns a report dict with row counts, timing and errors.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        report = load(conn, stream, kind, fmt, mode, batch_size, defer_indexes)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return report
+
+
+def load(conn, stream, kind, fmt='csv', mode='upsert', batch_size=1000, defer_indexes=True):
+    """
+    ingest() inside the caller's transaction, without committing, e.g. as a job on the writer
+    thread (see writer.py), whose savepoint undoes the whole load if it raises.
+    """
+    if kind not in KINDS:
+        raise IngestError(f"Unknown kind: {kind}")
+    if mode not in ('insert', 'upsert'):
+        raise IngestError(f"Unknown mode: {mode}")
+
+    _, _, tables = KINDS[kind]
+    statements = _statements(kind, mode)
+    facts = migrations.PLAYER_FACTS if kind == 'players' else migrations.TEAM_FACTS
+    written = {fact for fact, _ in facts.values()} | {kind}
+    indexes = migrations.RANKING_INDEXES + migrations.FILTER_INDEXES
+    deferred = [index for index in indexes if index[1] in written] if defer_indexes else []
+
+    report = {'kind': kind, 'mode': mode, 'rows': 0, 'rejected': 0, 'errors': []}
+    start = time.perf_counter()
+
+    def reject(message):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append(message)
+
+    def flush(batch):
+        # A row is written to every table whose columns it fills in. validate() rejects rows
+        # that fill in none, and only rows written count as imported
+        filled = [row for row in batch if any(all(column in row for column in columns) for columns in tables.values())]
+        for sql, columns, table in statements:
+            required = tables[table] if table else columns
+            params = [tuple(row[column] for column in columns)
+                      for row in filled if all(column in row for column in required)]
+            if params:
+                conn.executemany(sql, params)
+        report['rows'] += len(filled)
+
+    for name, table, _ in deferred:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    if defer_indexes:
+        since = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        derived.drop_triggers(conn)
+
+    batch = []
+    for number, (raw, error) in enumerate(read_rows(stream, fmt), start=1):
+        if error:
+            reject(error)
+            continue
+        try:
+            batch.append(validate(raw, kind))
+        except ValueError as e:
+            reject(f"row {number}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    for name, table, columns in deferred:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+    if defer_indexes:
+        derived.create_triggers(conn)
+        derived.refresh(conn)
+        derived.log_since(conn, kind, since, list(tables))
+
+    seconds = time.perf_counter() - start
+    report['seconds'] = round(seconds, 3)
+    report['rows_per_sec'] = round(report['rows'] / seconds, 1) if seconds else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import players or teams from CSV or NDJSON.')
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path', help="Input file, or - for stdin")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+    parser.add_argument('--mode', choices=['insert', 'upsert'], default='upsert')
+    parser.add_argument('--database', default='Bundesliga.db')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--keep-indexes', action='store_true', help='Maintain ranking and filter indexes and derived metrics row by row instead of rebuilding them')
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+    conn = sqlite3.connect(args.database, timeout=20)
+    conn.execute('PRAGMA journal_mode=WAL')
+    migrations.migrate(conn)
+
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if args.path == '-' else open(args.path, encoding='utf-8', newline='')
+    try:
+        report = ingest(conn, stream, args.kind, fmt=fmt, mode=args.mode,
+                        batch_size=args.batch_size, defer_indexes=not args.keep_indexes)
+    except sqlite3.IntegrityError as e:
+        print(f"Import failed, nothing was written: {e} (use --mode upsert to update existing rows)")
+        return 1
+    finally:
+        stream.close()
+        conn.close()
+
+    print(f"Imported {report['rows']} {args.kind} in {report['seconds']}s ({report['rows_per_sec']} rows/sec), "
+          f"rejected {report['rejected']}")
+    for error in report['errors']:
+        print(f"  {error}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Precomputed leaderboards for the top-N player and team rankings.
+
+Each leaderboard keeps its rows in memory, sorted by score, so the top N is a
+slice (O(k)) and the rank of a player or team is a binary search (O(log n)).
+Before answering, a board catches up with the change log (see changes.py) and
+re-reads only the players/teams written since its last sync, e.g. by
+add_player, remove_player, add_team, remove_team or edit_team. It rebuilds
+from scratch only the first time or when it has fallen too far behind.
+Scores are compared as numbers; rows whose score is missing or not a number
+are ranked last, by name.
+"""
+
+from bisect import bisect_left, insort
+
+import aggregates
+import changes
+
+
+class Leaderboard(changes.ChangeFollower):
+    """ Rows of a ranking query, sorted by score (highest first) and kept in sync with the change log. """
+
+    def __init__(self, name, tables, query, key, score):
+        super().__init__(tables)
+        self.name = name
+        self.query = query  # Must select the ranked rows, with no WHERE clause
+        self.key = key  # Qualified key column used to re-read a single row
+        self.score = score  # Column of the query's result to rank by
+
+        self._rows = {}  # name -> row dict
+        self._order = []  # sorted (missing score, -score, name) keys, see _key
+
+    def top(self, conn, n):
+        """ The n highest-ranked rows. """
+        with self._lock:
+            self._sync(conn)
+            return [self._rows[key[-1]] for key in self._order[:n]]
+
+    def rank(self, conn, name):
+        """ 1-based rank of a player/team, or None if it is not on the board. """
+        with self._lock:
+            self._sync(conn)
+            row = self._rows.get(name)
+            if row is None:
+                return None
+            return bisect_left(self._order, self._key(row, name)) + 1
+
+    def __len__(self):
+        return len(self._order)
+
+    def _key(self, row, name):
+        """ Sort key of a row: highest score first, then rows without a numeric score. """
+        score = aggregates.number(row[self.score])
+        return (False, -score, name) if score is not None else (True, 0.0, name)
+
+    def _rebuild(self, conn):
+        self._rows = {row['Name']: dict(row) for row in conn.execute(self.query)}
+        self._order = sorted(self._key(row, name) for name, row in self._rows.items())
+
+    def _refresh(self, conn, key):
+        """ Re-read one player/team and move it to its new place (or off the board). """
+        old = self._rows.pop(key, None)
+        if old is not None:
+            self._order.pop(bisect_left(self._order, self._key(old, key)))
+
+        row = conn.execute(f"{self.query} WHERE {self.key} = ?", (key,)).fetchone()
+        if row is not None:
+            row = dict(row)
+            self._rows[key] = row
+            insort(self._order, self._key(row, key))
+
+
+def create_boards():
+    """ The leaderboards offered by the app, by name. """
+    return {
+        'players': Leaderboard(
+            'players', ['player_top_scorers', 'player_ratings'], '''
+                SELECT p.Player AS Name, t.Team, pr.FotMob_Rating AS Rating
+                FROM player_rating_stats pr
+                JOIN player_goal_stats pt ON pt.player_id = pr.player_id
+                JOIN players p ON p.id = pr.player_id
+                LEFT JOIN teams t ON t.id = p.team_id
+            ''', key='p.Player', score='Rating'),
+        'goals': Leaderboard(
+            'goals', ['player_top_scorers'],
+            'SELECT Player AS Name, Team, Goals FROM player_top_scorers',
+            key='Player', score='Goals'),
+        'xg': Leaderboard(
+            'xg', ['player_expected_goals'],
+            'SELECT Player AS Name, Team, Expected_Goals FROM player_expected_goals',
+            key='Player', score='Expected_Goals'),
+        'tackles': Leaderboard(
+            'tackles', ['player_tackles_won'],
+            'SELECT Player AS Name, Team, Tackles_per_90 FROM player_tackles_won',
+            key='Player', score='Tackles_per_90'),
+        'teams': Leaderboard(
+            'teams', ['team_goals_per_match', 'team_ratings'], '''
+                SELECT t.Team AS Name, t.Matches, tr.FotMob_Team_Rating AS Rating
+                FROM team_rating_stats tr
+                JOIN team_goal_stats ts ON ts.team_id = tr.team_id
+                JOIN teams t ON t.id = tr.team_id
+            ''', key='t.Team', score='Rating'),
+    }
+
+
+def init_app(app):
+    app.extensions['leaderboards'] = create_boards()
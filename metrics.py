@@ -0,0 +1,227 @@
+"""
+Performance instrumentation for the app, exposed in Prometheus text format on /metrics.
+
+Recorded per process (each server worker has its own numbers):
+  - request latency per Flask endpoint, method and status
+  - count and duration of every SQL statement, by statement type, plus the
+    number of statements per request, through InstrumentedConnection, the
+    connection class the pool opens (see db.py)
+  - plot render time per plot function (see render_pool.py), and time spent
+    in render_template per template
+
+Statements slower than SLOW_QUERY_MS are logged to the 'bundesliga.slow_query'
+logger together with their EXPLAIN QUERY PLAN.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, has_request_context, request, before_render_template, template_rendered
+
+# Bucket upper bounds in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+slow_query_log = logging.getLogger('bundesliga.slow_query')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+class Registry:
+    """ Thread-safe counters and histograms, keyed by metric name and label values, plus gauges read at render time. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> (type, help, histogram buckets or gauge callback)
+        self._series = {}  # name -> {label pairs: value, or [bucket counts, sum, count]}
+
+    def counter(self, name, help_text):
+        self._metrics[name] = ('counter', help_text, None)
+        self._series.setdefault(name, {})
+
+    def histogram(self, name, help_text, buckets):
+        self._metrics[name] = ('histogram', help_text, buckets)
+        self._series.setdefault(name, {})
+
+    def gauge(self, name, help_text, callback):
+        """ A value computed by callback() whenever the metrics are rendered. """
+        self._metrics[name] = ('gauge', help_text, callback)
+        self._series.setdefault(name, {})
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            series = self._series[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = self._metrics[name][2]
+        with self._lock:
+            series = self._series[name]
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def clear(self):
+        with self._lock:
+            for series in self._series.values():
+                series.clear()
+
+    def render(self):
+        """ Every metric in Prometheus text exposition format. """
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'gauge':
+                    lines.append(f'{name} {buckets()}')
+                    continue
+                for labels, state in self._series[name].items():
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(labels)} {state}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets, state[0]):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {state[2]}')
+                    lines.append(f'{name}_sum{_labels(labels)} {state[1]:.6f}')
+                    lines.append(f'{name}_count{_labels(labels)} {state[2]}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REGISTRY.histogram('http_request_duration_seconds', 'Request latency by endpoint.', REQUEST_BUCKETS)
+REGISTRY.histogram('sql_statement_duration_seconds', 'SQL statement execution time by statement type.', SQL_BUCKETS)
+REGISTRY.histogram('sql_statements_per_request', 'SQL statements executed while serving one request.', COUNT_BUCKETS)
+REGISTRY.counter('sql_slow_statements_total', 'SQL statements slower than the slow-query threshold.')
+REGISTRY.histogram('template_render_duration_seconds', 'render_template time by template.', REQUEST_BUCKETS)
+REGISTRY.histogram('plot_render_duration_seconds', 'Plot render time by plot function, including queueing.', REQUEST_BUCKETS)
+REGISTRY.counter('plot_renders_rejected_total', 'Plot renders skipped because the render queue was full.')
+
+
+def _verb(sql):
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else ''
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """ Cursor that times every execute/executemany (to the first row) and logs slow statements. """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(sql, None, time.perf_counter() - start)
+
+    def _record(self, sql, parameters, seconds):
+        verb = _verb(sql)
+        REGISTRY.observe('sql_statement_duration_seconds', seconds, (('statement', verb),))
+        if has_request_context():
+            g.sql_statements = g.get('sql_statements', 0) + 1
+
+        if seconds >= self.connection.slow_query_seconds:
+            REGISTRY.inc('sql_slow_statements_total', (('statement', verb),))
+            slow_query_log.warning('%.1f ms: %s\n%s', seconds * 1000, ' '.join(sql.split()),
+                                   self.connection.query_plan(sql, parameters))
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """ Connection whose cursors, including those behind conn.execute(), are InstrumentedCursors. """
+
+    slow_query_seconds = 0.1  # Set from SLOW_QUERY_MS by init_app
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def query_plan(self, sql, parameters=None):
+        """ EXPLAIN QUERY PLAN of a statement as indented text, or why it could not be explained. """
+        verb = _verb(sql)
+        if verb in ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'EXPLAIN', 'CREATE', 'DROP'):
+            return '  (no plan)'
+        try:
+            # A plain cursor, so explaining is neither timed nor logged itself
+            rows = sqlite3.Cursor(self).execute(f'EXPLAIN QUERY PLAN {sql}', parameters or ()).fetchall()
+        except sqlite3.Error as e:
+            return f'  (no plan: {e})'
+        depth = {0: 0}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, 0) + 1
+            lines.append('  ' * depth[node] + detail)
+        return '\n'.join(lines)
+
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        labels = (('endpoint', request.endpoint or 'unmatched'), ('method', request.method), ('status', response.status_code))
+        REGISTRY.observe('http_request_duration_seconds', time.perf_counter() - start, labels)
+        REGISTRY.observe('sql_statements_per_request', g.pop('sql_statements', 0))
+    return response
+
+
+def _record_failed_request(exception=None):
+    # Requests that raised never reach after_request
+    if exception is not None and 'request_start' in g:
+        _record_request(Response(status=500))
+
+
+def _start_template(sender, template, context, **extra):
+    g.setdefault('template_starts', []).append(time.perf_counter())
+
+
+def _record_template(sender, template, context, **extra):
+    starts = g.get('template_starts')
+    if starts:
+        REGISTRY.observe('template_render_duration_seconds', time.perf_counter() - starts.pop(),
+                         (('template', template.name),))
+
+
+def metrics_view():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """ Install the request/template hooks and the /metrics endpoint. """
+    InstrumentedConnection.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 100) / 1000
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_record_failed_request)
+    before_render_template.connect(_start_template, app)
+    template_rendered.connect(_record_template, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,651 @@
+"""
+Versioned schema migrations for Bundesliga.db.
+
+Each migration is a function registered with @migration(version, description).
+migrate() applies every migration newer than the version recorded in the
+schema_version table, one transaction per migration, so running it again
+against an up-to-date database does nothing.
+
+Run from the command line to migrate, or to print the query plans of the
+queries app.py issues:
+    python migrations.py [--database Bundesliga.db] [--explain]
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+import derived
+import leaderboards
+import profiles
+import search
+
+PLAYER_TABLES = ['player_expected_goals', 'player_ratings', 'player_tackles_won', 'player_top_scorers']
+TEAM_TABLES = ['possession_percentage_team', 'team_goals_per_match', 'team_ratings', 'total_red_card_team']
+
+log = logging.getLogger('bundesliga.migrations')
+
+# Normalized layout (migration 6). The eight legacy names are views over an entity table
+# (players or teams) and one fact table each: legacy table -> (fact table, metric columns).
+# The order is the order of precedence when the legacy tables disagree about a shared column.
+PLAYER_FACTS = {
+    'player_top_scorers': ('player_goal_stats', ['Goals', 'Penalties']),
+    'player_ratings': ('player_rating_stats', ['FotMob_Rating', 'Player_Match_Awards']),
+    'player_expected_goals': ('player_xg_stats', ['Expected_Goals', 'Goals']),
+    'player_tackles_won': ('player_tackle_stats', ['Tackles_per_90', 'Tackle_Success_Rate']),
+}
+TEAM_FACTS = {
+    'team_ratings': ('team_rating_stats', ['FotMob_Team_Rating']),
+    'team_goals_per_match': ('team_goal_stats', ['Goals_per_Match', 'Total_Goals_Scored']),
+    'possession_percentage_team': ('team_possession_stats', ['Possession_Percentage']),
+    'total_red_card_team': ('team_card_stats', ['Red_Cards', 'Yellow_Cards']),
+}
+
+# Indexes behind the top-N rankings on the fact tables: (index name, table, columns)
+RANKING_INDEXES = [
+    ('idx_player_rating_stats_rating', 'player_rating_stats', 'FotMob_Rating DESC'),
+    ('idx_player_goal_stats_goals', 'player_goal_stats', 'Goals DESC'),
+    ('idx_player_xg_stats_xg', 'player_xg_stats', 'Expected_Goals DESC'),
+    ('idx_player_tackle_stats_tackles', 'player_tackle_stats', 'Tackles_per_90 DESC'),
+    ('idx_team_rating_stats_rating', 'team_rating_stats', 'FotMob_Team_Rating DESC'),
+]
+
+# Indexes for range filters on the high-cardinality columns that have no ranking index (see filters.py)
+FILTER_INDEXES = [
+    ('idx_players_minutes', 'players', 'Minutes'),
+    ('idx_player_tackle_stats_success', 'player_tackle_stats', 'Tackle_Success_Rate'),
+]
+
+# Entries kept in change_log before the oldest are pruned
+CHANGE_LOG_RETENTION = 10000
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """ Register a migration function. Versions must be applied in increasing order. """
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+@migration(1, 'Unique Player/Team keys on all eight tables')
+def add_key_indexes(conn):
+    for table in PLAYER_TABLES:
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_player ON {table} (Player)')
+    for table in TEAM_TABLES:
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_team ON {table} (Team)')
+
+
+@migration(2, 'Covering indexes for the ranking columns')
+def add_ranking_indexes(conn):
+    # On the legacy tables, which migration 6 replaces with views
+    indexes = [
+        ('idx_player_ratings_rating', 'player_ratings', 'FotMob_Rating DESC, Player, Team'),
+        ('idx_player_top_scorers_goals', 'player_top_scorers', 'Goals DESC, Player, Team'),
+        ('idx_player_expected_goals_xg', 'player_expected_goals', 'Expected_Goals DESC, Player, Team'),
+        ('idx_player_tackles_won_tackles', 'player_tackles_won', 'Tackles_per_90 DESC, Player, Team'),
+        ('idx_team_ratings_rating', 'team_ratings', 'FotMob_Team_Rating DESC, Team'),
+    ]
+    for name, table, columns in indexes:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+@migration(3, 'Per-table data version counters maintained by triggers')
+def add_table_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in PLAYER_TABLES + TEAM_TABLES:
+        conn.execute('INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
+
+
+@migration(4, 'FTS5 trigram index over player name, team and country')
+def add_player_search(conn):
+    # One search row per player table row. Its rowid is derived from the source rowid so the
+    # triggers can find it again: source rowid * 4 + position of the table in PLAYER_TABLES.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS player_search USING fts5(
+            Player, Team, Country, source UNINDEXED, tokenize = 'trigram'
+        )
+    ''')
+    for k, table in enumerate(PLAYER_TABLES):
+        conn.execute(f'''
+            INSERT INTO player_search (rowid, Player, Team, Country, source)
+            SELECT rowid * 4 + {k}, Player, Team, Country, '{table}' FROM {table}
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO player_search (rowid, Player, Team, Country, source)
+                VALUES (new.rowid * 4 + {k}, new.Player, new.Team, new.Country, '{table}');
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM player_search WHERE rowid = old.rowid * 4 + {k};
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_search_update AFTER UPDATE OF Player, Team, Country ON {table}
+            BEGIN
+                DELETE FROM player_search WHERE rowid = old.rowid * 4 + {k};
+                INSERT INTO player_search (rowid, Player, Team, Country, source)
+                VALUES (new.rowid * 4 + {k}, new.Player, new.Team, new.Country, '{table}');
+            END
+        ''')
+
+
+@migration(5, 'Change log of written Player/Team keys for incremental caches')
+def add_change_log(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY,
+            tbl TEXT NOT NULL,
+            key TEXT
+        )
+    ''')
+    for table in PLAYER_TABLES + TEAM_TABLES:
+        key = 'Player' if table in PLAYER_TABLES else 'Team'
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, key) VALUES ('{table}', new.{key});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, key) VALUES ('{table}', old.{key});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_log_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO change_log (tbl, key) VALUES ('{table}', old.{key});
+                INSERT INTO change_log (tbl, key) SELECT '{table}', new.{key} WHERE new.{key} IS NOT old.{key};
+            END
+        ''')
+    # Keep the log bounded; readers that fall further behind rebuild from scratch (see changes.py)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_change_log_prune AFTER INSERT ON change_log
+        WHEN new.seq % 1000 = 0
+        BEGIN
+            DELETE FROM change_log WHERE seq <= new.seq - {CHANGE_LOG_RETENTION};
+        END
+    ''')
+
+
+def _changed(columns, old, new):
+    """ SQL condition that is true when any of columns differs between the old and new prefixes. """
+    return ' OR '.join(f'{old}{column} IS NOT {new}{column}' for column in columns)
+
+
+def _values(names):
+    return ', '.join(f"('{name}')" for name in names)
+
+
+def _orphan(entity, fk, old_id):
+    """ SQL condition that is true when entity row old_id is no longer referenced by any fact (or player). """
+    facts = PLAYER_FACTS if entity == 'players' else TEAM_FACTS
+    conditions = [f'NOT EXISTS (SELECT 1 FROM {fact} WHERE {fk} = {old_id})' for fact, _ in facts.values()]
+    if entity == 'teams':
+        conditions.append(f'NOT EXISTS (SELECT 1 FROM players WHERE team_id = {old_id})')
+    return ' AND '.join(conditions)
+
+
+def _log_reconciled(conn, team_rows, player_rows):
+    """ Log each legacy row whose shared columns differ from the values normalize() kept. """
+    teams, players = list(TEAM_FACTS), list(PLAYER_FACTS)
+    for name, source, matches, kept in conn.execute(f'''
+            SELECT m.Team, m.source, m.Matches, t.Matches FROM ({team_rows}) m JOIN teams t ON t.Team = m.Team
+            WHERE m.Matches IS NOT t.Matches ORDER BY t.id, m.source'''):
+        log.warning(f"Migration 6: {teams[source]} has Matches {matches} for {name}, kept {kept}, "
+                    "the value most of its tables agree on")
+
+    shared = ['Team', 'Minutes', 'Matches', 'Country']
+    for row in conn.execute(f'''
+            SELECT m.Player, m.source, {', '.join(f'm.{c}' for c in shared)}, t.Team, p.Minutes, p.Matches, p.Country
+            FROM ({player_rows}) m JOIN players p ON p.Player = m.Player LEFT JOIN teams t ON t.id = p.team_id
+            WHERE {' OR '.join(f'm.{c} IS NOT {"t" if c == "Team" else "p"}.{c}' for c in shared)}
+            ORDER BY p.id, m.source'''):
+        name, source, values, kept = row[0], row[1], row[2:6], row[6:]
+        differences = ', '.join(f"{c} {v!r} (kept {k!r})" for c, v, k in zip(shared, values, kept) if v != k)
+        log.warning(f"Migration 6: {players[source]} has {differences} for {name}, "
+                    "the first table listing the player wins")
+
+
+@migration(6, 'Normalized players/teams entities and fact tables behind views of the eight tables')
+def normalize(conn):
+    # Each player and team is stored once, with an integer id, in players/teams. The shared
+    # columns (Team, Minutes, Matches, Country) live there and each legacy table keeps only its
+    # metrics, keyed by id. Renaming a team is one row in teams.
+    # Where the legacy tables disagree about a shared column, one value is kept: a team's Matches is
+    # the value most of its tables agree on (ties go to the table first in TEAM_FACTS), a player's
+    # shared columns come from the first table in PLAYER_FACTS that lists them. Every legacy row
+    # whose value is dropped this way is logged (see _log_reconciled).
+    conn.execute('''
+        CREATE TABLE teams (
+            id INTEGER PRIMARY KEY,
+            Team TEXT NOT NULL UNIQUE,
+            Matches INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE players (
+            id INTEGER PRIMARY KEY,
+            Player TEXT NOT NULL UNIQUE,
+            team_id INTEGER REFERENCES teams (id),
+            Minutes INTEGER,
+            Matches INTEGER,
+            Country TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_players_team ON players (team_id)')
+    # Metric columns keep the legacy INTEGER affinity, so values read back exactly as before
+    for entity, fk, facts in (('players', 'player_id', PLAYER_FACTS), ('teams', 'team_id', TEAM_FACTS)):
+        for fact, columns in facts.values():
+            metrics = ''.join(f', {column} INTEGER' for column in columns)
+            conn.execute(f'CREATE TABLE {fact} ({fk} INTEGER PRIMARY KEY REFERENCES {entity} (id){metrics})')
+
+    # Ids follow the first appearance in the legacy tables, in the order of PLAYER_FACTS/TEAM_FACTS, so
+    # listings ordered by id keep the order of player_top_scorers and team_ratings. The views have no
+    # order of their own.
+    team_rows = ' UNION ALL '.join(
+        f'SELECT Team, Matches, {k} AS source, rowid AS position FROM {table}' for k, table in enumerate(TEAM_FACTS))
+    player_rows = ' UNION ALL '.join(
+        f'SELECT Player, Team, Minutes, Matches, Country, {k} AS source, rowid AS position FROM {table}'
+        for k, table in enumerate(PLAYER_FACTS))
+    conn.execute(f'''
+        INSERT INTO teams (Team, Matches)
+        SELECT n.Team, (
+            SELECT m.Matches FROM ({team_rows}) m WHERE m.Team = n.Team
+            GROUP BY m.Matches ORDER BY COUNT(*) DESC, MIN(m.source) LIMIT 1
+        )
+        FROM (
+            SELECT Team, MIN(source * 4294967296 + position) AS first
+            FROM (
+                SELECT Team, source, position FROM ({team_rows})
+                UNION ALL
+                SELECT Team, source + {len(TEAM_FACTS)}, position FROM ({player_rows})
+            )
+            WHERE Team IS NOT NULL
+            GROUP BY Team
+        ) n
+        ORDER BY n.first
+    ''')
+    # Bare columns next to MIN() come from the row holding the minimum, i.e. the preferred table
+    conn.execute(f'''
+        INSERT INTO players (Player, team_id, Minutes, Matches, Country)
+        SELECT u.Player, t.id, u.Minutes, u.Matches, u.Country
+        FROM (
+            SELECT Player, Team, Minutes, Matches, Country, MIN(source * 4294967296 + position) AS first
+            FROM ({player_rows})
+            WHERE Player IS NOT NULL
+            GROUP BY Player
+        ) u
+        LEFT JOIN teams t ON t.Team = u.Team
+        ORDER BY u.first
+    ''')
+    for entity, key, fk, facts in (('players', 'Player', 'player_id', PLAYER_FACTS),
+                                   ('teams', 'Team', 'team_id', TEAM_FACTS)):
+        for table, (fact, columns) in facts.items():
+            conn.execute(f'''
+                INSERT INTO {fact} ({fk}, {', '.join(columns)})
+                SELECT e.id, {', '.join(f'l.{column}' for column in columns)}
+                FROM {table} l JOIN {entity} e ON e.{key} = l.{key}
+                ORDER BY e.id
+            ''')
+
+    _log_reconciled(conn, team_rows, player_rows)
+
+    # Dropping the tables drops their indexes and triggers from migrations 1-5
+    conn.execute('DROP TABLE player_search')
+    for table in list(PLAYER_FACTS) + list(TEAM_FACTS):
+        conn.execute(f'DROP TABLE {table}')
+
+    # The legacy names as views, same columns in the same order
+    for table, (fact, columns) in PLAYER_FACTS.items():
+        conn.execute(f'''
+            CREATE VIEW {table} (Player, Team, {', '.join(columns)}, Minutes, Matches, Country) AS
+            SELECT p.Player, t.Team, {', '.join(f'f.{column}' for column in columns)}, p.Minutes, p.Matches, p.Country
+            FROM {fact} f
+            JOIN players p ON p.id = f.player_id
+            LEFT JOIN teams t ON t.id = p.team_id
+        ''')
+    for table, (fact, columns) in TEAM_FACTS.items():
+        conn.execute(f'''
+            CREATE VIEW {table} (Team, {', '.join(columns)}, Matches) AS
+            SELECT t.Team, {', '.join(f'f.{column}' for column in columns)}, t.Matches
+            FROM {fact} f
+            JOIN teams t ON t.id = f.team_id
+        ''')
+
+    # Writes to the views go to the entity and fact tables. Inserting an existing player/team
+    # updates its shared columns; a second row for the same fact table fails its primary key,
+    # raising IntegrityError like the unique indexes of migration 1 did.
+    player_shared = ['team_id', 'Minutes', 'Matches', 'Country']
+    new_team_id = '(SELECT id FROM teams WHERE Team = new.Team)'
+    for table, (fact, columns) in PLAYER_FACTS.items():
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_insert INSTEAD OF INSERT ON {table}
+            BEGIN
+                INSERT INTO teams (Team) SELECT new.Team WHERE new.Team IS NOT NULL ON CONFLICT (Team) DO NOTHING;
+                INSERT INTO players (Player, team_id, Minutes, Matches, Country)
+                VALUES (new.Player, {new_team_id}, new.Minutes, new.Matches, new.Country)
+                ON CONFLICT (Player) DO UPDATE SET
+                    {', '.join(f'{column} = excluded.{column}' for column in player_shared)}
+                WHERE {_changed(player_shared, '', 'excluded.')};
+                INSERT INTO {fact} (player_id, {', '.join(columns)})
+                VALUES ((SELECT id FROM players WHERE Player = new.Player), {', '.join(f'new.{column}' for column in columns)});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_update INSTEAD OF UPDATE ON {table}
+            BEGIN
+                UPDATE {fact} SET {', '.join(f'{column} = new.{column}' for column in columns)}
+                WHERE player_id = (SELECT id FROM players WHERE Player = old.Player)
+                    AND ({_changed(columns, '', 'new.')});
+                INSERT INTO teams (Team) SELECT new.Team WHERE new.Team IS NOT NULL ON CONFLICT (Team) DO NOTHING;
+                UPDATE players SET Player = new.Player, team_id = {new_team_id},
+                    Minutes = new.Minutes, Matches = new.Matches, Country = new.Country
+                WHERE Player = old.Player
+                    AND (Player IS NOT new.Player OR team_id IS NOT {new_team_id}
+                         OR {_changed(['Minutes', 'Matches', 'Country'], '', 'new.')});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_delete INSTEAD OF DELETE ON {table}
+            BEGIN
+                DELETE FROM {fact} WHERE player_id = (SELECT id FROM players WHERE Player = old.Player);
+            END
+        ''')
+    for table, (fact, columns) in TEAM_FACTS.items():
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_insert INSTEAD OF INSERT ON {table}
+            BEGIN
+                INSERT INTO teams (Team, Matches) VALUES (new.Team, new.Matches)
+                ON CONFLICT (Team) DO UPDATE SET Matches = excluded.Matches WHERE Matches IS NOT excluded.Matches;
+                INSERT INTO {fact} (team_id, {', '.join(columns)})
+                VALUES ({new_team_id}, {', '.join(f'new.{column}' for column in columns)});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_update INSTEAD OF UPDATE ON {table}
+            BEGIN
+                UPDATE {fact} SET {', '.join(f'{column} = new.{column}' for column in columns)}
+                WHERE team_id = (SELECT id FROM teams WHERE Team = old.Team)
+                    AND ({_changed(columns, '', 'new.')});
+                UPDATE teams SET Team = new.Team, Matches = new.Matches
+                WHERE Team = old.Team AND ({_changed(['Team', 'Matches'], '', 'new.')});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{table}_delete INSTEAD OF DELETE ON {table}
+            BEGIN
+                DELETE FROM {fact} WHERE team_id = (SELECT id FROM teams WHERE Team = old.Team);
+            END
+        ''')
+
+    # Versions and the change log stay keyed by the legacy table names (see migrations 3 and 5).
+    # Deleting a player's or team's last fact row also deletes the entity, after logging its key.
+    for entity, key, fk, facts in (('players', 'Player', 'player_id', PLAYER_FACTS),
+                                   ('teams', 'Team', 'team_id', TEAM_FACTS)):
+        for table, (fact, _) in facts.items():
+            conn.execute(f'''
+                CREATE TRIGGER trg_{fact}_insert AFTER INSERT ON {fact}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                    INSERT INTO change_log (tbl, key) SELECT '{table}', {key} FROM {entity} WHERE id = new.{fk};
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER trg_{fact}_update AFTER UPDATE ON {fact}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                    INSERT INTO change_log (tbl, key) SELECT '{table}', {key} FROM {entity} WHERE id IN (old.{fk}, new.{fk});
+                END
+            ''')
+            conn.execute(f'''
+                CREATE TRIGGER trg_{fact}_delete AFTER DELETE ON {fact}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                    INSERT INTO change_log (tbl, key) SELECT '{table}', {key} FROM {entity} WHERE id = old.{fk};
+                    DELETE FROM {entity} WHERE id = old.{fk} AND {_orphan(entity, fk, f'old.{fk}')};
+                END
+            ''')
+
+    # Changes to a player's or team's shared columns show up in every table of its kind
+    player_tables, team_tables = _values(PLAYER_FACTS), _values(TEAM_FACTS)
+    conn.execute(f'''
+        CREATE TRIGGER trg_players_update AFTER UPDATE ON players
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name IN ({player_tables});
+            INSERT INTO change_log (tbl, key) SELECT column1, old.Player FROM (VALUES {player_tables});
+            INSERT INTO change_log (tbl, key) SELECT column1, new.Player FROM (VALUES {player_tables})
+            WHERE new.Player IS NOT old.Player;
+            UPDATE player_search SET Player = new.Player, Team = (SELECT Team FROM teams WHERE id = new.team_id),
+                Country = new.Country
+            WHERE rowid = new.id;
+            DELETE FROM teams WHERE id = old.team_id AND new.team_id IS NOT old.team_id AND {_orphan('teams', 'team_id', 'old.team_id')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_teams_update AFTER UPDATE ON teams
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name IN ({team_tables});
+            INSERT INTO change_log (tbl, key) SELECT column1, old.Team FROM (VALUES {team_tables});
+            INSERT INTO change_log (tbl, key) SELECT column1, new.Team FROM (VALUES {team_tables})
+            WHERE new.Team IS NOT old.Team;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_teams_rename AFTER UPDATE OF Team ON teams
+        WHEN new.Team IS NOT old.Team AND EXISTS (SELECT 1 FROM players WHERE team_id = new.id)
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name IN ({player_tables});
+            INSERT INTO change_log (tbl, key)
+            SELECT v.column1, p.Player FROM players p, (VALUES {player_tables}) v WHERE p.team_id = new.id;
+            UPDATE player_search SET Team = new.Team WHERE rowid IN (SELECT id FROM players WHERE team_id = new.id);
+        END
+    ''')
+
+    # The search index now has one row per player, with the player's id as rowid
+    conn.execute('''
+        CREATE VIRTUAL TABLE player_search USING fts5(Player, Team, Country, tokenize = 'trigram')
+    ''')
+    conn.execute('''
+        INSERT INTO player_search (rowid, Player, Team, Country)
+        SELECT p.id, p.Player, t.Team, p.Country FROM players p LEFT JOIN teams t ON t.id = p.team_id
+    ''')
+    conn.execute('''
+        CREATE TRIGGER trg_players_search_insert AFTER INSERT ON players
+        BEGIN
+            INSERT INTO player_search (rowid, Player, Team, Country)
+            VALUES (new.id, new.Player, (SELECT Team FROM teams WHERE id = new.team_id), new.Country);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER trg_players_delete AFTER DELETE ON players
+        BEGIN
+            DELETE FROM player_search WHERE rowid = old.id;
+            DELETE FROM teams WHERE id = old.team_id AND {_orphan('teams', 'team_id', 'old.team_id')};
+        END
+    ''')
+
+    for name, table, columns in RANKING_INDEXES:
+        conn.execute(f'CREATE INDEX {name} ON {table} ({columns})')
+    # Matches of a team may have been unified, and every cache keyed on a version must be rebuilt
+    conn.execute('UPDATE table_versions SET version = version + 1')
+
+
+
+@migration(7, 'Last write time per table, for Last-Modified headers')
+def add_table_updated_at(conn):
+    conn.execute('ALTER TABLE table_versions ADD COLUMN updated_at INTEGER')
+    conn.execute("UPDATE table_versions SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)")
+    # Every trigger that bumps a version goes through this one, so none of them had to change
+    conn.execute('''
+        CREATE TRIGGER trg_table_versions_updated_at AFTER UPDATE OF version ON table_versions
+        BEGIN
+            UPDATE table_versions SET updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE name = new.name;
+        END
+    ''')
+
+
+@migration(8, 'Indexes for range filters on Minutes and Tackle_Success_Rate')
+def add_filter_indexes(conn):
+    for name, table, columns in FILTER_INDEXES:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+@migration(9, 'Derived metrics stored per player/team, kept current by triggers (see derived.py)')
+def add_derived_metrics(conn):
+    derived.create(conn)
+
+
+def current_version(conn):
+    """ Highest migration version applied to the database, 0 for a fresh file. """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """ Apply all pending migrations and return the list of versions applied. """
+    applied = []
+    version = current_version(conn)
+    for number, description, func in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have migrated while we waited for the write lock
+            if current_version(conn) >= number:
+                conn.rollback()
+                continue
+            func(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (number, description, datetime.now(timezone.utc).isoformat(timespec='seconds')),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(number)
+    return applied
+
+
+_BOARDS = leaderboards.create_boards()
+
+# Every query app.py issues, with sample parameters: (label, sql, params, allow_scan).
+# allow_scan marks queries that read a whole table by design.
+APP_QUERIES = [
+    ('players_data page', 'SELECT * FROM player_top_scorers WHERE Player > ? ORDER BY Player LIMIT ?', ('', 51), False),
+    ('players_data previous page', 'SELECT * FROM player_top_scorers WHERE Player < ? ORDER BY Player DESC LIMIT ?', ('', 51), False),
+    ('teams_data page', 'SELECT * FROM team_ratings WHERE Team > ? ORDER BY Team LIMIT ?', ('', 51), False),
+    ('export', 'SELECT * FROM player_top_scorers ORDER BY Player', (), True),
+    ('team_stats', 'SELECT Team, FotMob_Team_Rating, Matches FROM team_ratings', (), True),
+    ('player_stats', 'SELECT Player, Team, Goals, Penalties, Minutes, Matches, Country FROM player_top_scorers', (), True),
+    ('remove_team list', profiles.TEAM_LISTING_QUERY, (), True),
+    ('team profile', profiles.TEAM_PROFILE_QUERY + ' WHERE t.Team = ?', ('',), False),
+    ('remove_team delete', 'DELETE FROM team_ratings WHERE Team = ?', ('',), False),
+    ('remove_player list', profiles.PLAYER_LISTING_QUERY, (), True),
+    ('player profile', profiles.PLAYER_PROFILE_QUERY + ' WHERE p.Player = ?', ('',), False),
+    ('remove_player delete', 'DELETE FROM player_ratings WHERE Player = ?', ('',), False),
+    ('query search', search.SEARCH_QUERY.format(column='Player'), ('Kan%', search.match_expression('Player', 'Kan'), 26, 0), True),
+    ('query search (numeric column)', 'SELECT * FROM player_top_scorers WHERE Goals = ? ORDER BY Player LIMIT ? OFFSET ?',
+     (10, 501, 0), False),
+    ('leaderboard refresh', _BOARDS['players'].query + ' WHERE p.Player = ?', ('',), False),
+    ('change log since', 'SELECT DISTINCT key FROM change_log WHERE seq > ? AND seq <= ? AND tbl IN (?, ?)', (0, 10, '', ''), False),
+    ('leaderboard rebuild (players)', _BOARDS['players'].query, (), True),
+    ('leaderboard rebuild (teams)', _BOARDS['teams'].query, (), True),
+    ('modify_teams', 'SELECT t.Team, tr.FotMob_Team_Rating, t.Matches FROM team_rating_stats tr '
+     'JOIN teams t ON t.id = tr.team_id ORDER BY tr.team_id', (), True),
+    # Shapes compiled by filters.compile_filter
+    ('filter (Goals, Minutes, Team)', 'SELECT * FROM player_top_scorers WHERE Goals >= ? AND Minutes < ? AND Team = ? '
+     'ORDER BY Goals DESC, Player LIMIT ? OFFSET ?', (10, 2000, '', 51, 0), False),
+    ('filter (Tackle_Success_Rate between)', 'SELECT * FROM player_tackles_won WHERE Tackle_Success_Rate BETWEEN ? AND ? '
+     'ORDER BY Player LIMIT ? OFFSET ?', (50, 60, 51, 0), False),
+    ('filter (FotMob_Team_Rating)', 'SELECT * FROM team_ratings WHERE FotMob_Team_Rating > ? '
+     'ORDER BY Team LIMIT ? OFFSET ?', (7, 51, 0), False),
+    ('edit_team lookup', 'SELECT * FROM team_ratings WHERE Team = ?', ('',), False),
+    ('edit_team update', 'UPDATE team_ratings SET Team = ?, FotMob_Team_Rating = ?, Matches = ? WHERE Team = ?', ('', 0, 0, ''), False),
+    # Derived metrics: the per-team recomputation the triggers run, a page and a filter on a metric
+    ('derived refresh (one team)', derived.refresh_sql('players', 'p.team_id IS ?'), (0,), False),
+    ('derived page', f'SELECT * FROM {derived.PLAYER_VIEW} WHERE Player > ? ORDER BY Player LIMIT ?', ('', 51), False),
+    ('filter (Goals_per_90)', f'SELECT * FROM {derived.PLAYER_VIEW} WHERE Goals_per_90 >= ? '
+     'ORDER BY Goals_per_90 DESC, Player LIMIT ? OFFSET ?', (0.5, 51, 0), False),
+]
+
+
+def is_table_scan(detail, views=()):
+    """
+    True for plan steps that read a table row by row without an index. Writes to a view
+    scan the view's matching rows to run its INSTEAD OF triggers, and a query with a window
+    function reads its own subquery's rows ("SCAN (subquery-N)"); neither is a table scan.
+    """
+    return (detail.startswith('SCAN ') and ' USING ' not in detail and detail[5:] not in views
+            and not detail[5:].startswith('(subquery-'))
+
+
+def explain(conn, queries=APP_QUERIES):
+    """ Return (label, plan lines, regressed) for each query. regressed flags unexpected table scans. """
+    views = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+    report = []
+    for label, sql, params, allow_scan in queries:
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        regressed = not allow_scan and any(is_table_scan(detail, views) for detail in plan)
+        report.append((label, plan, regressed))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate Bundesliga.db and report query plans.')
+    parser.add_argument('--database', default='Bundesliga.db')
+    parser.add_argument('--explain', action='store_true', help='Print EXPLAIN QUERY PLAN for every app query')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    applied = migrate(conn)
+    print(f"Schema version {current_version(conn)} (applied: {applied or 'none'})")
+
+    if args.explain:
+        regressions = 0
+        for label, plan, regressed in explain(conn):
+            print(f"\n{label}{'  <-- unexpected table scan' if regressed else ''}")
+            for detail in plan:
+                print(f"    {detail}")
+            regressions += regressed
+        conn.close()
+        return 1 if regressions else 0
+
+    conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
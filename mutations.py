@@ -0,0 +1,88 @@
+"""
+Write operations behind the add/remove/edit forms.
+
+Each function takes a connection and runs its statements without committing.
+They are run as jobs on the writer thread (see writer.py), which gives every
+job its own savepoint: a job's statements are applied together or not at all,
+and several jobs share one commit. Numeric fields are checked before anything
+is written: a value that is not a finite number raises ValueError.
+"""
+
+import math
+
+
+def _check_numbers(**fields):
+    """ Raise ValueError naming the first field whose value is not a finite number. """
+    for name, value in fields.items():
+        try:
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            number = math.nan
+        if not math.isfinite(number):
+            raise ValueError(f"{name} must be a number, got {value!r}")
+
+
+def add_team(conn, team_name, fotmob_rating, matches, goals_per_match, total_goals_scored,
+             possession, red_cards, yellow_cards):
+    """ Insert a team into the four team tables. Raises sqlite3.IntegrityError if it already exists. """
+    _check_numbers(fotmob_rating=fotmob_rating, matches=matches, goals_per_match=goals_per_match,
+                   total_goals_scored=total_goals_scored, possession=possession, red_cards=red_cards,
+                   yellow_cards=yellow_cards)
+    conn.execute('''
+        INSERT INTO team_ratings (Team, "FotMob_Team_Rating", Matches)
+        VALUES (?, ?, ?)
+    ''', (team_name, fotmob_rating, matches))
+    conn.execute('''
+        INSERT INTO team_goals_per_match (Team, "Goals_per_Match", "Total_Goals_Scored", Matches)
+        VALUES (?, ?, ?, ?)
+    ''', (team_name, goals_per_match, total_goals_scored, matches))
+    conn.execute('''
+        INSERT INTO possession_percentage_team (Team, Possession_Percentage, Matches)
+        VALUES (?, ?, ?)
+    ''', (team_name, possession, matches))
+    conn.execute('''
+        INSERT INTO total_red_card_team (Team, Red_Cards, Yellow_Cards, Matches)
+        VALUES (?, ?, ?, ?)
+    ''', (team_name, red_cards, yellow_cards, matches))
+
+
+def remove_team(conn, team_name):
+    """ Delete a team from the four team tables. """
+    conn.execute("DELETE FROM team_ratings WHERE Team = ?", (team_name,))
+    conn.execute("DELETE FROM possession_percentage_team WHERE Team = ?", (team_name,))
+    conn.execute("DELETE FROM team_goals_per_match WHERE Team = ?", (team_name,))
+    conn.execute("DELETE FROM total_red_card_team WHERE Team = ?", (team_name,))
+
+
+def edit_team(conn, team_name, updated_team_name, fotmob_rating, matches):
+    """ Update a team's name, rating and matches in team_ratings. """
+    _check_numbers(fotmob_rating=fotmob_rating, matches=matches)
+    conn.execute("""
+        UPDATE team_ratings
+        SET Team = ?, FotMob_Team_Rating = ?, Matches = ?
+        WHERE Team = ?
+    """, (updated_team_name, fotmob_rating, matches, team_name))
+
+
+def add_player(conn, player, team, goals, penalties, minutes, matches, country, fotmob_rating,
+               player_match_awards, expected_goals, tackles_per_90, tackle_success_rate):
+    """ Insert a player into the four player tables. Raises sqlite3.IntegrityError if they already exist. """
+    _check_numbers(goals=goals, penalties=penalties, minutes=minutes, matches=matches, fotmob_rating=fotmob_rating,
+                   player_match_awards=player_match_awards, expected_goals=expected_goals,
+                   tackles_per_90=tackles_per_90, tackle_success_rate=tackle_success_rate)
+    conn.execute('INSERT INTO player_top_scorers (Player, Team, Goals, Penalties, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (player, team, goals, penalties, minutes, matches, country))
+    conn.execute('INSERT INTO player_ratings (Player, Team, FotMob_Rating, Player_Match_Awards, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (player, team, fotmob_rating, player_match_awards, minutes, matches, country))
+    conn.execute('INSERT INTO player_expected_goals (Player, Team, Expected_Goals, Goals, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (player, team, expected_goals, goals, minutes, matches, country))
+    conn.execute('INSERT INTO player_tackles_won (Player, Team, Tackles_per_90, Tackle_Success_Rate, Minutes, Matches, Country) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (player, team, tackles_per_90, tackle_success_rate, minutes, matches, country))
+
+
+def remove_player(conn, player_name):
+    """ Delete a player from the four player tables. """
+    conn.execute("DELETE FROM player_top_scorers WHERE Player = ?", (player_name,))
+    conn.execute("DELETE FROM player_ratings WHERE Player = ?", (player_name,))
+    conn.execute("DELETE FROM player_expected_goals WHERE Player = ?", (player_name,))
+    conn.execute("DELETE FROM player_tackles_won WHERE Player = ?", (player_name,))
@@ -0,0 +1,127 @@
+"""
+Cache of rendered data pages, and conditional responses for them.
+
+The data pages (/players_data, /teams_data, /modify_teams, /remove_player and
+/remove_team) change only when one of their tables is written. A rendered page
+is cached under (template, its tables, the page within them, the tables' data
+versions) in an LRU bounded by total bytes, so a repeat hit neither queries
+nor renders. Writes bump the versions (see migrations.py), so stale entries
+are never asked for again and age out of the LRU.
+
+The same key gives the page's ETag, and the newest modification time of its
+tables gives its Last-Modified, so a browser revalidating its copy gets a 304.
+TableVersions re-reads table_versions only when PRAGMA data_version on its own
+connection shows a commit since the last look, so answering a 304 reads no
+table and renders nothing.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import metrics
+
+metrics.REGISTRY.counter('page_cache_requests_total', 'Data page requests by outcome: not_modified, hit or miss.')
+
+
+class TableVersions:
+    """ Data version and modification time of every table, refreshed when the database has changed. """
+
+    def __init__(self, database, check_interval=0, timeout=20):
+        self.database = database
+        self.check_interval = check_interval  # Seconds between data_version checks, 0 checks on every call
+        self.timeout = timeout
+
+        self._conn = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self._tables = {}  # table -> (version, updated_at in Unix seconds)
+        self._lock = threading.Lock()
+
+    def get(self, tables):
+        """ (tuple of the tables' versions, datetime of the latest write to any of them or None). """
+        with self._lock:
+            self._refresh_if_stale()
+            rows = [self._tables.get(table, (0, None)) for table in tables]
+        versions = tuple(version for version, _ in rows)
+        updated_at = max((updated for _, updated in rows if updated is not None), default=None)
+        modified = datetime.fromtimestamp(updated_at, timezone.utc) if updated_at is not None else None
+        return versions, modified
+
+    def _refresh_if_stale(self):
+        # Caller holds the lock
+        now = time.monotonic()
+        if self._data_version is not None and self.check_interval and now - self._checked_at < self.check_interval:
+            return
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False)
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        self._checked_at = now
+        if data_version != self._data_version:
+            rows = self._conn.execute('SELECT name, version, updated_at FROM table_versions').fetchall()
+            self._tables = {name: (version, updated_at) for name, version, updated_at in rows}
+            self._data_version = data_version
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn, self._data_version = None, None
+
+
+class PageCache:
+    """ Size-bounded LRU of rendered HTML keyed by (template, tables, page, versions). """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+        self._pages = OrderedDict()  # key -> (html, size in bytes), least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(key, salt=''):
+        """ ETag of a page. salt should change when the template does. """
+        return hashlib.sha256(f"{salt}|{key!r}".encode('utf8')).hexdigest()[:32]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                return None
+            self._pages.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, html):
+        size = len(html.encode('utf8'))
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._pages[key] = (html, size)
+            self._size += size
+            while self._size > self.max_bytes and len(self._pages) > 1:
+                _, (_, evicted) = self._pages.popitem(last=False)
+                self._size -= evicted
+
+    def __len__(self):
+        return len(self._pages)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._size = 0
+
+
+def init_app(app):
+    """ Create the app's page cache and version tracker from config. """
+    pool = app.extensions['db_pool']
+    app.extensions['page_cache'] = PageCache(max_bytes=app.config.get('PAGE_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    app.extensions['table_versions'] = TableVersions(
+        pool.database,
+        check_interval=app.config.get('PAGE_CACHE_CHECK_INTERVAL_MS', 0) / 1000,
+        timeout=pool.timeout,
+    )
@@ -0,0 +1,95 @@
+"""
+Keyset pagination and streaming export for the data tables.
+
+Pages are sought by the table's unique key column (Player or Team, indexed by
+migrations.py) instead of using OFFSET, so each page is an index seek of
+page_size rows however deep into the table it is. Exports stream rows from
+the cursor in batches, so memory per request stays constant.
+"""
+
+import csv
+import io
+import json
+
+# Unique, indexed sort column of each table
+KEY_COLUMNS = {
+    'player_expected_goals': 'Player',
+    'player_ratings': 'Player',
+    'player_tackles_won': 'Player',
+    'player_top_scorers': 'Player',
+    'possession_percentage_team': 'Team',
+    'team_goals_per_match': 'Team',
+    'team_ratings': 'Team',
+    'total_red_card_team': 'Team',
+    'player_derived_metrics': 'Player',
+    'team_derived_metrics': 'Team',
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+BATCH_SIZE = 500
+
+
+def keyset_page(conn, table, page_size, after=None, before=None):
+    """
+    One page of a table ordered by its key column.
+    Pass after (the last key of the previous page) to go forward, or before (the first key of
+    the next page) to go back. Returns (columns, rows, next_after, prev_before); the cursors are
+    None when there is no page in that direction.
+    """
+    key = KEY_COLUMNS[table]
+
+    if before is not None:
+        cursor = conn.execute(
+            f"SELECT * FROM {table} WHERE {key} < ? ORDER BY {key} DESC LIMIT ?", (before, page_size + 1))
+        rows = cursor.fetchall()
+        has_prev = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            cursor = conn.execute(
+                f"SELECT * FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?", (after, page_size + 1))
+        else:
+            cursor = conn.execute(f"SELECT * FROM {table} ORDER BY {key} LIMIT ?", (page_size + 1,))
+        rows = cursor.fetchall()
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = after is not None
+
+    columns = [description[0] for description in cursor.description]
+    next_after = rows[-1][key] if rows and has_next else None
+    prev_before = rows[0][key] if rows and has_prev else None
+    return columns, rows, next_after, prev_before
+
+
+def stream_table(conn, table, fmt):
+    """ Generator of CSV or NDJSON chunks for every row of a table, in key order. """
+    key = KEY_COLUMNS[table]
+    cursor = conn.execute(f"SELECT * FROM {table} ORDER BY {key}")
+    columns = [description[0] for description in cursor.description]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            if writer:
+                writer.writerow(tuple(row))
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,194 @@
+"""
+Cache of rendered plot images.
+
+Plots are addressed by a digest of what they depict: the plot kind (including
+its image format), the table, the statistic and the table's data version. A
+page links to /plots/<digest>.<format> straight away, and the image is
+rendered in the background (see render_pool.RenderPool) only when that digest
+is not cached or pending yet. Writes to a table bump its data version (see
+migrations.py), so stale plots get new digests, and they are dropped as soon
+as a newer version of the same table is cached.
+
+Images are kept in an LRU bounded by total bytes. When PLOT_CACHE_DIR is set
+they are also written to disk, so a restarted worker can still serve them.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future
+
+
+class PlotCache:
+    """ Size-bounded LRU of images (PNG or SVG bytes) keyed by digest, optionally persisted to a directory. """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, directory=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self._images = OrderedDict()  # digest -> image bytes, least recently used first
+        self._tables = {}  # digest -> (table, data version)
+        self._latest = {}  # table -> newest data version seen
+        self._pending = {}  # digest -> Future of image bytes still rendering
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def digest(kind, table, stat, version):
+        """ Content address of a plot. """
+        key = f"{kind}|{table}|{stat}|{version}"
+        return hashlib.sha256(key.encode('utf8')).hexdigest()[:32]
+
+    def get(self, digest):
+        """ Image bytes for a digest, or None if it is not cached. """
+        with self._lock:
+            image = self._images.get(digest)
+            if image is not None:
+                self._images.move_to_end(digest)
+                return image
+
+        path = self._path(digest)
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                image = f.read()
+            self._store(digest, image)
+            return image
+        return None
+
+    def get_or_submit(self, kind, table, stat, version, submit):
+        """ Digest of the plot. On a cache miss submit() is called and must return a Future of the image bytes. """
+        digest = self.digest(kind, table, stat, version)
+        self._evict_stale(table, version)
+        if self.get(digest) is not None:
+            return digest
+
+        # Reserve the digest with a placeholder, so the render (inline for SVG) runs outside the lock
+        placeholder = Future()
+        with self._lock:
+            if digest in self._pending:
+                return digest
+            self._pending[digest] = placeholder
+
+        try:
+            future = submit()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop(digest, None)
+            placeholder.set_exception(e)
+            raise
+
+        def finished(future):
+            if future.cancelled() or future.exception() is not None:
+                with self._lock:
+                    self._pending.pop(digest, None)
+                placeholder.set_exception(future.exception() if not future.cancelled() else CancelledError())
+                return
+            image = future.result()
+            self._store(digest, image, table, version)
+            self._persist(digest, image)
+            with self._lock:
+                self._pending.pop(digest, None)
+            placeholder.set_result(image)
+
+        future.add_done_callback(finished)
+        return digest
+
+    def wait(self, digest, timeout=None):
+        """
+        Image bytes for a digest, waiting up to timeout seconds if it is still rendering.
+        Returns None for unknown digests. Raises TimeoutError if the render is not done in time.
+        """
+        image = self.get(digest)
+        if image is not None:
+            return image
+
+        with self._lock:
+            future = self._pending.get(digest)
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._tables.clear()
+            self._latest.clear()
+            self._size = 0
+
+    def _store(self, digest, image, table=None, version=None):
+        with self._lock:
+            if digest in self._images:
+                self._size -= len(self._images.pop(digest))
+            self._images[digest] = image
+            self._size += len(image)
+            if table is not None:
+                self._tables[digest] = (table, version)
+
+            while self._size > self.max_bytes and len(self._images) > 1:
+                oldest = next(iter(self._images))
+                self._remove(oldest)
+
+    def _remove(self, digest):
+        # Caller holds the lock
+        image = self._images.pop(digest, None)
+        if image is not None:
+            self._size -= len(image)
+        self._tables.pop(digest, None)
+
+    def _evict_stale(self, table, version):
+        """ Drop plots of older data versions once a newer version of the table is requested. """
+        with self._lock:
+            if self._latest.get(table) == version:
+                return
+            self._latest[table] = version
+            for digest in [d for d, (t, v) in self._tables.items() if t == table and v != version]:
+                self._remove(digest)
+
+    def _path(self, digest):
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{digest}.plot")
+
+    def _persist(self, digest, image):
+        path = self._path(digest)
+        if not path:
+            return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(image)
+        os.replace(tmp, path)
+        self._prune_disk()
+
+    def _prune_disk(self):
+        """ Delete the least recently written files while the directory is over its size limit. """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(('.plot', '.png')):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def init_app(app):
+    """ Create the app's plot cache from config. """
+    app.extensions['plot_cache'] = PlotCache(
+        max_bytes=app.config.get('PLOT_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+        directory=app.config.get('PLOT_CACHE_DIR'),
+        max_disk_bytes=app.config.get('PLOT_CACHE_MAX_DISK_BYTES', 256 * 1024 * 1024),
+    )
@@ -0,0 +1,66 @@
+"""
+Plot rendering for the stats pages.
+
+Figures are built with matplotlib's object-oriented Figure/Agg canvas API
+instead of pyplot, so no global figure state is kept and every figure is
+explicitly cleared once its PNG has been written.
+
+These functions run in the worker processes of render_pool.RenderPool. The
+module imports matplotlib, so the app only imports it on first use. It is the
+'matplotlib' chart backend (see charts.py).
+"""
+
+import io
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+FORMAT = 'png'
+INLINE = False
+
+
+def _to_png(fig):
+    """ Write a figure to PNG bytes and dispose of it. """
+    try:
+        FigureCanvasAgg(fig)
+        img = io.BytesIO()
+        fig.savefig(img, format='png')
+        return img.getvalue()
+    finally:
+        fig.clear()
+
+
+def render_stat_plot(values, selected_stat):
+    """
+    Bar plot of the selected statistic (mean, min, max, etc.) for each column of player or team stats.
+    values maps each column to its precomputed statistic (see stats.TableSummary.stat).
+    Returns the PNG image bytes.
+    """
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+
+    for stat, stat_value in values.items():
+        ax.bar(stat, stat_value, label=f"{stat} ({selected_stat})")
+
+    ax.set_title(f'Visualization - {selected_stat.capitalize()} Values')
+    ax.set_ylabel(f'{selected_stat.capitalize()} Value')
+    ax.legend()
+
+    return _to_png(fig)
+
+
+def render_scatter_plot(minutes, goals):
+    """
+    Scatter plot of Minutes Played vs Goals Scored.
+    Returns the PNG image bytes.
+    """
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+
+    ax.scatter(minutes, goals, color='blue', label='Minutes vs Goals', alpha=0.7)
+    ax.set_title('Minutes Played vs Goals Scored')
+    ax.set_xlabel('Minutes Played')
+    ax.set_ylabel('Goals Scored')
+    ax.legend()
+
+    return _to_png(fig)
@@ -0,0 +1,60 @@
+"""
+Consolidated player and team profiles.
+
+A profile combines a player's (or team's) rows from all four of its tables.
+Each listing is one query over the normalized tables (see migration 6 in
+migrations.py): the entity row joined to its fact rows by integer id, so it
+runs in a single pass instead of matching rows across lists in Python.
+Listings are ordered by id, which follows insertion order, so they list rows
+in the order of the legacy player_top_scorers and team_ratings tables.
+"""
+
+PLAYER_PROFILE_QUERY = '''
+    SELECT p.Player, t.Team, pt.Goals, p.Matches, pt.Penalties,
+           pr.FotMob_Rating, pr.Player_Match_Awards, p.Minutes, p.Country,
+           pe.Expected_Goals, pe.Goals AS Actual_Goals,
+           tw.Tackles_per_90, tw.Tackle_Success_Rate
+    FROM player_goal_stats pt
+    JOIN players p ON p.id = pt.player_id
+    LEFT JOIN teams t ON t.id = p.team_id
+    LEFT JOIN player_rating_stats pr ON pr.player_id = pt.player_id
+    LEFT JOIN player_xg_stats pe ON pe.player_id = pt.player_id
+    LEFT JOIN player_tackle_stats tw ON tw.player_id = pt.player_id
+'''
+
+TEAM_PROFILE_QUERY = '''
+    SELECT t.Team, tr.FotMob_Team_Rating, t.Matches,
+           pp.Possession_Percentage,
+           tg.Goals_per_Match, tg.Total_Goals_Scored,
+           rc.Red_Cards, rc.Yellow_Cards
+    FROM team_rating_stats tr
+    JOIN teams t ON t.id = tr.team_id
+    LEFT JOIN team_possession_stats pp ON pp.team_id = tr.team_id
+    LEFT JOIN team_goal_stats tg ON tg.team_id = tr.team_id
+    LEFT JOIN team_card_stats rc ON rc.team_id = tr.team_id
+'''
+
+PLAYER_LISTING_QUERY = PLAYER_PROFILE_QUERY + ' ORDER BY pt.player_id'
+TEAM_LISTING_QUERY = TEAM_PROFILE_QUERY + ' ORDER BY tr.team_id'
+
+
+def player_profiles(conn):
+    """ Profiles of every player in player_top_scorers. """
+    return [dict(row) for row in conn.execute(PLAYER_LISTING_QUERY)]
+
+
+def player_profile(conn, player_name):
+    """ Profile of a single player, or None if the player does not exist. """
+    row = conn.execute(PLAYER_PROFILE_QUERY + ' WHERE p.Player = ?', (player_name,)).fetchone()
+    return dict(row) if row else None
+
+
+def team_profiles(conn):
+    """ Profiles of every team in team_ratings. """
+    return [dict(row) for row in conn.execute(TEAM_LISTING_QUERY)]
+
+
+def team_profile(conn, team_name):
+    """ Profile of a single team, or None if the team does not exist. """
+    row = conn.execute(TEAM_PROFILE_QUERY + ' WHERE t.Team = ?', (team_name,)).fetchone()
+    return dict(row) if row else None
@@ -0,0 +1,97 @@
+"""
+Process pool that renders plots off the request thread.
+
+The pool has a bounded number of pending jobs, and callers wait on the
+returned future with a timeout. Worker processes are spawned on first use and
+import the plotting stack themselves, so neither creating the pool nor
+importing this module loads matplotlib.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import metrics
+
+
+class RenderQueueFull(Exception):
+    """ Raised when the render pool already has its maximum number of pending jobs. """
+
+
+class RenderPool:
+    """
+    Process pool for plot rendering with a bounded number of pending jobs.
+
+    With workers=0 jobs run inline on the calling thread, which is handy for
+    debugging and single-process tools.
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=10, max_tasks_per_child=500):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Started on first use so importing the app does not spawn processes
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+            return self._executor
+
+    def submit(self, func, *args, inline=False):
+        """
+        Queue a render job and return its Future. Raises RenderQueueFull when the queue is at capacity.
+        inline=True runs it on the calling thread instead, for renders cheaper than a trip to a worker.
+        """
+        labels = (('plot', func.__name__),)
+        start = time.perf_counter()
+
+        def record(_):
+            metrics.REGISTRY.observe('plot_render_duration_seconds', time.perf_counter() - start, labels)
+
+        if inline or self.workers <= 0:
+            future = Future()
+            future.add_done_callback(record)
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not self._slots.acquire(blocking=False):
+            metrics.REGISTRY.inc('plot_renders_rejected_total', labels)
+            raise RenderQueueFull(f"{self.max_pending} plot renders already pending")
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        future.add_done_callback(record)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+def init_app(app):
+    """ Create the app's render pool from config. """
+    app.extensions['render_pool'] = RenderPool(
+        workers=app.config.get('PLOT_WORKERS', 2),
+        max_pending=app.config.get('PLOT_QUEUE_SIZE', 16),
+        timeout=app.config.get('PLOT_RENDER_TIMEOUT', 10),
+    )
@@ -0,0 +1,123 @@
+"""
+In-memory read replica of the database.
+
+With READ_REPLICA on, each worker process keeps a copy of the database in RAM
+and the read-only routes query it (see db.get_read_db) instead of the file.
+The copy is filled with SQLite's online backup API into a shared-cache
+in-memory database, so any number of connections in the process can read it.
+
+Staleness is detected with PRAGMA data_version on a dedicated connection to
+the file, which changes whenever any other connection (in any process)
+commits. When it has moved, the next read builds a fresh copy under a new
+name and switches new requests over to it. Requests already holding the
+previous copy finish on it, and its connections are closed as they are handed
+back. Copies are never written to, so readers of a copy never wait on each
+other or on a refresh.
+"""
+
+import itertools
+import sqlite3
+import threading
+import time
+
+import metrics
+
+metrics.REGISTRY.counter('replica_refreshes_total', 'In-memory replica rebuilds.')
+metrics.REGISTRY.histogram('replica_refresh_duration_seconds', 'Time to copy the database into a new in-memory replica.',
+                           metrics.REQUEST_BUCKETS)
+
+_names = itertools.count(1)
+
+
+class Replica:
+    """ Generations of an in-memory copy of one database file, with a small pool of reader connections each. """
+
+    def __init__(self, database, factory=sqlite3.Connection, check_interval=0, max_idle=8, timeout=20):
+        self.database = database
+        self.factory = factory
+        self.check_interval = check_interval  # Seconds between data_version checks, 0 checks on every acquire
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        self._source = None  # Connection to the file, used for data_version and backups
+        self._uri = None  # URI of the current copy
+        self._anchor = None  # Keeps the current copy alive while no reader is open
+        self._version = None
+        self._checked_at = 0.0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _open(self, uri):
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self):
+        """ Borrow a reader connection to an up-to-date copy. Returns (conn, uri) to pass back to release(). """
+        self.refresh_if_stale()
+        with self._lock:
+            uri = self._uri
+            if self._idle:
+                return self._idle.pop(), uri
+        conn = self._open(uri)
+        conn.execute('PRAGMA query_only=ON')
+        return conn, uri
+
+    def release(self, conn, uri):
+        with self._lock:
+            if uri == self._uri and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def refresh_if_stale(self):
+        if self._uri is not None and self.check_interval and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._refresh_lock:
+            if self._source is None:
+                self._source = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False)
+            version = self._source.execute('PRAGMA data_version').fetchone()[0]
+            self._checked_at = time.monotonic()
+            if version != self._version or self._uri is None:
+                self._refresh(version)
+
+    def _refresh(self, version):
+        start = time.perf_counter()
+        uri = f"file:bundesliga-replica-{id(self)}-{next(_names)}?mode=memory&cache=shared"
+        anchor = self._open(uri)
+        # One step: the copy is a consistent snapshot of the file as of this read transaction
+        self._source.backup(anchor)
+
+        with self._lock:
+            old_anchor, old_idle = self._anchor, self._idle
+            self._uri, self._anchor, self._idle = uri, anchor, []
+            self._version = version
+        for conn in old_idle:
+            conn.close()
+        if old_anchor is not None:
+            old_anchor.close()
+
+        metrics.REGISTRY.inc('replica_refreshes_total')
+        metrics.REGISTRY.observe('replica_refresh_duration_seconds', time.perf_counter() - start)
+
+    def close(self):
+        with self._lock:
+            conns = self._idle + [c for c in (self._anchor, self._source) if c is not None]
+            self._idle, self._anchor, self._source, self._uri = [], None, None, None
+        for conn in conns:
+            conn.close()
+
+
+def init_app(app):
+    """ Create the replica when READ_REPLICA is on. """
+    if not app.config.get('READ_REPLICA', False):
+        return
+    pool = app.extensions['db_pool']
+    app.extensions['replica'] = Replica(
+        pool.database,
+        factory=pool.factory,
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL_MS', 0) / 1000,
+        max_idle=max(pool.size, 1),
+        timeout=pool.timeout,
+    )
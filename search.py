@@ -0,0 +1,51 @@
+"""
+Substring and prefix search over player name, team and country.
+
+Searches go through the player_search FTS5 table (trigram tokenizer, one row
+per player with the player's id as rowid, kept in sync by triggers, see
+migrations.py), so they are index lookups instead of leading-wildcard LIKE
+scans. Results are ranked with prefix matches first and then by bm25, and
+paginated.
+"""
+
+# Columns indexed in player_search
+SEARCH_COLUMNS = ['Player', 'Team', 'Country']
+
+# The trigram tokenizer needs at least three characters to use the index
+MIN_QUERY_LENGTH = 3
+
+SEARCH_QUERY = '''
+    SELECT s.Player, s.Team, pt.Goals, pt.Penalties, p.Minutes, p.Matches, s.Country
+    FROM (
+        SELECT rowid AS id, Player, Team, Country, rank AS score,
+               {column} LIKE ? ESCAPE '\\' AS is_prefix
+        FROM player_search
+        WHERE player_search MATCH ?
+    ) s
+    JOIN players p ON p.id = s.id
+    LEFT JOIN player_goal_stats pt ON pt.player_id = s.id
+    ORDER BY s.is_prefix DESC, s.score, s.Player
+    LIMIT ? OFFSET ?
+'''
+
+
+def can_search(column, value):
+    """ True if the full-text index can answer this search. """
+    return column in SEARCH_COLUMNS and len(value.strip()) >= MIN_QUERY_LENGTH
+
+
+def match_expression(column, value):
+    """ FTS5 query matching value as a substring of one column. """
+    phrase = value.strip().replace('"', '""')
+    return f'{{{column}}} : "{phrase}"'
+
+
+def search_players(conn, column, value, page=1, page_size=25):
+    """
+    One page of players whose column contains value, in player_top_scorers' column layout.
+    Returns (rows, has_next).
+    """
+    prefix = value.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    params = (prefix, match_expression(column, value), page_size + 1, (page - 1) * page_size)
+    rows = conn.execute(SEARCH_QUERY.format(column=column), params).fetchall()
+    return rows[:page_size], len(rows) > page_size
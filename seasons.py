@@ -0,0 +1,324 @@
+"""
+Season-partitioned storage: one database file per season.
+
+The current season is Config.DATABASE, the only one that is written. Past
+seasons are archived to SEASONS_DIR as <season>.db (e.g. 2022-23.db, see the
+archive-season command) with the same schema, and are read-only from then on.
+
+Every route takes a season selector (?season= or a season form field, see
+app.py). A request for an archived season reads it through its own small pool
+of connections: each one is an empty in-memory database with the season's
+file ATTACHed, so the app's unqualified queries (views, indexes, change log)
+resolve to that season's tables and the current season's scans never grow
+with history. Archives are attached with immutable=1, so SQLite takes no
+locks and never checks for changes, and memory-mapped in full, so reads come
+straight out of the page cache without copying.
+
+Queries across seasons (see union_all) attach the selected archives on demand
+to the reading connection under season_<yyyy_yy> schema names, next to the
+current season in main, and combine one qualified SELECT per season with
+UNION ALL.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+
+import click
+
+import db
+import filters
+import migrations
+import paging
+
+SEASON_FORMAT = re.compile(r'^(\d{4})-(\d{2})$')  # e.g. 2023-24
+
+
+class SeasonError(ValueError):
+    """ Raised for unknown or malformed season names. """
+
+
+def check_name(season):
+    """ Validate a season name such as 2023-24, whose second year follows the first. """
+    match = SEASON_FORMAT.match(season or '')
+    if match is None or (int(match.group(1)) + 1) % 100 != int(match.group(2)):
+        raise SeasonError(f"Invalid season {season!r}, expected e.g. 2023-24")
+    return season
+
+
+def schema(season):
+    """ Schema name an archived season is attached under, e.g. season_2023_24. """
+    return 'season_' + check_name(season).replace('-', '_')
+
+
+def archive_uri(path):
+    """ URI that opens an archive read-only and immutable: no locking, no change detection. """
+    return f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro&immutable=1"
+
+
+def attach(conn, season, path, mmap_size=0):
+    """ ATTACH an archived season under schema(season), memory-mapping up to mmap_size bytes of it. """
+    name = schema(season)
+    conn.execute(f'ATTACH DATABASE ? AS {name}', (archive_uri(path),))
+    if mmap_size:
+        conn.execute(f'PRAGMA {name}.mmap_size={mmap_size}')
+    return name
+
+
+class ArchivePool(db.ConnectionPool):
+    """
+    Readers of one archived season: an empty in-memory main database with the season's file
+    attached, so unqualified table names resolve to it.
+    """
+
+    def __init__(self, season, path, **kwargs):
+        super().__init__(':memory:', **kwargs)
+        self.season = season
+        self.path = path
+        # Map the whole file: it never changes, so every read is served from the mapping
+        self.mmap_size = max(self.mmap_size, os.path.getsize(path))
+        self.modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+    def connect(self):
+        conn = super().connect()
+        attach(conn, self.season, self.path, self.mmap_size)
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+
+class Seasons:
+    """ The current season and the archives found in a directory, with a reader pool per archive. """
+
+    def __init__(self, current, directory=None, **pool_options):
+        self.current = check_name(current)
+        self.directory = directory
+        self.pool_options = pool_options  # Passed to each ArchivePool (size, timeout, factory...)
+
+        self._paths = {}  # archived season -> file
+        self._pools = {}  # archived season -> ArchivePool, opened on first use
+        self._state = {}  # (archived season, name) -> per-season in-memory structure, see extension()
+        self._lock = threading.Lock()
+        self.scan()
+
+    def scan(self):
+        """ Look for archives in the directory again, e.g. after archive-season. Returns the archived seasons. """
+        paths = {}
+        if self.directory and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                season, ext = os.path.splitext(filename)
+                if ext == '.db' and SEASON_FORMAT.match(season) and season != self.current:
+                    paths[season] = os.path.join(self.directory, filename)
+        with self._lock:
+            self._paths = paths
+        return sorted(paths, reverse=True)
+
+    def names(self):
+        """ Every season, newest first. """
+        return sorted([self.current, *self._paths], reverse=True)
+
+    def is_archived(self, season):
+        """ True for an archived season, False for the current one. Raises SeasonError for unknown seasons. """
+        check_name(season)
+        if season == self.current:
+            return False
+        if season not in self._paths:
+            self.scan()  # Archived since startup?
+            if season not in self._paths:
+                raise SeasonError(f"Unknown season {season!r}")
+        return True
+
+    def select(self, names):
+        """ The seasons in names (a list, or one comma-separated string), newest first; every season if empty. """
+        if isinstance(names, str):
+            names = names.split(',')
+        names = {name.strip() for name in names or () if name.strip()}
+        for season in names:
+            self.is_archived(season)
+        return sorted(names or self.names(), reverse=True)
+
+    def pool(self, season):
+        """ The reader pool of an archived season, checking its schema the first time. """
+        with self._lock:
+            pool = self._pools.get(season)
+            if pool is None:
+                path = self._paths[season]
+                check_archive(path)
+                pool = self._pools[season] = ArchivePool(season, path, **self.pool_options)
+        return pool
+
+    def extension(self, app, season, name, factory):
+        """
+        An in-memory structure such as the aggregates or the leaderboards for a season:
+        app.extensions[name] for the current season, otherwise one made by factory() for that archive.
+        """
+        if season == self.current:
+            state = app.extensions.get(name)
+            return state if state is not None else app.extensions.setdefault(name, factory())
+        with self._lock:
+            state = self._state.get((season, name))
+            if state is None:
+                state = self._state[(season, name)] = factory()
+        return state
+
+    def attach_all(self, conn, seasons):
+        """
+        Attach the archived seasons among seasons to conn (a connection to the current season) unless they
+        already are, detaching other archives if SQLite's limit on attached databases is reached.
+        Returns {season: schema} with 'main' for the current season.
+        """
+        schemas = {season: 'main' if season == self.current else schema(season) for season in seasons}
+        attached = {row[1] for row in conn.execute('PRAGMA database_list') if row[1].startswith('season_')}
+        missing = [season for season, name in schemas.items() if name != 'main' and name not in attached]
+        if not missing:
+            return schemas
+
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        if len(schemas) - (self.current in schemas) > limit:
+            raise SeasonError(f"At most {limit} archived seasons can be queried together")
+        for name in sorted(attached - set(schemas.values()))[:max(0, len(attached) + len(missing) - limit)]:
+            conn.execute(f'DETACH DATABASE {name}')
+        for season in missing:
+            self.pool(season)  # Checks the archive's schema once
+            attach(conn, season, self._paths[season], self.pool(season).mmap_size)
+        return schemas
+
+    def union_all(self, conn, seasons, select):
+        """
+        SQL combining select, formatted once per season with {schema} and {season} (a quoted literal),
+        with UNION ALL, after attaching the archives it needs to conn.
+        """
+        schemas = self.attach_all(conn, seasons)
+        return '\nUNION ALL\n'.join(
+            select.format(schema=name, season=f"'{season}'") for season, name in schemas.items())
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+def _stat_column(table, stat):
+    """ Check that stat is a numeric column of one of the eight tables. Returns the table's key column. """
+    columns = filters.table_columns(table)
+    if columns is None:
+        raise SeasonError(f"Unknown table: {table!r}")
+    if stat not in columns or not filters.is_numeric(stat):
+        raise SeasonError(f"{stat!r} is not a numeric column of {table}")
+    return paging.KEY_COLUMNS[table]
+
+
+def rankings(registry, conn, seasons, table, stat, n=10, combine=None):
+    """
+    Top n of table by stat over several seasons, as a JSON-ready dict.
+    Without combine, rows are single seasons (a player's best season may rank next to another's):
+    each season's own top n, read through its index on stat, merged by UNION ALL.
+    With combine (sum, avg, max or min), stat is combined per player/team over the seasons, e.g. career goals.
+    """
+    key = _stat_column(table, stat)
+    if combine is None:
+        select = (f"SELECT * FROM (SELECT {{season}} AS Season, {key}, {stat} FROM {{schema}}.{table} "
+                  f"WHERE {stat} IS NOT NULL ORDER BY {stat} DESC LIMIT ?)")
+        sql = (f"SELECT * FROM ({registry.union_all(conn, seasons, select)}) "
+               f"ORDER BY {stat} DESC, Season DESC, {key} LIMIT ?")
+        params = [n] * len(seasons) + [n]
+    elif combine in ('sum', 'avg', 'max', 'min'):
+        select = f"SELECT {key}, {stat} FROM {{schema}}.{table} WHERE {stat} IS NOT NULL"
+        sql = (f"SELECT {key}, {combine.upper()}({stat}) AS {stat}, COUNT(*) AS Seasons "
+               f"FROM ({registry.union_all(conn, seasons, select)}) GROUP BY {key} ORDER BY 2 DESC, {key} LIMIT ?")
+        params = [n]
+    else:
+        raise SeasonError("combine must be one of sum, avg, max or min")
+
+    cursor = conn.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    return {'table': table, 'stat': stat, 'seasons': list(seasons), 'combine': combine, 'columns': columns,
+            'rows': [dict(zip(columns, row)) for row in cursor.fetchall()]}
+
+
+def summary(registry, conn, seasons, table, stat):
+    """ Count, total, mean, min and max of stat in each season and over all of them, from one UNION ALL. """
+    _stat_column(table, stat)
+    select = f"SELECT {{season}} AS Season, {stat} AS value FROM {{schema}}.{table}"
+    aggregates = 'COUNT(value) AS Count, SUM(value) AS Total, AVG(value) AS Mean, MIN(value) AS Min, MAX(value) AS Max'
+    sql = (f"WITH partitions AS ({registry.union_all(conn, seasons, select)}) "
+           f"SELECT * FROM (SELECT Season, {aggregates} FROM partitions GROUP BY Season ORDER BY Season DESC) "
+           f"UNION ALL SELECT NULL, {aggregates} FROM partitions")
+    cursor = conn.execute(sql)
+    columns = [d[0] for d in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return {'table': table, 'stat': stat, 'seasons': rows[:-1], 'all': rows[-1]}
+
+
+def check_archive(path):
+    """ Archives are never migrated (they are immutable), so they must have been written at the latest schema. """
+    conn = sqlite3.connect(archive_uri(path), uri=True)
+    try:
+        version = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+    except sqlite3.Error as e:
+        raise SeasonError(f"{path} is not a Bundesliga database: {e}")
+    finally:
+        conn.close()
+    latest = migrations.MIGRATIONS[-1][0]
+    if version != latest:
+        raise SeasonError(f"{path} is at schema version {version}, re-archive it to reach version {latest}")
+
+
+def archive(source, target):
+    """
+    Copy a season's database to target with VACUUM INTO (a consistent snapshot, even while it is in use),
+    bring the copy's schema up to date and leave it as a single file ready to be opened immutable.
+    """
+    if os.path.exists(target):
+        raise SeasonError(f"{target} already exists")
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    conn = sqlite3.connect(source)
+    try:
+        conn.execute('VACUUM INTO ?', (target,))
+    finally:
+        conn.close()
+
+    conn = sqlite3.connect(target)
+    try:
+        applied = migrations.migrate(conn)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+    return applied
+
+
+def init_app(app):
+    """ Find the archived seasons and register the archive-season command. """
+    pool = app.extensions['db_pool']
+    app.extensions['seasons'] = Seasons(
+        app.config.get('CURRENT_SEASON', '2023-24'),
+        app.config.get('SEASONS_DIR'),
+        size=app.config.get('SEASON_POOL_SIZE', 4),
+        timeout=pool.timeout,
+        cache_size_kib=pool.cache_size_kib,
+        mmap_size=pool.mmap_size,
+        statement_cache=pool.statement_cache,
+        factory=pool.factory,
+    )
+
+    @app.cli.command('archive-season')
+    @click.argument('season')
+    @click.option('--source', help='Database to archive, the current one (DATABASE) by default')
+    def archive_season(season, source):
+        """ Copy a season's database into SEASONS_DIR as a read-only archive. """
+        seasons = app.extensions['seasons']
+        if not seasons.directory:
+            raise click.ClickException('Set SEASONS_DIR to archive seasons')
+        try:
+            check_name(season)
+            target = os.path.join(seasons.directory, f"{season}.db")
+            applied = archive(source or pool.database, target)
+        except (SeasonError, sqlite3.Error) as e:
+            raise click.ClickException(str(e))
+        seasons.scan()
+        print(f"Archived {season} to {target} (migrations applied: {applied or 'none'})")
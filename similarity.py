@@ -0,0 +1,321 @@
+"""
+"Similar players": nearest neighbours over combined stat vectors.
+
+Every player gets one row of FEATURES, drawn from the four player tables
+(a player missing from a table has NaN for its columns, and so has a cell
+that is not a finite number, as in aggregates.number). The rows live in a
+float32 matrix memory-mapped to a file, so a large squad does not have to sit
+in the Python heap and the OS can page it. Each column is standardized
+(z-score over the players that have it), and a missing value becomes the
+column mean, i.e. 0.
+
+A query is a handful of NumPy operations over the whole matrix instead of a
+Python loop over rows: squared distances to the query vectors come from
+|x|^2 - 2 x.q + |q|^2 as one matrix product, and the k nearest from
+argpartition. Team and country filters are boolean masks over integer codes.
+
+The index follows the change log like the leaderboards (see changes.py):
+after add_player, remove_player, an import or a team rename it re-reads only
+the players written since its last sync and patches their rows. Column sums
+are kept up to date as rows change, so the column statistics cost nothing to
+recompute; the whole matrix is standardized again (one vectorized pass) only
+once they have drifted by STATS_TOLERANCE.
+"""
+
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+import aggregates
+import changes
+import migrations
+
+# (column, table alias in FEATURE_QUERY)
+FEATURES = [
+    ('Expected_Goals', 'x'),
+    ('Goals', 'g'),
+    ('FotMob_Rating', 'r'),
+    ('Player_Match_Awards', 'r'),
+    ('Tackles_per_90', 'k'),
+    ('Tackle_Success_Rate', 'k'),
+    ('Penalties', 'g'),
+    ('Minutes', 'p'),
+]
+
+FEATURE_QUERY = f'''
+    SELECT p.Player, t.Team, p.Country, {', '.join(f'{alias}.{column}' for column, alias in FEATURES)}
+    FROM players p
+    LEFT JOIN teams t ON t.id = p.team_id
+    LEFT JOIN player_xg_stats x ON x.player_id = p.id
+    LEFT JOIN player_goal_stats g ON g.player_id = p.id
+    LEFT JOIN player_rating_stats r ON r.player_id = p.id
+    LEFT JOIN player_tackle_stats k ON k.player_id = p.id
+'''
+
+MIN_CAPACITY = 1024
+# How far (in standard deviations) the column means/deviations may drift from the ones the matrix was
+# standardized with before every row is standardized again; until then only changed rows are
+STATS_TOLERANCE = 0.01
+
+
+class SimilarityIndex(changes.ChangeFollower):
+    """ Standardized feature vectors of every player, for top-k nearest-neighbour queries. """
+
+    def __init__(self, directory=None):
+        super().__init__(migrations.PLAYER_TABLES)
+        self.directory = directory  # Where the memory-mapped matrices live, a temporary directory if None
+
+        self._raw = None  # capacity x len(FEATURES) memmap of raw values, NaN where missing
+        self._matrix = None  # Same shape, standardized, missing values 0
+        self._norms = None  # Squared row norms of _matrix
+        self._valid = np.zeros(0, dtype=bool)  # Rows that hold a player
+        self._teams = np.zeros(0, dtype=np.int32)  # Code of each row's team, -1 for none
+        self._countries = np.zeros(0, dtype=np.int32)
+        self._slots = {}  # player -> row
+        self._names = []  # row -> player
+        self._free = []  # Rows of removed players, reused first
+        self._team_codes, self._country_codes = {}, {}  # team/country -> code
+        self._team_names, self._country_names = [], []  # code -> team/country
+        self._sums = np.zeros((3, len(FEATURES)))  # Running count, sum and sum of squares of each column
+        self._mean, self._std = None, None  # Column statistics _matrix was standardized with
+        self._changed = set()  # Rows written since _matrix was last updated
+        self._dirty = False  # Every row of _matrix must be standardized again
+        self._generation = itertools.count()  # Numbers the matrix files
+
+    def similar(self, conn, name, k=10, team=None, country=None):
+        """
+        The k players nearest to name, closest first, as dicts with Player, Team, Country and Distance,
+        optionally only those of one team and/or country. None if the player does not exist.
+        """
+        with self._lock:
+            self._sync(conn)
+            row = self._slots.get(name)
+            if row is None:
+                return None
+            self._standardize()
+            mask = self._mask(team, country)
+            mask[row] = False
+            return self._nearest(self._matrix[row:row + 1], k, mask)[0]
+
+    def similar_many(self, conn, names, k=10, team=None, country=None):
+        """ similar() for several players at once, in one matrix product. Unknown players get None. """
+        with self._lock:
+            self._sync(conn)
+            rows = [self._slots.get(name) for name in names]
+            known = [row for row in rows if row is not None]
+            self._standardize()
+            results = iter(self._nearest(self._matrix[known], k, self._mask(team, country), exclude=known))
+            return [next(results) if row is not None else None for row in rows]
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _mask(self, team, country):
+        mask = self._valid.copy()
+        if team is not None:
+            mask &= self._teams == self._team_codes.get(team, -2)
+        if country is not None:
+            mask &= self._countries == self._country_codes.get(country, -2)
+        return mask
+
+    def _nearest(self, queries, k, mask, exclude=()):
+        """ For each query vector, the k nearest rows allowed by mask as result dicts. """
+        if len(queries) == 0:
+            return []
+        distances = self._norms[None, :] - 2 * (queries @ self._matrix.T) + (queries * queries).sum(axis=1)[:, None]
+        distances[:, ~mask] = np.inf
+        for i, row in enumerate(exclude):
+            distances[i, row] = np.inf
+
+        k = max(0, min(k, int(mask.sum())))
+        if k == 0:
+            return [[] for _ in queries]
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        results = []
+        for i, rows in enumerate(nearest):
+            rows = rows[np.argsort(distances[i, rows], kind='stable')]
+            results.append([self._result(row, distances[i, row]) for row in rows if np.isfinite(distances[i, row])])
+        return results
+
+    def _result(self, row, distance):
+        team, country = int(self._teams[row]), int(self._countries[row])
+        return {
+            'Player': self._names[row],
+            'Team': self._team_names[team] if team >= 0 else None,
+            'Country': self._country_names[country] if country >= 0 else None,
+            'Distance': round(float(np.sqrt(max(distance, 0.0))), 4),
+        }
+
+    def _standardize(self):
+        """ Bring _matrix up to date: the changed rows only, or every row once the statistics have drifted. """
+        if not self._dirty and not self._changed:
+            return
+        mean, std = self._statistics()
+        if not self._dirty:
+            drift = np.maximum(np.abs(mean - self._mean), np.abs(std - self._std)) / self._std
+            self._dirty = bool((drift > STATS_TOLERANCE).any())
+
+        if self._dirty:
+            rows = slice(0, len(self._names))
+            self._mean, self._std = mean, std
+            self._matrix[len(self._names):] = 0.0
+        else:
+            rows = np.fromiter(self._changed, dtype=np.intp)
+        matrix = (self._raw[rows] - self._mean) / self._std
+        matrix = np.nan_to_num(matrix, nan=0.0) * self._valid[rows][:, None]
+        self._matrix[rows] = matrix
+        if self._dirty:
+            self._norms = np.einsum('ij,ij->i', self._matrix, self._matrix)
+        else:
+            self._norms[rows] = np.einsum('ij,ij->i', matrix, matrix)
+        self._changed.clear()
+        self._dirty = False
+
+    def _statistics(self):
+        """ Mean and standard deviation of each column over the players that have it. """
+        count, total, squares = self._sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.maximum(squares / count - mean * mean, 0.0))
+        mean = np.nan_to_num(mean)  # No player has the column
+        std = np.where(np.isfinite(std) & (std > 0), std, 1.0)
+        return mean, std
+
+    def _account(self, slot, sign):
+        """ Add (sign 1) or take away (sign -1) one row's values in the running sums. """
+        values = self._raw[slot].astype(np.float64)
+        present = ~np.isnan(values)
+        values = np.where(present, values, 0.0)
+        self._sums += sign * np.stack([present, values, values * values])
+
+    def _rebuild(self, conn):
+        rows = conn.execute(FEATURE_QUERY).fetchall()
+        self._slots, self._names, self._free = {}, [], []
+        self._team_codes, self._country_codes = {}, {}
+        self._team_names, self._country_names = [], []
+        self._allocate(max(MIN_CAPACITY, len(rows)))
+
+        n = len(rows)
+        self._names = [row[0] for row in rows]
+        self._slots = {name: slot for slot, name in enumerate(self._names)}
+        if n:
+            self._raw[:n] = _features(rows)
+        self._teams[:n] = [_code(self._team_codes, self._team_names, row[1]) for row in rows]
+        self._countries[:n] = [_code(self._country_codes, self._country_names, row[2]) for row in rows]
+        self._valid[:n] = True
+
+        raw = self._raw[:n].astype(np.float64)
+        present = ~np.isnan(raw)
+        raw[~present] = 0.0
+        self._sums = np.stack([present.sum(axis=0), raw.sum(axis=0), (raw * raw).sum(axis=0)]).astype(np.float64)
+        self._changed.clear()
+        self._dirty = True
+
+    def _refresh(self, conn, key):
+        """ Re-read one player: update its row, add a row, or free it if the player is gone. """
+        row = conn.execute(f"{FEATURE_QUERY} WHERE p.Player = ?", (key,)).fetchone()
+        if row is not None:
+            self._store(row)
+        else:
+            slot = self._slots.pop(key, None)
+            if slot is not None:
+                self._account(slot, -1)
+                self._valid[slot] = False
+                self._free.append(slot)
+                self._changed.add(slot)
+
+    def _store(self, row):
+        name = row[0]
+        slot = self._slots.get(name)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._names[slot] = name
+            else:
+                slot = len(self._names)
+                if slot == len(self._valid):
+                    self._allocate(2 * slot)
+                self._names.append(name)
+            self._slots[name] = slot
+        else:
+            self._account(slot, -1)
+
+        self._raw[slot] = _features([row])[0]
+        self._account(slot, 1)
+        self._changed.add(slot)
+        self._teams[slot] = _code(self._team_codes, self._team_names, row[1])
+        self._countries[slot] = _code(self._country_codes, self._country_names, row[2])
+        self._valid[slot] = True
+
+    def _allocate(self, capacity):
+        """ (Re)create the memory-mapped matrices with room for capacity players, keeping existing rows. """
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='bundesliga-similarity-')
+            atexit.register(shutil.rmtree, self.directory, True)
+        os.makedirs(self.directory, exist_ok=True)
+        shape = (capacity, len(FEATURES))
+        used = len(self._names) if self._raw is not None else 0
+
+        raw, matrix = self._raw, self._matrix
+        # New files every time, so the old mapping is never truncated while rows are copied out of it
+        suffix = f"{os.getpid()}-{next(self._generation)}"
+        self._raw = np.memmap(os.path.join(self.directory, f"raw-{suffix}.f32"), dtype=np.float32, mode='w+', shape=shape)
+        self._matrix = np.memmap(os.path.join(self.directory, f"matrix-{suffix}.f32"), dtype=np.float32, mode='w+', shape=shape)
+        self._raw[:] = np.nan
+        valid, teams, countries = self._valid, self._teams, self._countries
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._teams = np.full(capacity, -1, dtype=np.int32)
+        self._countries = np.full(capacity, -1, dtype=np.int32)
+
+        if used:
+            self._raw[:used] = raw[:used]
+            self._valid[:used], self._teams[:used], self._countries[:used] = valid[:used], teams[:used], countries[:used]
+        for old in (raw, matrix):
+            if old is not None:
+                _remove(old.filename)
+        self._dirty = True
+
+
+def _features(rows):
+    """ Raw feature vectors of FEATURE_QUERY rows as float32, NaN for missing, non-numeric or non-finite cells. """
+    values = np.array([[aggregates.number(value) for value in row[3:]] for row in rows], dtype=np.float64)  # None becomes NaN
+    with np.errstate(over='ignore'):
+        values = values.astype(np.float32)
+    values[~np.isfinite(values)] = np.nan  # Too large for float32
+    return values
+
+
+def _code(codes, names, value):
+    """ Integer code of a team/country, assigning the next one to a new value. """
+    if value is None:
+        return -1
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = len(names)
+        names.append(value)
+    return code
+
+
+def _remove(filename):
+    # The old mapping stays readable until it is garbage collected
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def get_index(app, season=None):
+    """
+    The app's index, or an archived season's (see seasons.py), created on first use
+    (it is built from the database on its first query).
+    """
+    registry = app.extensions['seasons']
+    season = season or registry.current
+    directory = app.config.get('SIMILARITY_DIR')
+    if directory and season != registry.current:
+        directory = os.path.join(directory, season)  # Each index numbers its own matrix files
+    return registry.extension(app, season, 'similarity', lambda: SimilarityIndex(directory))
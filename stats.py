@@ -0,0 +1,137 @@
+"""
+Summary statistics for the stats pages.
+
+A table's numeric columns are loaded once into a float matrix with a null
+mask, and every summary statistic (mean, min, max, median, standard deviation
+and percentiles) is computed for all columns together with NumPy's
+axis-wise reductions. Per-team aggregates come from one grouped pass over the
+same arrays.
+
+The stats pages answer from the running aggregates in aggregates.py, which
+are checked against these full scans.
+
+This module pulls in NumPy, so it is imported only where it is needed
+rather than at startup.
+"""
+
+import warnings
+
+import numpy as np
+
+# Stat names used in the stats forms, in display order
+STATS = ['mean', 'min', 'max', 'median', 'std_dev', 'p25', 'p75', 'p90']
+
+PERCENTILES = {'p25': 25, 'median': 50, 'p75': 75, 'p90': 90}
+
+
+def _to_float(values, null_as_zero):
+    """ Column of raw SQLite values as float64, with NaN for nulls, non-numeric text and infinities. """
+    try:
+        # None becomes NaN and numeric text is parsed, all in C
+        column = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                column[i] = np.nan
+    # Text such as 'inf' parses to an infinity, which counts as missing like 'nan' does
+    column[np.isinf(column)] = np.nan
+    if null_as_zero:
+        column[np.isnan(column)] = 0.0
+    return column
+
+
+class TableSummary:
+    """ Numeric columns of one table version with all of their summary statistics precomputed. """
+
+    def __init__(self, columns, data, teams=None):
+        self.columns = columns
+        self.data = data  # (rows, columns) float64 matrix, NaN where a value is missing
+        self.valid = ~np.isnan(data)  # null mask
+        self.teams = teams  # Team of each row, for group-bys
+        self.count = data.shape[0]
+        self.stats = self._summarize()
+
+    def _summarize(self):
+        data = self.data
+        with warnings.catch_warnings():
+            # All-null columns legitimately summarize to NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            # One sort serves the median and every percentile
+            quantiles = np.nanpercentile(data, list(PERCENTILES.values()), axis=0)
+            stats = {
+                'mean': np.nanmean(data, axis=0),
+                'min': np.nanmin(data, axis=0),
+                'max': np.nanmax(data, axis=0),
+                'std_dev': np.nanstd(data, axis=0),
+            }
+        for name, row in zip(PERCENTILES, quantiles):
+            stats[name] = row
+
+        # Whole-number columns report their min/max as integers, as they are stored
+        integral = np.all(np.where(self.valid, np.mod(data, 1) == 0, True), axis=0)
+        result = {}
+        for name in STATS:
+            values = {}
+            for j, column in enumerate(self.columns):
+                value = stats[name][j]
+                values[column] = np.int64(value) if name in ('min', 'max') and integral[j] and not np.isnan(value) else value
+            result[name] = values
+        return result
+
+    def stat(self, name):
+        """ {column: value} of one statistic, or None for unknown stats. """
+        return self.stats.get(name)
+
+    def column(self, name):
+        """ Values of one column as a float array. """
+        return self.data[:, self.columns.index(name)]
+
+    def group_by_team(self):
+        """ {team: {column: {'count', 'sum', 'mean', 'min', 'max'}}} over non-null values, or None without a team column. """
+        if self.teams is None:
+            return None
+        names, groups = np.unique(self.teams, return_inverse=True)
+        valid = self.valid
+        filled = np.where(valid, self.data, 0.0)
+
+        result = {str(team): {} for team in names}
+        for j, column in enumerate(self.columns):
+            counts = np.bincount(groups, weights=valid[:, j], minlength=len(names))
+            sums = np.bincount(groups, weights=filled[:, j], minlength=len(names))
+            lows = np.full(len(names), np.inf)
+            highs = np.full(len(names), -np.inf)
+            np.minimum.at(lows, groups[valid[:, j]], self.data[valid[:, j], j])
+            np.maximum.at(highs, groups[valid[:, j]], self.data[valid[:, j], j])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / counts
+            for i, team in enumerate(names):
+                empty = counts[i] == 0
+                result[str(team)][column] = {
+                    'count': int(counts[i]),
+                    'sum': float(sums[i]),
+                    'mean': None if empty else float(means[i]),
+                    'min': None if empty else float(lows[i]),
+                    'max': None if empty else float(highs[i]),
+                }
+        return result
+
+
+def load_table(conn, table, columns, team_column=None, null_as_zero=False):
+    """
+    Read the given numeric columns of a table into a TableSummary (None if the table is empty).
+    With null_as_zero, missing and non-numeric values count as 0 instead of being left out.
+    """
+    selected = ([team_column] if team_column else []) + list(columns)
+    rows = conn.execute(f"SELECT {', '.join(selected)} FROM {table}").fetchall()
+    if not rows:
+        return None
+
+    offset = 1 if team_column else 0
+    cells = list(zip(*rows))
+    data = np.column_stack([_to_float(cells[offset + j], null_as_zero) for j in range(len(columns))])
+    teams = np.array(cells[0], dtype=object).astype(str) if team_column else None
+    return TableSummary(list(columns), data, teams)
+
@@ -0,0 +1,150 @@
+"""
+Batched summary statistics over the stats tables, for /api/stats.
+
+A batch is a list of requests, each naming a table, some of its numeric
+columns (all of them by default), some statistics (all by default) and
+optionally a group-by. The batch is answered table by table: ungrouped
+statistics come from the table's running aggregates (see aggregates.py),
+brought up to date once, and grouped ones from one NumPy pass over the
+union of the columns the batch groups for that table (see
+stats.TableSummary.group_by_team). However many requests name a table, it is
+synced or read at most once.
+
+As JSON (POST /api/stats):
+    {"requests": [
+        {"table": "player_top_scorers", "columns": ["Goals", "Minutes"], "stats": ["mean", "max"]},
+        {"table": "team_ratings", "stats": ["median"]},
+        {"table": "player_expected_goals", "columns": ["Goals"], "stats": ["sum", "mean"], "group_by": "team"}]}
+
+Or as query parameters (GET), one r=table:columns:stats[:group_by] per request,
+lists comma-separated and empty for all:
+    /api/stats?r=player_top_scorers:Goals,Minutes:mean,max&r=team_ratings::median
+
+The response lists one result per request, in order, with the values of
+each statistic in the order of its columns:
+    {"results": [{"table": "player_top_scorers", "columns": ["Goals", "Minutes"],
+                  "stats": {"mean": [3.1, 1540.2], "max": [36, 3060]}}, ...]}
+and grouped results carry "group_by" and "groups": {team: {stat: [values]}}.
+Empty columns give null.
+"""
+
+import math
+
+import aggregates
+
+# Statistics of a whole column, and of each group's part of it
+STATS = ['count', 'mean', 'min', 'max', 'median', 'std_dev', 'p25', 'p75', 'p90']
+GROUP_STATS = ['count', 'sum', 'mean', 'min', 'max']
+GROUP_BY = {'team': 'Team'}  # group_by -> column
+
+MAX_REQUESTS = 64
+
+
+class StatsError(ValueError):
+    """ Raised for batches that cannot be answered: unknown table, column, statistic or group-by. """
+
+
+def _names(value, field):
+    """ A list of names from a JSON list or a comma-separated string; None when absent or empty. """
+    if value is None or value == '' or value == []:
+        return None
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise StatsError(f"{field} must be a list of names")
+    return value
+
+
+def parse(spec):
+    """ Validated requests of a batch spec, as (table, columns, stats, group_by) tuples. """
+    if not isinstance(spec, dict) or not isinstance(spec.get('requests'), list) or not spec['requests']:
+        raise StatsError("A batch needs a non-empty list of requests")
+    if len(spec['requests']) > MAX_REQUESTS:
+        raise StatsError(f"At most {MAX_REQUESTS} requests per batch")
+
+    requests = []
+    for number, item in enumerate(spec['requests'], start=1):
+        if not isinstance(item, dict):
+            raise StatsError(f"request {number}: must be an object")
+        table = item.get('table')
+        if table not in aggregates.STAT_TABLES:
+            raise StatsError(f"request {number}: unknown table {table!r}")
+        numeric = aggregates.STAT_TABLES[table][1]
+
+        group_by = item.get('group_by') or None
+        if group_by is not None and group_by not in GROUP_BY:
+            raise StatsError(f"request {number}: unknown group_by {group_by!r}, use one of {', '.join(GROUP_BY)}")
+        allowed = GROUP_STATS if group_by else STATS
+
+        columns = _names(item.get('columns'), 'columns') or numeric
+        for column in columns:
+            if column not in numeric:
+                raise StatsError(f"request {number}: {table} has no numeric column {column!r}")
+        stats = _names(item.get('stats'), 'stats') or allowed
+        for name in stats:
+            if name not in allowed:
+                raise StatsError(f"request {number}: unknown statistic {name!r}"
+                                 f"{' with group_by' if group_by else ''}, use one of {', '.join(allowed)}")
+        requests.append((table, tuple(columns), tuple(stats), group_by))
+    return requests
+
+
+def spec_from_args(args):
+    """ A batch spec from repeated r=table:columns:stats[:group_by] query parameters. """
+    requests = []
+    for value in args.getlist('r'):
+        parts = value.split(':')
+        if len(parts) > 4:
+            raise StatsError(f"Cannot read request {value!r}, use table:columns:stats[:group_by]")
+        parts += [''] * (4 - len(parts))
+        requests.append({'table': parts[0], 'columns': parts[1], 'stats': parts[2], 'group_by': parts[3]})
+    return {'requests': requests}
+
+
+def run(conn, stores, requests):
+    """
+    Answer parsed requests from stores (table -> aggregates.TableAggregates, see aggregates.create_store).
+    Returns {'results': [...]} with raw values, NaN for empty columns (see json_safe).
+    """
+    ungrouped, grouped = {}, {}
+    for table, columns, stats, group_by in requests:
+        wanted = grouped.setdefault((table, group_by), [[], set()]) if group_by else ungrouped.setdefault(table, [[], set()])
+        wanted[0].extend(column for column in columns if column not in wanted[0])
+        wanted[1].update(stats)
+
+    values = {}
+    for table, (columns, stats) in ungrouped.items():
+        values[table] = stores[table].stats(conn, sorted(stats), columns)
+
+    groups = {}
+    if grouped:
+        import stats as summaries  # NumPy, only needed for group-bys
+
+        for (table, group_by), (columns, _) in grouped.items():
+            null_as_zero = aggregates.STAT_TABLES[table][2]
+            summary = summaries.load_table(conn, table, columns, team_column=GROUP_BY[group_by], null_as_zero=null_as_zero)
+            groups[table, group_by] = summary.group_by_team() if summary is not None else {}
+
+    results = []
+    for table, columns, stats, group_by in requests:
+        result = {'table': table, 'columns': list(columns)}
+        if group_by:
+            result['group_by'] = group_by
+            result['groups'] = {
+                group: {name: [by_column[column][name] for column in columns] for name in stats}
+                for group, by_column in groups[table, group_by].items()}
+        else:
+            result['stats'] = {name: [values[table][name][column] for column in columns] for name in stats}
+        results.append(result)
+    return {'results': results}
+
+
+def json_safe(value):
+    """ value with NaN and infinite floats as None, which JSON can carry. """
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [json_safe(item) for item in value]
+    return value
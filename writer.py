@@ -0,0 +1,167 @@
+"""
+Single writer thread for the app's mutations.
+
+Request handlers submit jobs (a function taking a connection, see
+mutations.py) and get a Future back. One thread owns a dedicated connection
+and applies queued jobs in group commits: it takes every job waiting (up to
+max_batch), runs each inside its own SAVEPOINT in one BEGIN IMMEDIATE
+transaction, and commits once. A job that fails is rolled back to its
+savepoint without affecting the others. Futures are resolved only after the
+commit, so a caller that has its result can read its own write.
+
+Writers in this process no longer queue on SQLite's write lock with their own
+connections, and a burst of N writes costs one fsync instead of N. Reads keep
+using the pooled connections and proceed concurrently under WAL.
+
+If the writer's connection cannot be opened, the jobs waiting fail with the
+error instead of waiting out their timeout.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+metrics.REGISTRY.histogram('writer_commit_duration_seconds', 'Time from BEGIN to COMMIT of one group commit.',
+                           metrics.SQL_BUCKETS + (2.5, 5))
+metrics.REGISTRY.histogram('writer_batch_jobs', 'Jobs applied per group commit.', metrics.COUNT_BUCKETS)
+metrics.REGISTRY.histogram('writer_wait_seconds', 'Time a job waited in the queue before its group commit started.',
+                           metrics.SQL_BUCKETS + (2.5, 5))
+metrics.REGISTRY.counter('writer_jobs_total', 'Jobs run by the writer thread, by outcome.')
+
+_STOP = object()
+
+
+class WriteQueue:
+    """ Queue of mutation jobs applied by one thread in group commits. """
+
+    def __init__(self, connect, max_batch=64, commit_delay=0.002, timeout=30):
+        self.connect = connect  # Opens the writer's own connection
+        self.max_batch = max_batch
+        self.commit_delay = commit_delay  # Seconds to wait for more jobs after the first, to grow the batch
+        self.timeout = timeout  # Seconds callers wait for a result (see submit_and_wait)
+
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def depth(self):
+        """ Jobs waiting to be applied. """
+        return self._jobs.qsize()
+
+    def submit(self, func, *args):
+        """ Queue func(conn, *args) and return a Future of its result. """
+        future = Future()
+        self._jobs.put((func, args, future, time.perf_counter()))
+        self._ensure_thread()
+        return future
+
+    def submit_and_wait(self, func, *args):
+        """ Queue a job and wait for its result, re-raising its exception. """
+        return self.submit(func, *args).result(timeout=self.timeout)
+
+    def _ensure_thread(self):
+        # Started on first use so importing the app does not start threads
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self._jobs.get()]
+        deadline = time.perf_counter() + self.commit_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._jobs.get(timeout=remaining) if remaining > 0 else self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        try:
+            conn = self.connect()
+        except Exception as e:
+            self._fail_queued(e)
+            return
+        try:
+            while True:
+                batch = self._next_batch()
+                stop = any(job is _STOP for job in batch)
+                batch = [job for job in batch if job is not _STOP]
+                if batch:
+                    self._apply(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _fail_queued(self, error):
+        # The thread could not open its connection: fail the jobs waiting rather than leave their callers
+        # blocked until the timeout. The next submit starts a new thread, which tries to connect again.
+        with self._lock:
+            self._thread = None
+            while True:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not _STOP:
+                    metrics.REGISTRY.inc('writer_jobs_total', (('outcome', 'error'),))
+                    job[2].set_exception(error)
+
+    def _apply(self, conn, batch):
+        start = time.perf_counter()
+        for _, _, _, queued in batch:
+            metrics.REGISTRY.observe('writer_wait_seconds', start - queued)
+
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for func, args, _, _ in batch:
+                conn.execute('SAVEPOINT job')
+                try:
+                    outcomes.append((True, func(conn, *args)))
+                    conn.execute('RELEASE job')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+                    outcomes.append((False, e))
+            conn.commit()
+        except Exception as e:
+            # The transaction as a whole failed (e.g. the database stayed locked): nothing was written
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(False, e)] * len(batch)
+
+        metrics.REGISTRY.observe('writer_commit_duration_seconds', time.perf_counter() - start)
+        metrics.REGISTRY.observe('writer_batch_jobs', len(batch))
+        for (_, _, future, _), (ok, value) in zip(batch, outcomes):
+            metrics.REGISTRY.inc('writer_jobs_total', (('outcome', 'ok' if ok else 'error'),))
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def shutdown(self, timeout=None):
+        """ Apply the jobs already queued, then stop the thread. """
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._jobs.put(_STOP)
+            thread.join(timeout)
+
+
+def init_app(app):
+    """ Create the app's write queue, writing through its own connection from the pool's settings. """
+    write_queue = WriteQueue(
+        app.extensions['db_pool'].connect,
+        max_batch=app.config.get('WRITER_MAX_BATCH', 64),
+        commit_delay=app.config.get('WRITER_COMMIT_DELAY_MS', 2) / 1000,
+        timeout=app.config.get('WRITER_TIMEOUT', 30),
+    )
+    app.extensions['writer'] = write_queue
+    metrics.REGISTRY.gauge('writer_queue_depth', 'Mutation jobs waiting for the writer thread.', write_queue.depth)